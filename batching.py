@@ -0,0 +1,243 @@
+import argparse
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from telemetry import collect_stages
+
+# Largest number of descriptions run through a model in one forward pass
+DEFAULT_MAX_BATCH_SIZE = int(os.environ.get("CVSS_MAX_BATCH_SIZE", "32"))
+# How long a request may wait for others to join its batch
+DEFAULT_MAX_WAIT_MS = float(os.environ.get("CVSS_MAX_BATCH_WAIT_MS", "5"))
+# Threads running batches through the models (torch releases the GIL during inference)
+DEFAULT_INFERENCE_WORKERS = int(os.environ.get("CVSS_INFERENCE_WORKERS", "1"))
+# Padded tokens (batch size x longest sequence) allowed in one forward pass, 0 = fixed-size batches
+DEFAULT_MAX_BATCH_TOKENS = int(os.environ.get("CVSS_MAX_BATCH_TOKENS", "8192"))
+
+
+def usable_cores():
+    """Cores this process may run on: its CPU affinity (containers, taskset), not every host CPU"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def length_batches(lengths, max_tokens=DEFAULT_MAX_BATCH_TOKENS, max_batch_size=None):
+    """Split sequence indices into batches of similar length under a token budget.
+
+    Indices are sorted by length (longest first) and a batch grows while its
+    padded size, rows x longest row, stays within max_tokens; a sequence
+    longer than the budget runs alone. With max_tokens <= 0 the inputs are
+    cut into max_batch_size chunks in input order, padded to their longest
+    row as before. Callers scatter results back by index, so the output
+    order is always the input order.
+    """
+    n = len(lengths)
+    if max_tokens <= 0:
+        size = max_batch_size or DEFAULT_MAX_BATCH_SIZE
+        return [list(range(start, min(start + size, n))) for start in range(0, n, size)]
+
+    order = sorted(range(n), key=lambda i: lengths[i], reverse=True)
+    batches = []
+    batch = []
+    longest = 0
+    for i in order:
+        if batch and ((len(batch) + 1) * longest > max_tokens or len(batch) == max_batch_size):
+            batches.append(batch)
+            batch = []
+        if not batch:
+            # Sorted longest first, so the first row of a batch sets its padded length
+            longest = lengths[i]
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def padded_tokens(lengths, batches):
+    """(real, padded) token counts of running lengths in the given batches"""
+    real = sum(lengths)
+    padded = sum(len(batch) * max(lengths[i] for i in batch) for batch in batches)
+    return real, padded
+
+
+class MicroBatcher:
+    """Merges concurrent requests for the same model into padded batches.
+
+    Requests are queued per key (e.g. (models_dir, metric)). A background
+    worker dispatches a key's queue once it holds max_batch_size items or
+    its oldest item has waited max_wait_ms, calling
+    batch_fn(key, items) -> list of results in the same order. Batches run
+    on a fixed pool of `workers` threads, so request threads only wait.
+
+    Every future gets a `timings` dict before its result is set: queue wait,
+    batch size and the telemetry.stage() times of its batch. on_batch, if
+    given, is called as on_batch(key, queue_waits, stages) after each batch.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 workers=DEFAULT_INFERENCE_WORKERS, on_batch=None):
+        self.batch_fn = batch_fn
+        self.on_batch = on_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait_ms / 1000.0
+        self.workers = max(1, int(workers))
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._threads = []
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self):
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"micro-batcher-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, item):
+        """Queue one item, returns a Future with its result"""
+        return self.submit_many(key, [item])[0]
+
+    def submit_many(self, key, items):
+        """Queue several items for the same key, returns one Future per item"""
+        futures = [Future() for _ in items]
+        now = time.monotonic()
+        with self._cond:
+            self._ensure_worker()
+            queue = self._pending.setdefault(key, deque())
+            for item, future in zip(items, futures):
+                queue.append((now, item, future))
+            self._cond.notify()
+        return futures
+
+    def _take_batch(self, key):
+        queue = self._pending[key]
+        batch = [queue.popleft() for _ in range(min(len(queue), self.max_batch_size))]
+        if not queue:
+            del self._pending[key]
+        return key, batch
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+
+                # A full batch goes out right away
+                for key, queue in self._pending.items():
+                    if len(queue) >= self.max_batch_size:
+                        return self._take_batch(key)
+
+                # Otherwise serve the key whose oldest request has waited longest
+                key = min(self._pending, key=lambda k: self._pending[k][0][0])
+                remaining = self._pending[key][0][0] + self.max_wait - time.monotonic()
+                if remaining <= 0:
+                    return self._take_batch(key)
+                self._cond.wait(timeout=remaining)
+
+    def _worker(self):
+        while True:
+            key, batch = self._next_batch()
+            started = time.monotonic()
+            items = [item for _, item, _ in batch]
+            waits = [started - queued_at for queued_at, _, _ in batch]
+            try:
+                with collect_stages() as stages:
+                    results = self.batch_fn(key, items)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            # Nothing below may end the worker thread: every future of the batch
+            # is resolved, with an exception if post-processing fails
+            try:
+                if len(results) != len(batch):
+                    raise RuntimeError(f"batch_fn returned {len(results)} results for {len(batch)} items")
+                with self._cond:
+                    self.batches += 1
+                    self.items += len(batch)
+                if self.on_batch is not None:
+                    try:
+                        self.on_batch(key, waits, stages)
+                    except Exception as e:
+                        # Telemetry must not fail the predictions
+                        print(f"[WARN] on_batch hook failed: {type(e).__name__}: {e}")
+                for (_, _, future), result, wait in zip(batch, results, waits):
+                    future.timings = {"queue_wait_ms": round(wait * 1000, 2), "batch_size": len(batch),
+                                      **{f"{name}_ms": round(ms, 2) for name, ms in stages.items()}}
+                    future.set_result(result)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def stats(self):
+        with self._cond:
+            queued = sum(len(queue) for queue in self._pending.values())
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+            "queued": queued,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "workers": self.workers,
+        }
+
+
+def benchmark(loaded_model, descriptions, batch_size, max_tokens, tokens_only=False):
+    """Padded-token waste and throughput of fixed-size vs length-bucketed batches"""
+    features = loaded_model.encode(descriptions)
+    lengths = [len(feature["input_ids"]) for feature in features]
+    rows = []
+    reference = None
+    for name, budget in (("fixed", 0), ("bucketed", max_tokens)):
+        batches = length_batches(lengths, budget, batch_size)
+        real, padded = padded_tokens(lengths, batches)
+        seconds = None
+        if not tokens_only:
+            start = time.perf_counter()
+            ids = loaded_model.predict_features(features, budget, batch_size)
+            seconds = time.perf_counter() - start
+            if reference is None:
+                reference = ids
+            assert (ids == reference).all(), "bucketed batches changed predictions"
+        rows.append((name, len(batches), real, padded, seconds))
+
+    print("\n" + "=" * 78)
+    print(f"BATCH SCHEDULING BENCHMARK ({len(descriptions)} descriptions, batch size {batch_size}, "
+          f"budget {max_tokens} tokens)")
+    print("=" * 78)
+    print(f"{'batches':<10}  {'count':>6}  {'real tokens':>12}  {'padded tokens':>13}  {'waste':>6}  "
+          f"{'seconds':>8}  {'rows/sec':>8}")
+    for name, count, real, padded, seconds in rows:
+        timing = f"{seconds:>8.2f}  {len(descriptions) / seconds:>8.1f}" if seconds else f"{'-':>8}  {'-':>8}"
+        print(f"{name:<10}  {count:>6}  {real:>12,}  {padded:>13,}  {1 - real / padded:>6.1%}  {timing}")
+    print("=" * 78)
+
+
+def main():
+    from cvss_dataset import load_dataset
+    from model_registry import registry
+
+    parser = argparse.ArgumentParser(description="Compare fixed-size and length-bucketed inference batches")
+    parser.add_argument("--csv", default="nvd_cvss4_data2.csv")
+    parser.add_argument("--models-dir", default="./cvss_models")
+    parser.add_argument("--metric", default="AV", help="model to run (multihead for the shared encoder)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE, help="most rows per batch")
+    parser.add_argument("--max-batch-tokens", type=int, default=DEFAULT_MAX_BATCH_TOKENS)
+    parser.add_argument("--tokens-only", action="store_true", help="count padded tokens without running the model")
+    args = parser.parse_args()
+
+    descriptions = load_dataset(args.csv, columns=["description"])["description"].dropna().tolist()
+    loaded_model = registry.get(args.models_dir, args.metric)
+    benchmark(loaded_model, descriptions, args.batch_size, args.max_batch_tokens, args.tokens_only)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from cvss_dataset import load_dataset
+
+DEFAULT_CSV = "nvd_cvss4_data2.csv"
+DEFAULT_BASELINE = "benchmark_baseline.json"
+# Relative slowdown (or throughput drop) that fails the run
+DEFAULT_THRESHOLD = 0.10
+PERCENTILES = (50, 95, 99)
+
+# Size of the randomly initialized models used with --tiny
+TINY_CONFIG = {
+    "hidden_size": 64, "num_hidden_layers": 2, "num_attention_heads": 2,
+    "intermediate_size": 128, "max_position_embeddings": 512,
+}
+TINY_VOCAB_SIZE = 5000
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+
+# Runs in a fresh interpreter to time import, first prediction and peak memory
+COLD_START_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.predict_all_metrics(sys.argv[1], sys.argv[2])
+done = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "first_prediction_s": done - imported,
+                  "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def sample_descriptions(csv_path, n, seed):
+    """n descriptions drawn from the dataset with a fixed seed"""
+    descriptions = load_dataset(csv_path, columns=["description"])["description"].dropna().tolist()
+    rng = random.Random(seed)
+    return rng.sample(descriptions, min(n, len(descriptions)))
+
+
+def build_vocab(descriptions, size=TINY_VOCAB_SIZE):
+    """Most frequent lowercase words of the corpus as a WordPiece vocabulary"""
+    counts = Counter(token for text in descriptions for token in re.findall(r"\w+|[^\w\s]", text.lower()))
+    return SPECIAL_TOKENS + [word for word, _ in counts.most_common(size - len(SPECIAL_TOKENS))]
+
+
+def build_tiny_models(models_dir, descriptions, seed=0):
+    """Write randomly initialized per-metric and multi-head models with the real label sets.
+
+    The models have the layout train_models.py produces, so the registry,
+    batcher and API load them unchanged, but need no download or training.
+    """
+    import torch
+    from transformers import AutoModel, AutoModelForSequenceClassification, BertConfig, BertTokenizerFast
+
+    from multihead import MULTIHEAD_NAME, MultiHeadCVSSModel
+    from train_models import METRIC_LABELS
+
+    torch.manual_seed(seed)
+    vocab_path = os.path.join(models_dir, "vocab.txt")
+    os.makedirs(models_dir, exist_ok=True)
+    with open(vocab_path, "w") as f:
+        f.write("\n".join(build_vocab(descriptions)) + "\n")
+    # Without model_max_length the tokenizer has no limit and long descriptions overflow the position embeddings
+    tokenizer = BertTokenizerFast(vocab_file=vocab_path, do_lower_case=True,
+                                  model_max_length=TINY_CONFIG["max_position_embeddings"])
+
+    for metric, labels in METRIC_LABELS.items():
+        config = BertConfig(vocab_size=tokenizer.vocab_size, num_labels=len(labels), **TINY_CONFIG)
+        save_path = os.path.join(models_dir, metric)
+        AutoModelForSequenceClassification.from_config(config).save_pretrained(save_path)
+        tokenizer.save_pretrained(save_path)
+        with open(os.path.join(save_path, "label_map.txt"), "w") as f:
+            for idx, label in enumerate(labels):
+                f.write(f"{label}:{idx}\n")
+
+    config = BertConfig(vocab_size=tokenizer.vocab_size, **TINY_CONFIG)
+    save_path = os.path.join(models_dir, MULTIHEAD_NAME)
+    MultiHeadCVSSModel(AutoModel.from_config(config), METRIC_LABELS).save_pretrained(save_path)
+    tokenizer.save_pretrained(save_path)
+
+
+def latency_stats(seconds):
+    """p50/p95/p99 and mean of a list of durations, in milliseconds"""
+    ms = np.asarray(seconds) * 1000
+    stats = {f"p{p}": float(np.percentile(ms, p)) for p in PERCENTILES}
+    stats["mean"] = float(ms.mean())
+    return stats
+
+
+def time_calls(fn, items, warmup):
+    for item in items[:warmup]:
+        fn(item)
+    durations = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def bench_latency(app_module, descriptions, models_dir, warmup):
+    """Single-description latency of predict_metric, predict_all_metrics and the endpoints"""
+    client = app_module.app.test_client()
+
+    def post(path, body):
+        response = client.post(path, json={**body, "models_dir": models_dir})
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} answered {response.status_code}: {response.get_json()}")
+
+    calls = {
+        "predict_metric": lambda d: app_module.predict_metric(d, "AV", models_dir),
+        "predict_all_metrics": lambda d: app_module.predict_all_metrics(d, models_dir),
+        "api_predict": lambda d: post("/api/predict", {"description": d}),
+        "api_predict_metric": lambda d: post("/api/predict/metric", {"description": d, "metric": "AV"}),
+    }
+    results = {}
+    for name, fn in calls.items():
+        results[name] = latency_stats(time_calls(fn, descriptions, warmup))
+        print(f"  {name:<22} " + "  ".join(f"{k} {v:8.2f} ms" for k, v in results[name].items()))
+    return results
+
+
+def bench_batch_sizes(app_module, descriptions, models_dir, batch_sizes):
+    """Rows/sec of predict_all_metrics_batch and /api/predict/batch per batch size"""
+    client = app_module.app.test_client()
+    results = {}
+    for size in batch_sizes:
+        chunks = [descriptions[i:i + size] for i in range(0, len(descriptions), size)]
+        start = time.perf_counter()
+        for chunk in chunks:
+            app_module.predict_all_metrics_batch(chunk, models_dir)
+        direct = len(descriptions) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for chunk in chunks:
+            client.post("/api/predict/batch", json={"descriptions": chunk, "models_dir": models_dir})
+        api = len(descriptions) / (time.perf_counter() - start)
+        results[size] = {"predict_all_metrics_batch": direct, "api_predict_batch": api}
+        print(f"  batch {size:<4}  direct {direct:8.1f} rows/s   api {api:8.1f} rows/s")
+    return results
+
+
+def bench_concurrency(app_module, descriptions, models_dir, levels):
+    """Rows/sec of concurrent predict_all_metrics callers, merged by the micro-batcher"""
+    results = {}
+    for level in levels:
+        with ThreadPoolExecutor(level) as pool:
+            start = time.perf_counter()
+            list(pool.map(lambda d: app_module.predict_all_metrics(d, models_dir), descriptions))
+            rate = len(descriptions) / (time.perf_counter() - start)
+        results[level] = rate
+        print(f"  concurrency {level:<4}  {rate:8.1f} rows/s")
+    return results
+
+
+def bench_cold_start(models_dir, description, env):
+    """Wall time from interpreter start to the first prediction, in a fresh process"""
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", COLD_START_SCRIPT, description, models_dir],
+        env=env, capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["total_s"] = time.perf_counter() - start
+    print(f"  cold start {result['total_s']:.2f}s (import {result['import_s']:.2f}s, "
+          f"first prediction {result['first_prediction_s']:.2f}s, peak RSS {result['peak_rss_mb']:.0f} MB)")
+    return result
+
+
+def flatten(results):
+    """{name: (value, better)} of every measurement, the form baselines are compared in"""
+    flat = {}
+    for call, stats in results["latency_ms"].items():
+        for stat in ("p50", "p95", "p99"):
+            flat[f"latency_ms.{call}.{stat}"] = (stats[stat], "lower")
+    for size, rates in results["batch_rows_per_s"].items():
+        for call, rate in rates.items():
+            flat[f"batch_rows_per_s.{call}.{size}"] = (rate, "higher")
+    for level, rate in results["concurrency_rows_per_s"].items():
+        flat[f"concurrency_rows_per_s.{level}"] = (rate, "higher")
+    if "cold_start" in results:
+        flat["cold_start_s"] = (results["cold_start"]["total_s"], "lower")
+        flat["cold_start_peak_rss_mb"] = (results["cold_start"]["peak_rss_mb"], "lower")
+    flat["peak_rss_mb"] = (results["peak_rss_mb"], "lower")
+    return flat
+
+
+def compare(results, baseline, threshold):
+    """Print current vs baseline and return the names that regressed beyond threshold"""
+    if baseline["config"] != results["config"]:
+        print("[WARN] Baseline was recorded with a different configuration:")
+        print(f"       baseline {baseline['config']}\n       current  {results['config']}")
+
+    current = flatten(results)
+    previous = flatten(baseline)
+    regressions = []
+    print("\n" + "=" * 90)
+    print(f"COMPARISON WITH BASELINE (threshold {threshold:.0%})")
+    print("=" * 90)
+    print(f"{'measurement':<52} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, (value, better) in current.items():
+        if name not in previous or not previous[name][0]:
+            continue
+        old = previous[name][0]
+        change = (value - old) / old
+        worse = change > threshold if better == "lower" else -change > threshold
+        if worse:
+            regressions.append(name)
+        print(f"{name:<52} {old:>10.2f} {value:>10.2f} {change:>+8.1%}{'  REGRESSION' if worse else ''}")
+    print("=" * 90)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CVSS inference latency, throughput and memory")
+    parser.add_argument("--csv", default=DEFAULT_CSV, help="descriptions are sampled from this dataset")
+    parser.add_argument("--models-dir", default="./cvss_models")
+    parser.add_argument("--tiny", action="store_true",
+                        help="use tiny randomly initialized models in a temporary directory (no download)")
+    parser.add_argument("--samples", type=int, default=64, help="descriptions per measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=5, help="untimed calls before each latency measurement")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument("--skip-cold-start", action="store_true")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="fail when a measurement is this much worse than the baseline (0.10 = 10%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    args = parser.parse_args()
+
+    # Repeated descriptions must reach the models, not the prediction cache
+    os.environ["CVSS_CACHE_SIZE"] = "0"
+    os.environ["CVSS_CACHE_DB"] = ""
+    # ... and the classifiers, not the retrieval fast path
+    os.environ["CVSS_RETRIEVAL_THRESHOLD"] = "0"
+    # ... nor the linear tier of the cascade
+    os.environ["CVSS_CASCADE"] = "0"
+
+    import torch
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    descriptions = sample_descriptions(args.csv, args.samples, args.seed)
+
+    with tempfile.TemporaryDirectory(prefix="cvss_tiny_models_") as tiny_dir:
+        models_dir = args.models_dir
+        if args.tiny:
+            models_dir = tiny_dir
+            print(f"[INFO] Building tiny random models in {models_dir}")
+            build_tiny_models(models_dir, descriptions, args.seed)
+
+        import main as app_module
+
+        print(f"\nLatency ({len(descriptions)} descriptions, {args.warmup} warm-up calls)")
+        results = {
+            "config": {
+                "csv": args.csv, "samples": len(descriptions), "seed": args.seed, "tiny": args.tiny,
+                "models_dir": None if args.tiny else args.models_dir, "backend": app_module.registry.backend,
+                "multihead": app_module.USE_MULTIHEAD, "threads": torch.get_num_threads(),
+            },
+            "environment": {
+                "python": platform.python_version(), "torch": torch.__version__,
+                "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            },
+            "latency_ms": bench_latency(app_module, descriptions, models_dir, args.warmup),
+        }
+        print("\nThroughput by batch size")
+        results["batch_rows_per_s"] = {
+            str(k): v for k, v in bench_batch_sizes(app_module, descriptions, models_dir, args.batch_sizes).items()
+        }
+        print("\nThroughput by concurrency")
+        results["concurrency_rows_per_s"] = {
+            str(k): v for k, v in bench_concurrency(app_module, descriptions, models_dir, args.concurrency).items()
+        }
+        if not args.skip_cold_start:
+            print("\nCold start")
+            env = {**os.environ, "CVSS_MODELS_DIR": models_dir}
+            results["cold_start"] = bench_cold_start(models_dir, descriptions[0], env)
+        # ru_maxrss is in KB on Linux
+        results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"\nPeak RSS of this process: {results['peak_rss_mb']:.0f} MB")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[INFO] Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"[INFO] Baseline updated: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"[INFO] No baseline at {args.baseline}, record one with --update-baseline")
+        return
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"[FAIL] {len(regressions)} measurement(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+    print("[OK] No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from cvss_dataset import load_dataset, training_corpus
+from model_registry import DEFAULT_CHECK_INTERVAL, training_run_id
+
+# Subdirectory of the models dir holding the linear first-tier models
+CASCADE_DIR = "cascade"
+MODEL_SUFFIX = ".joblib"
+THRESHOLDS_FILE = "thresholds.json"
+# Dataset the confidence thresholds are chosen on
+THRESHOLD_CSV = "nvd_cvss4_data2.csv"
+# Accuracy the linear model must reach on the predictions it keeps
+DEFAULT_TARGET_ACCURACY = 0.95
+# Threshold of a metric the linear model never answers (confidences are at most 1)
+NEVER = 1.01
+
+METRIC_COLUMNS = {
+    "AV": "attackVector",
+    "AC": "attackComplexity",
+    "AT": "attackRequirements",
+    "PR": "privilegesRequired",
+    "UI": "userInteraction",
+    "VC": "vulnConfidentialityImpact",
+    "VI": "vulnIntegrityImpact",
+    "VA": "vulnAvailabilityImpact",
+    "SC": "subConfidentialityImpact",
+    "SI": "subIntegrityImpact",
+    "SA": "subAvailabilityImpact",
+}
+
+
+def first_letters(values):
+    """One-letter labels as the classifiers return them, None where a value is missing"""
+    return np.array([v[0] if isinstance(v, str) and v else None for v in values], dtype=object)
+
+
+def train_linear(descriptions, labels):
+    """TF-IDF + logistic regression with sigmoid-calibrated probabilities.
+
+    Calibration needs a few examples of every class; with fewer the plain
+    logistic regression probabilities are used.
+    """
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    _, counts = np.unique(labels, return_counts=True)
+    classifier = LogisticRegression(max_iter=1000, C=4.0)
+    folds = min(3, int(counts.min()))
+    if folds >= 2:
+        classifier = CalibratedClassifierCV(classifier, method="sigmoid", cv=folds)
+    pipeline = make_pipeline(TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=2), classifier)
+    pipeline.fit(descriptions, labels)
+    return pipeline
+
+
+def train_cascade(df, models_dir, metrics, text_column="description"):
+    """Train and save the linear model of every metric with at least two classes in df"""
+    import joblib
+
+    cascade_dir = os.path.join(models_dir, CASCADE_DIR)
+    os.makedirs(cascade_dir, exist_ok=True)
+    for metric in metrics:
+        labels = first_letters(df[METRIC_COLUMNS[metric]].astype(object))
+        rows = np.flatnonzero([label is not None for label in labels])
+        if len(set(labels[rows])) < 2:
+            print(f"[WARN] {metric}: fewer than two classes, no linear model")
+            continue
+        pipeline = train_linear(df[text_column].iloc[rows].tolist(), labels[rows].astype(str))
+        joblib.dump(pipeline, os.path.join(cascade_dir, metric + MODEL_SUFFIX))
+        print(f"[INFO] {metric}: linear model trained on {len(rows)} descriptions")
+
+
+class LinearTier:
+    """Linear models of one models directory with their per-metric confidence thresholds.
+
+    thresholds.json records the training run of the transformer model each
+    threshold was chosen next to; a metric whose transformer has been
+    retrained since is left out until the thresholds are chosen again.
+    """
+
+    def __init__(self, models, thresholds):
+        self.models = models
+        self.thresholds = thresholds
+
+    def __contains__(self, metric):
+        return metric in self.models
+
+    @classmethod
+    def load(cls, models_dir, check_runs=True):
+        """Linear models and thresholds; with check_runs, metrics whose transformer changed are dropped"""
+        import joblib
+
+        cascade_dir = os.path.join(models_dir, CASCADE_DIR)
+        models = {
+            name[:-len(MODEL_SUFFIX)]: joblib.load(os.path.join(cascade_dir, name))
+            for name in sorted(os.listdir(cascade_dir)) if name.endswith(MODEL_SUFFIX)
+        }
+        thresholds = {}
+        path = os.path.join(cascade_dir, THRESHOLDS_FILE)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                entries = json.load(f)["metrics"]
+            for metric, entry in entries.items():
+                if check_runs and entry.get("bert_run") != training_run_id(os.path.join(models_dir, metric)):
+                    print(f"[WARN] {metric}: transformer model changed since its linear model's threshold "
+                          f"was chosen, cascade off for it (run cascade.py thresholds or train_models.py)")
+                    models.pop(metric, None)
+                    continue
+                thresholds[metric] = entry["threshold"]
+        return cls(models, thresholds)
+
+    def predict(self, metric, descriptions):
+        """(labels, confidences) of the linear model, confidence = top class probability"""
+        model = self.models[metric]
+        probabilities = model.predict_proba(descriptions)
+        best = probabilities.argmax(axis=1)
+        return model.classes_[best], probabilities[np.arange(len(best)), best]
+
+    def gate(self, metric, descriptions):
+        """(label or None, confidence) per description, None where it must escalate"""
+        labels, confidences = self.predict(metric, descriptions)
+        # Metrics without a chosen threshold always escalate
+        threshold = self.thresholds.get(metric, NEVER)
+        return [
+            (str(label) if confidence >= threshold else None, float(confidence))
+            for label, confidence in zip(labels, confidences)
+        ]
+
+
+def tier_version(models_dir):
+    """Files of the cascade directory and training runs of the transformer models behind them"""
+    cascade_dir = os.path.join(models_dir, CASCADE_DIR)
+    entries = sorted(os.scandir(cascade_dir), key=lambda e: e.name)
+    files = tuple((entry.name, entry.stat().st_mtime_ns) for entry in entries)
+    metrics = [entry.name[:-len(MODEL_SUFFIX)] for entry in entries if entry.name.endswith(MODEL_SUFFIX)]
+    return files, tuple(training_run_id(os.path.join(models_dir, metric)) for metric in metrics)
+
+
+class LinearTierCache:
+    """Loaded LinearTier per models directory, reloaded when its files or the transformer models change.
+
+    Like the model registry, a directory is checked at most once per
+    check_interval seconds.
+    """
+
+    def __init__(self, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        # cascade dir -> [version, tier or None, last checked]
+        self._tiers = {}
+        self._lock = threading.Lock()
+
+    def get(self, models_dir):
+        """The LinearTier of a models directory, or None if it has no linear models"""
+        cascade_dir = os.path.join(models_dir, CASCADE_DIR)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._tiers.get(cascade_dir)
+            if cached is not None and now - cached[2] < self.check_interval:
+                return cached[1]
+            try:
+                version = tier_version(models_dir)
+            except OSError:
+                version = None
+            if cached is None or cached[0] != version:
+                tier = LinearTier.load(models_dir) if version is not None else None
+                cached = self._tiers[cascade_dir] = [version, tier, now]
+            cached[2] = now
+            return cached[1]
+
+
+def choose_threshold(confidences, correct, target_accuracy):
+    """Lowest confidence threshold whose kept predictions are at least target_accuracy correct.
+
+    Returns (threshold, coverage, accuracy); NEVER when no threshold qualifies.
+    """
+    order = np.argsort(-confidences, kind="stable")
+    hits = np.cumsum(correct[order])
+    accuracy = hits / np.arange(1, len(order) + 1)
+    qualifying = np.flatnonzero(accuracy >= target_accuracy)
+    if len(qualifying) == 0:
+        return NEVER, 0.0, None
+    k = qualifying[-1]
+    threshold = float(confidences[order[k]])
+    kept = confidences >= threshold
+    return threshold, float(kept.mean()), float(correct[kept].mean())
+
+
+def select_thresholds(models_dir, csv_path=THRESHOLD_CSV, target_accuracy=DEFAULT_TARGET_ACCURACY):
+    """Choose and save every metric's threshold on csv_path, return the saved report"""
+    tier = LinearTier.load(models_dir, check_runs=False)
+    df = load_dataset(csv_path, columns=["description"] + list(METRIC_COLUMNS.values()))
+    df = df.dropna(subset=["description"]).reset_index(drop=True)
+
+    report = {"csv": csv_path, "target_accuracy": target_accuracy, "metrics": {}}
+    print(f"\n{'metric':>6}  {'threshold':>9}  {'coverage':>8}  {'accuracy':>8}  {'samples':>7}")
+    for metric in METRIC_COLUMNS:
+        if metric not in tier or METRIC_COLUMNS[metric] not in df.columns:
+            continue
+        truth = first_letters(df[METRIC_COLUMNS[metric]].astype(object))
+        rows = np.flatnonzero([label is not None for label in truth])
+        labels, confidences = tier.predict(metric, df["description"].iloc[rows].tolist())
+        correct = labels.astype(str) == truth[rows].astype(str)
+        threshold, coverage, accuracy = choose_threshold(confidences, correct, target_accuracy)
+        report["metrics"][metric] = {
+            "threshold": threshold, "coverage": coverage, "accuracy": accuracy, "samples": len(rows),
+            # The transformer model this threshold sends the rest to
+            "bert_run": training_run_id(os.path.join(models_dir, metric)),
+        }
+        accuracy_str = f"{accuracy:.1%}" if accuracy is not None else "-"
+        print(f"{metric:>6}  {threshold:>9.3f}  {coverage:>8.1%}  {accuracy_str:>8}  {len(rows):>7}")
+
+    with open(os.path.join(models_dir, CASCADE_DIR, THRESHOLDS_FILE), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Linear first tier of the CVSS model cascade")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train = subparsers.add_parser("train", help="train only the linear models (train_models.py also does it)")
+    train.add_argument("--csv", default=training_corpus(),
+                       help="default: the harvested Parquet or the CSV corpus, whichever is newer")
+    train.add_argument("--models-dir", default="./cvss_models")
+
+    thresholds = subparsers.add_parser("thresholds", help="choose per-metric confidence thresholds")
+    thresholds.add_argument("--csv", default=THRESHOLD_CSV)
+    thresholds.add_argument("--models-dir", default="./cvss_models")
+    thresholds.add_argument("--target-accuracy", type=float, default=DEFAULT_TARGET_ACCURACY,
+                            help="accuracy the linear model must keep on the predictions it answers")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        df = load_dataset(args.csv, columns=["description"] + list(METRIC_COLUMNS.values()))
+        df = df.dropna(subset=["description"]).reset_index(drop=True)
+        train_cascade(df, args.models_dir, list(METRIC_COLUMNS))
+        select_thresholds(args.models_dir)
+    else:
+        select_thresholds(args.models_dir, args.csv, args.target_accuracy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import argparse
+import copy
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn.functional as F
+from transformers import AutoModel, DataCollatorWithPadding
+
+from model_registry import load_model
+from multihead import IGNORE_INDEX, MULTIHEAD_NAME, MultiHeadCVSSModel, build_multitask_labels
+from cvss_dataset import load_dataset
+from quantization import QUANTIZED_WEIGHTS, quantize_int8, save_quantized
+from evaluation import METRIC_COLUMNS, TokenizedCorpus, map_cvss_values_to_abbreviations, predict_ids
+from train_models import CSV_PATH, CVSS_METRICS, METRIC_LABELS, METRIC_TO_COLUMN, OUTPUT_DIR, TEXT_COLUMN
+
+INT8_DIR = "./cvss_models_int8"
+DISTILLED_DIR = "./cvss_models_distilled"
+EVAL_CSV = "nvd_cvss4_data2.csv"
+REPORT_PATH = "compression_report.json"
+
+# Files holding model weights, used for the on-disk size
+WEIGHT_FILES = ("model.safetensors", "pytorch_model.bin", "heads.pt", QUANTIZED_WEIGHTS)
+
+
+def model_dirs(models_dir):
+    """Per-metric and multi-head model directories present in models_dir"""
+    names = CVSS_METRICS + [MULTIHEAD_NAME]
+    return [name for name in names if os.path.isdir(os.path.join(models_dir, name))]
+
+
+def quantize_models(src_dir, dst_dir):
+    """Write a dynamic INT8 copy of every model in src_dir to dst_dir"""
+    for name in model_dirs(src_dir):
+        src_path = os.path.join(src_dir, name)
+        dst_path = os.path.join(dst_dir, name)
+        loaded = load_model(src_path)
+        quantized = quantize_int8(loaded.model)
+        save_quantized(quantized, src_path, dst_path)
+        loaded.tokenizer.save_pretrained(dst_path)
+        print(f"[INFO] Quantized {src_path} -> {dst_path} "
+              f"({weights_size_mb(src_path):.1f} MB -> {weights_size_mb(dst_path):.1f} MB)")
+
+
+def build_student(teacher_model, metric_labels, layers):
+    """Shallow multi-head student initialised from the teacher's embeddings and evenly spaced layers"""
+    teacher_encoder = teacher_model.base_model
+    config = copy.deepcopy(teacher_encoder.config)
+    teacher_layers = config.num_hidden_layers
+    config.num_hidden_layers = layers
+    student_encoder = AutoModel.from_config(config)
+
+    student_encoder.embeddings.load_state_dict(teacher_encoder.embeddings.state_dict())
+    if layers == 1:
+        mapping = [teacher_layers - 1]
+    else:
+        mapping = [round(i * (teacher_layers - 1) / (layers - 1)) for i in range(layers)]
+    for student_idx, teacher_idx in enumerate(mapping):
+        student_encoder.encoder.layer[student_idx].load_state_dict(
+            teacher_encoder.encoder.layer[teacher_idx].state_dict()
+        )
+    if getattr(student_encoder, "pooler", None) is not None and getattr(teacher_encoder, "pooler", None) is not None:
+        student_encoder.pooler.load_state_dict(teacher_encoder.pooler.state_dict())
+
+    return MultiHeadCVSSModel(student_encoder, metric_labels)
+
+
+def collect_teacher_logits(loaded, encodings, batch_size):
+    collator = DataCollatorWithPadding(loaded.tokenizer, return_tensors="pt")
+    n_rows = len(encodings["input_ids"])
+    logits = []
+    with torch.no_grad():
+        for start in range(0, n_rows, batch_size):
+            features = [{k: v[i] for k, v in encodings.items()} for i in range(start, min(start + batch_size, n_rows))]
+            logits.append(loaded.model(**collator(features)).logits.numpy())
+    return np.concatenate(logits)
+
+
+def distill(teachers_dir, output_dir, csv_path, layers, epochs, batch_size, temperature, alpha, learning_rate):
+    """Train a shallow multi-head student from the per-metric teachers"""
+    df = load_dataset(csv_path, columns=[TEXT_COLUMN] + list(METRIC_TO_COLUMN.values()))
+    df = df.dropna(subset=[TEXT_COLUMN]).reset_index(drop=True)
+    metrics = [m for m in CVSS_METRICS if os.path.isdir(os.path.join(teachers_dir, m))]
+    if not metrics:
+        print(f"[ERROR] No teacher models found in {teachers_dir}")
+        return
+    metric_labels = {metric: METRIC_LABELS[metric] for metric in metrics}
+    labels = build_multitask_labels(df, metric_labels, METRIC_TO_COLUMN)
+
+    # Teacher soft targets, loading one teacher at a time
+    teacher_logits = {}
+    encodings = None
+    tokenizer = None
+    truncation = None
+    student = None
+    for metric in metrics:
+        teacher = load_model(os.path.join(teachers_dir, metric))
+        if encodings is None:
+            tokenizer = teacher.tokenizer
+            # The student reads descriptions cut the way its teachers were trained
+            truncation = teacher.truncation
+            encodings = truncation(tokenizer, df[TEXT_COLUMN].tolist())
+            student = build_student(teacher.model, metric_labels, layers)
+        logits = collect_teacher_logits(teacher, encodings, batch_size)
+        # Reorder teacher outputs to the METRIC_LABELS order used by the student
+        order = [{label: idx for idx, label in teacher.label_map.items()}[label] for label in metric_labels[metric]]
+        teacher_logits[metric] = logits[:, order]
+        print(f"[INFO] Collected {metric} teacher logits")
+        del teacher
+
+    collator = DataCollatorWithPadding(tokenizer, return_tensors="pt")
+    optimizer = torch.optim.AdamW(student.parameters(), lr=learning_rate, weight_decay=0.01)
+    n_rows = len(df)
+
+    for epoch in range(epochs):
+        student.train()
+        permutation = np.random.permutation(n_rows)
+        total_loss = 0.0
+        steps = 0
+        for start in range(0, n_rows, batch_size):
+            idx = permutation[start:start + batch_size]
+            batch = collator([{k: v[i] for k, v in encodings.items()} for i in idx])
+            outputs = student(**batch)
+
+            loss = 0.0
+            for col, metric in enumerate(metrics):
+                student_logits = outputs["logits"][col]
+                soft_targets = F.softmax(torch.from_numpy(teacher_logits[metric][idx]) / temperature, dim=-1)
+                soft_loss = F.kl_div(
+                    F.log_softmax(student_logits / temperature, dim=-1), soft_targets, reduction="batchmean"
+                ) * temperature ** 2
+                hard_labels = torch.from_numpy(labels[idx, col])
+                if (hard_labels != IGNORE_INDEX).any():
+                    hard_loss = F.cross_entropy(student_logits, hard_labels, ignore_index=IGNORE_INDEX)
+                else:
+                    hard_loss = 0.0
+                loss = loss + alpha * soft_loss + (1 - alpha) * hard_loss
+            loss = loss / len(metrics)
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item()
+            steps += 1
+
+        print(f"[INFO] Epoch {epoch + 1}/{epochs}: loss {total_loss / max(steps, 1):.4f}")
+
+    student.eval()
+    save_path = os.path.join(output_dir, MULTIHEAD_NAME)
+    student.save_pretrained(save_path)
+    tokenizer.save_pretrained(save_path)
+    truncation.save(save_path)
+    print(f"[INFO] Student ({layers} layers) saved to {save_path}")
+
+
+def weights_size_mb(model_path):
+    total = 0
+    for name in WEIGHT_FILES:
+        path = os.path.join(model_path, name)
+        if os.path.exists(path):
+            total += os.path.getsize(path)
+    return total / (1024 * 1024)
+
+
+def median_latency_ms(loaded, descriptions):
+    timings = []
+    for description in descriptions:
+        start = time.perf_counter()
+        loaded.predict_ids(loaded.tokenize([description]))
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def evaluate_variant(models_dir, df, latency_samples, batch_size):
+    """Size, latency and per-metric accuracy of one model variant.
+
+    Models are loaded one at a time so that measuring the fp32 baseline
+    doesn't need all of them resident at once.
+    """
+    descriptions = df[TEXT_COLUMN].tolist()
+    corpus = TokenizedCorpus(descriptions)
+    # Per-metric models take precedence, the multi-head model is used when there are none
+    names = [m for m in METRIC_COLUMNS if os.path.isdir(os.path.join(models_dir, m))]
+    multihead = not names and os.path.isdir(os.path.join(models_dir, MULTIHEAD_NAME))
+    if multihead:
+        names = [MULTIHEAD_NAME]
+
+    report = {"disk_mb": 0.0, "resident_mb": 0.0, "latency_ms": 0.0, "accuracy": {}}
+    for name in names:
+        model_path = os.path.join(models_dir, name)
+        loaded = load_model(model_path)
+        report["disk_mb"] += weights_size_mb(model_path)
+        report["resident_mb"] += loaded.nbytes / (1024 * 1024)
+        report["latency_ms"] += median_latency_ms(loaded, descriptions[:latency_samples])
+
+        metrics = [m for m in METRIC_COLUMNS if m in loaded.metrics] if multihead else [name]
+        for metric in metrics:
+            actual = df[METRIC_COLUMNS[metric]].to_numpy(dtype=object)
+            indices = np.flatnonzero(~(pd.isna(actual) | (actual == "NOT_DEFINED")))
+            ids = predict_ids(loaded, corpus, indices, batch_size)
+            if multihead:
+                ids = ids[:, loaded.metrics.index(metric)]
+                label_map = loaded.label_map[metric]
+            else:
+                label_map = loaded.label_map
+            predicted = np.array([label_map[int(i)] for i in ids], dtype=object)
+            expected = np.array([map_cvss_values_to_abbreviations(v) for v in actual[indices]], dtype=object)
+            report["accuracy"][metric] = float(np.mean(predicted == expected)) if len(indices) else None
+        del loaded
+
+    return report
+
+
+def print_report(reports):
+    names = list(reports)
+    print("\n" + "=" * (12 + 12 * len(names)))
+    print("COMPRESSION REPORT")
+    print("=" * (12 + 12 * len(names)))
+    print(f"{'':>12}" + "".join(f"{name:>12}" for name in names))
+    for key, label in (("disk_mb", "disk MB"), ("resident_mb", "memory MB"), ("latency_ms", "latency ms")):
+        print(f"{label:>12}" + "".join(f"{reports[name][key]:>12.1f}" for name in names))
+    print("-" * (12 + 12 * len(names)))
+    for metric in METRIC_COLUMNS:
+        values = [reports[name]["accuracy"].get(metric) for name in names]
+        print(f"{metric:>12}" + "".join(f"{v:>12.4f}" if v is not None else f"{'-':>12}" for v in values))
+    print("=" * (12 + 12 * len(names)))
+
+
+def report(variants, csv_path, latency_samples, batch_size, output_path=REPORT_PATH):
+    df = load_dataset(csv_path, columns=[TEXT_COLUMN] + list(METRIC_COLUMNS.values()))
+    df = df.dropna(subset=[TEXT_COLUMN]).reset_index(drop=True)
+    reports = {}
+    for name, models_dir in variants.items():
+        if not os.path.isdir(models_dir):
+            print(f"[INFO] Skipping {name}, {models_dir} not found")
+            continue
+        print(f"[INFO] Evaluating {name} ({models_dir})...")
+        reports[name] = evaluate_variant(models_dir, df, latency_samples, batch_size)
+
+    if reports:
+        print_report(reports)
+        with open(output_path, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"Report saved to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 quantization and distillation of the CVSS models")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    quantize_parser = subparsers.add_parser("quantize", help="dynamic INT8 quantization of the linear layers")
+    quantize_parser.add_argument("--src-dir", default=OUTPUT_DIR)
+    quantize_parser.add_argument("--dst-dir", default=INT8_DIR)
+
+    distill_parser = subparsers.add_parser("distill", help="train a shallow multi-head student from the teachers")
+    distill_parser.add_argument("--teachers-dir", default=OUTPUT_DIR)
+    distill_parser.add_argument("--output-dir", default=DISTILLED_DIR)
+    distill_parser.add_argument("--csv", default=CSV_PATH)
+    distill_parser.add_argument("--layers", type=int, default=4, help="encoder layers of the student")
+    distill_parser.add_argument("--epochs", type=int, default=4)
+    distill_parser.add_argument("--batch-size", type=int, default=16)
+    distill_parser.add_argument("--temperature", type=float, default=2.0)
+    distill_parser.add_argument("--alpha", type=float, default=0.5, help="weight of the soft teacher loss")
+    distill_parser.add_argument("--learning-rate", type=float, default=5e-5)
+
+    report_parser = subparsers.add_parser("report", help="size, latency and accuracy against the fp32 baseline")
+    report_parser.add_argument("--csv", default=EVAL_CSV)
+    report_parser.add_argument("--variant", nargs=2, action="append", metavar=("NAME", "DIR"),
+                               help="extra model directory to compare")
+    report_parser.add_argument("--latency-samples", type=int, default=50)
+    report_parser.add_argument("--batch-size", type=int, default=32)
+
+    args = parser.parse_args()
+
+    if args.command == "quantize":
+        quantize_models(args.src_dir, args.dst_dir)
+    elif args.command == "distill":
+        distill(args.teachers_dir, args.output_dir, args.csv, args.layers, args.epochs,
+                args.batch_size, args.temperature, args.alpha, args.learning_rate)
+    elif args.command == "report":
+        variants = {"fp32": OUTPUT_DIR, "int8": INT8_DIR, "distilled": DISTILLED_DIR}
+        variants.update(dict(args.variant or []))
+        report(variants, args.csv, args.latency_samples, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
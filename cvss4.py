@@ -0,0 +1,380 @@
+import argparse
+import time
+
+import numpy as np
+
+from cvss_dataset import load_dataset
+
+# CVSS v4.0 scoring as specified by FIRST (https://www.first.org/cvss/v4-0/), following
+# the reference calculator: a vector falls into a macrovector (EQ1..EQ6 equivalence
+# classes) whose score comes from CVSS_LOOKUP, then the score is interpolated towards
+# the next lower macrovector by the vector's severity distance from the class maximum.
+
+VECTOR_PREFIX = "CVSS:4.0/"
+EPSILON = 1e-6
+
+# Allowed values of every metric, in specification order
+METRIC_VALUES = {
+    "AV": ("N", "A", "L", "P"),
+    "AC": ("L", "H"),
+    "AT": ("N", "P"),
+    "PR": ("N", "L", "H"),
+    "UI": ("N", "P", "A"),
+    "VC": ("H", "L", "N"),
+    "VI": ("H", "L", "N"),
+    "VA": ("H", "L", "N"),
+    "SC": ("H", "L", "N"),
+    "SI": ("H", "L", "N"),
+    "SA": ("H", "L", "N"),
+    "E": ("X", "A", "P", "U"),
+    "CR": ("X", "H", "M", "L"),
+    "IR": ("X", "H", "M", "L"),
+    "AR": ("X", "H", "M", "L"),
+    "MAV": ("X", "N", "A", "L", "P"),
+    "MAC": ("X", "L", "H"),
+    "MAT": ("X", "N", "P"),
+    "MPR": ("X", "N", "L", "H"),
+    "MUI": ("X", "N", "P", "A"),
+    "MVC": ("X", "H", "L", "N"),
+    "MVI": ("X", "H", "L", "N"),
+    "MVA": ("X", "H", "L", "N"),
+    "MSC": ("X", "H", "L", "N"),
+    "MSI": ("X", "S", "H", "L", "N"),
+    "MSA": ("X", "S", "H", "L", "N"),
+    "S": ("X", "N", "P"),
+    "AU": ("X", "N", "Y"),
+    "R": ("X", "A", "U", "I"),
+    "V": ("X", "D", "C"),
+    "RE": ("X", "L", "M", "H"),
+    "U": ("X", "Clear", "Green", "Amber", "Red"),
+}
+BASE_METRICS = ("AV", "AC", "AT", "PR", "UI", "VC", "VI", "VA", "SC", "SI", "SA")
+
+# Metrics that take part in the score after applying modified/default values.
+# Values are ordered from most to least severe, so a value's index is its level.
+SCORE_VALUES = {
+    "AV": ("N", "A", "L", "P"),
+    "PR": ("N", "L", "H"),
+    "UI": ("N", "P", "A"),
+    "AC": ("L", "H"),
+    "AT": ("N", "P"),
+    "VC": ("H", "L", "N"),
+    "VI": ("H", "L", "N"),
+    "VA": ("H", "L", "N"),
+    "CR": ("H", "M", "L"),
+    "IR": ("H", "M", "L"),
+    "AR": ("H", "M", "L"),
+    "SC": ("S", "H", "L", "N"),
+    "SI": ("S", "H", "L", "N"),
+    "SA": ("S", "H", "L", "N"),
+    "E": ("A", "P", "U"),
+}
+SCORE_METRICS = tuple(SCORE_VALUES)
+# Defaults of the threat/environmental metrics when they are X
+SCORE_DEFAULTS = {"E": "A", "CR": "H", "IR": "H", "AR": "H"}
+# Column ranges of the severity distance of each EQ within SCORE_METRICS
+EQ_COLUMNS = {"eq1": slice(0, 3), "eq2": slice(3, 5), "eq3eq6": slice(5, 11), "eq4": slice(11, 14)}
+N_LEVEL_METRICS = 14
+
+# Highest severity vectors of each EQ class (eq3 is keyed by eq6 as well)
+MAX_COMPOSED = {
+    "eq1": {0: ["AV:N/PR:N/UI:N"], 1: ["AV:A/PR:N/UI:N", "AV:N/PR:L/UI:N", "AV:N/PR:N/UI:P"],
+            2: ["AV:P/PR:N/UI:N", "AV:A/PR:L/UI:P"]},
+    "eq2": {0: ["AC:L/AT:N"], 1: ["AC:H/AT:N", "AC:L/AT:P"]},
+    "eq3": {
+        0: {0: ["VC:H/VI:H/VA:H/CR:H/IR:H/AR:H"],
+            1: ["VC:H/VI:H/VA:L/CR:M/IR:M/AR:H", "VC:H/VI:H/VA:H/CR:M/IR:M/AR:M"]},
+        1: {0: ["VC:L/VI:H/VA:H/CR:H/IR:H/AR:H", "VC:H/VI:L/VA:H/CR:H/IR:H/AR:H"],
+            1: ["VC:L/VI:H/VA:L/CR:H/IR:M/AR:H", "VC:L/VI:H/VA:H/CR:H/IR:M/AR:M",
+                "VC:H/VI:L/VA:H/CR:M/IR:H/AR:M", "VC:H/VI:L/VA:L/CR:M/IR:H/AR:H",
+                "VC:L/VI:L/VA:H/CR:H/IR:H/AR:M"]},
+        2: {1: ["VC:L/VI:L/VA:L/CR:H/IR:H/AR:H"]},
+    },
+    "eq4": {0: ["SC:H/SI:S/SA:S"], 1: ["SC:H/SI:H/SA:H"], 2: ["SC:L/SI:L/SA:L"]},
+}
+# Depth (in 0.1 steps) of each EQ class, used to normalise severity distances
+MAX_SEVERITY = {
+    "eq1": {0: 1, 1: 4, 2: 5},
+    "eq2": {0: 1, 1: 2},
+    "eq3eq6": {(0, 0): 7, (0, 1): 6, (1, 0): 8, (1, 1): 8, (2, 1): 10},
+    "eq4": {0: 6, 1: 5, 2: 4},
+}
+
+# Score of every macrovector "eq1 eq2 eq3 eq4 eq5 eq6"
+CVSS_LOOKUP = {
+    "000000": 10, "000001": 9.9, "000010": 9.8, "000011": 9.5, "000020": 9.5, "000021": 9.2,
+    "000100": 10, "000101": 9.6, "000110": 9.3, "000111": 8.7, "000120": 9.1, "000121": 8.1,
+    "000200": 9.3, "000201": 9, "000210": 8.9, "000211": 8, "000220": 8.1, "000221": 6.8,
+    "001000": 9.8, "001001": 9.5, "001010": 9.5, "001011": 9.2, "001020": 9, "001021": 8.4,
+    "001100": 9.3, "001101": 9.2, "001110": 8.9, "001111": 8.1, "001120": 8.1, "001121": 6.5,
+    "001200": 8.8, "001201": 8, "001210": 7.8, "001211": 7, "001220": 6.9, "001221": 4.8,
+    "002001": 9.2, "002011": 8.2, "002021": 7.2, "002101": 7.9, "002111": 6.9, "002121": 5,
+    "002201": 6.9, "002211": 5.5, "002221": 2.7, "010000": 9.9, "010001": 9.7, "010010": 9.5,
+    "010011": 9.2, "010020": 9.2, "010021": 8.5, "010100": 9.5, "010101": 9.1, "010110": 9,
+    "010111": 8.3, "010120": 8.4, "010121": 7.1, "010200": 9.2, "010201": 8.1, "010210": 8.2,
+    "010211": 7.1, "010220": 7.2, "010221": 5.3, "011000": 9.5, "011001": 9.3, "011010": 9.2,
+    "011011": 8.5, "011020": 8.5, "011021": 7.3, "011100": 9.2, "011101": 8.2, "011110": 8,
+    "011111": 7.2, "011120": 7, "011121": 5.9, "011200": 8.4, "011201": 7, "011210": 7.1,
+    "011211": 5.2, "011220": 5, "011221": 3, "012001": 8.6, "012011": 7.5, "012021": 5.2,
+    "012101": 7.1, "012111": 5.2, "012121": 2.9, "012201": 6.3, "012211": 2.9, "012221": 1.7,
+    "100000": 9.8, "100001": 9.5, "100010": 9.4, "100011": 8.7, "100020": 9.1, "100021": 8.1,
+    "100100": 9.4, "100101": 8.9, "100110": 8.6, "100111": 7.4, "100120": 7.7, "100121": 6.4,
+    "100200": 8.7, "100201": 7.5, "100210": 7.4, "100211": 6.3, "100220": 6.3, "100221": 4.9,
+    "101000": 9.4, "101001": 8.9, "101010": 8.8, "101011": 7.7, "101020": 7.6, "101021": 6.7,
+    "101100": 8.6, "101101": 7.6, "101110": 7.4, "101111": 5.8, "101120": 5.9, "101121": 5,
+    "101200": 7.2, "101201": 5.7, "101210": 5.7, "101211": 5.2, "101220": 5.2, "101221": 2.5,
+    "102001": 8.3, "102011": 7, "102021": 5.4, "102101": 6.5, "102111": 5.8, "102121": 2.6,
+    "102201": 5.3, "102211": 2.1, "102221": 1.3, "110000": 9.5, "110001": 9, "110010": 8.8,
+    "110011": 7.6, "110020": 7.6, "110021": 7, "110100": 9, "110101": 7.7, "110110": 7.5,
+    "110111": 6.2, "110120": 6.1, "110121": 5.3, "110200": 7.7, "110201": 6.6, "110210": 6.8,
+    "110211": 5.9, "110220": 5.2, "110221": 3, "111000": 8.9, "111001": 7.8, "111010": 7.6,
+    "111011": 6.7, "111020": 6.2, "111021": 5.8, "111100": 7.4, "111101": 5.9, "111110": 5.7,
+    "111111": 5.7, "111120": 4.7, "111121": 2.3, "111200": 6.1, "111201": 5.2, "111210": 5.7,
+    "111211": 2.9, "111220": 2.4, "111221": 1.6, "112001": 7.1, "112011": 5.9, "112021": 3,
+    "112101": 5.8, "112111": 2.6, "112121": 1.5, "112201": 2.3, "112211": 1.3, "112221": 0.6,
+    "200000": 9.3, "200001": 8.7, "200010": 8.6, "200011": 7.2, "200020": 7.5, "200021": 5.8,
+    "200100": 8.6, "200101": 7.4, "200110": 7.4, "200111": 6.1, "200120": 5.6, "200121": 3.4,
+    "200200": 7, "200201": 5.4, "200210": 5.2, "200211": 4, "200220": 4, "200221": 2.2,
+    "201000": 8.5, "201001": 7.5, "201010": 7.4, "201011": 5.5, "201020": 6.2, "201021": 5.1,
+    "201100": 7.2, "201101": 5.7, "201110": 5.5, "201111": 4.1, "201120": 4.6, "201121": 1.9,
+    "201200": 5.3, "201201": 3.6, "201210": 3.4, "201211": 1.9, "201220": 1.9, "201221": 0.8,
+    "202001": 6.4, "202011": 5.1, "202021": 2, "202101": 4.7, "202111": 2.1, "202121": 1.1,
+    "202201": 2.4, "202211": 0.9, "202221": 0.4, "210000": 8.8, "210001": 7.5, "210010": 7.3,
+    "210011": 5.3, "210020": 6, "210021": 5, "210100": 7.3, "210101": 5.5, "210110": 5.9,
+    "210111": 4, "210120": 4.1, "210121": 2, "210200": 5.4, "210201": 4.3, "210210": 4.5,
+    "210211": 2.2, "210220": 2, "210221": 1.1, "211000": 7.5, "211001": 5.5, "211010": 5.8,
+    "211011": 4.5, "211020": 4, "211021": 2.1, "211100": 6.1, "211101": 5.1, "211110": 4.8,
+    "211111": 1.8, "211120": 2, "211121": 0.9, "211200": 4.6, "211201": 1.8, "211210": 1.7,
+    "211211": 0.7, "211220": 0.8, "211221": 0.2, "212001": 5.3, "212011": 2.4, "212021": 1.4,
+    "212101": 2.4, "212111": 1.2, "212121": 0.5, "212201": 1, "212211": 0.3, "212221": 0.1,
+}
+
+SEVERITY_BOUNDS = ((0.0, "NONE"), (3.9, "LOW"), (6.9, "MEDIUM"), (8.9, "HIGH"), (10.0, "CRITICAL"))
+
+MACRO_SHAPE = (3, 2, 3, 3, 3, 2)
+N_MACROS = int(np.prod(MACRO_SHAPE))
+# Vectors scored per NumPy pass, bounds the (chunk, candidates, metrics) distance array
+SCORE_CHUNK = 65536
+# Level of padded max-vector slots, always above any real level so they never match
+PAD_LEVEL = 100
+DATASET_CSV = "nvd_cvss4_data.csv"
+
+
+def _lookup(*eqs):
+    return CVSS_LOOKUP.get("".join(str(eq) for eq in eqs), float("nan"))
+
+
+def _max_vector_levels(parts):
+    metrics = dict(field.split(":") for field in "/".join(parts).split("/"))
+    return [SCORE_VALUES[metric].index(metrics[metric]) for metric in SCORE_METRICS[:N_LEVEL_METRICS]]
+
+
+def _build_tables():
+    """Per-macrovector arrays used by score_codes, computed once at import"""
+    value = np.full(N_MACROS, np.nan)
+    available = np.full((N_MACROS, 5), np.nan)
+    max_severity = np.ones((N_MACROS, 4))
+    candidates = {}
+
+    for key, score in CVSS_LOOKUP.items():
+        eq1, eq2, eq3, eq4, eq5, eq6 = (int(c) for c in key)
+        index = np.ravel_multi_index((eq1, eq2, eq3, eq4, eq5, eq6), MACRO_SHAPE)
+        value[index] = score
+
+        if (eq3, eq6) in ((0, 1), (1, 1)):
+            lower_eq3eq6 = _lookup(eq1, eq2, eq3 + 1, eq4, eq5, eq6)
+        elif (eq3, eq6) == (1, 0):
+            lower_eq3eq6 = _lookup(eq1, eq2, eq3, eq4, eq5, eq6 + 1)
+        elif (eq3, eq6) == (0, 0):
+            lower_eq3eq6 = max(_lookup(eq1, eq2, eq3, eq4, eq5, eq6 + 1),
+                               _lookup(eq1, eq2, eq3 + 1, eq4, eq5, eq6))
+        else:
+            lower_eq3eq6 = _lookup(eq1, eq2, eq3 + 1, eq4, eq5, eq6 + 1)
+        lower = [
+            _lookup(eq1 + 1, eq2, eq3, eq4, eq5, eq6),
+            _lookup(eq1, eq2 + 1, eq3, eq4, eq5, eq6),
+            lower_eq3eq6,
+            _lookup(eq1, eq2, eq3, eq4 + 1, eq5, eq6),
+            _lookup(eq1, eq2, eq3, eq4, eq5 + 1, eq6),
+        ]
+        available[index] = score - np.array(lower)
+        max_severity[index] = [
+            MAX_SEVERITY["eq1"][eq1], MAX_SEVERITY["eq2"][eq2],
+            MAX_SEVERITY["eq3eq6"][(eq3, eq6)], MAX_SEVERITY["eq4"][eq4],
+        ]
+        candidates[index] = [
+            _max_vector_levels((v1, v2, v3, v4))
+            for v1 in MAX_COMPOSED["eq1"][eq1]
+            for v2 in MAX_COMPOSED["eq2"][eq2]
+            for v3 in MAX_COMPOSED["eq3"][eq3][eq6]
+            for v4 in MAX_COMPOSED["eq4"][eq4]
+        ]
+
+    width = max(len(levels) for levels in candidates.values())
+    max_vectors = np.full((N_MACROS, width, N_LEVEL_METRICS), PAD_LEVEL, dtype=np.int8)
+    max_vector_count = np.ones(N_MACROS, dtype=np.int64)
+    for index, levels in candidates.items():
+        max_vectors[index, :len(levels)] = levels
+        max_vector_count[index] = len(levels)
+    return value, available, max_severity, max_vectors, max_vector_count
+
+
+MACRO_VALUE, MACRO_AVAILABLE, MACRO_MAX_SEVERITY, MACRO_MAX_VECTORS, MACRO_MAX_VECTOR_COUNT = _build_tables()
+
+
+def parse_vector(vector):
+    """Metric -> value dict of a "CVSS:4.0/..." vector string, raises ValueError if malformed"""
+    if not isinstance(vector, str) or not vector.startswith(VECTOR_PREFIX):
+        raise ValueError(f"Not a CVSS v4.0 vector: {vector!r}")
+    metrics = {}
+    for field in vector[len(VECTOR_PREFIX):].split("/"):
+        metric, _, value = field.partition(":")
+        if metric not in METRIC_VALUES or value not in METRIC_VALUES[metric]:
+            raise ValueError(f"Invalid field {field!r} in {vector!r}")
+        if metric in metrics:
+            raise ValueError(f"Duplicate metric {metric!r} in {vector!r}")
+        metrics[metric] = value
+    missing = [metric for metric in BASE_METRICS if metric not in metrics]
+    if missing:
+        raise ValueError(f"Missing base metrics {missing} in {vector!r}")
+    return metrics
+
+
+def build_vector(metrics):
+    """Vector string of a metric -> value dict, metrics in specification order"""
+    fields = [f"{metric}:{metrics[metric]}" for metric in METRIC_VALUES
+              if metrics.get(metric, "X") != "X"]
+    return VECTOR_PREFIX + "/".join(fields)
+
+
+def vector_codes(metrics):
+    """Level of every SCORE_METRICS value once modified metrics and defaults are applied"""
+    codes = []
+    for metric in SCORE_METRICS:
+        value = metrics.get("M" + metric, "X")
+        if value == "X":
+            value = metrics.get(metric, "X")
+        if value == "X":
+            value = SCORE_DEFAULTS.get(metric)
+        if value not in SCORE_VALUES[metric]:
+            raise ValueError(f"Invalid or missing value {value!r} for {metric}")
+        codes.append(SCORE_VALUES[metric].index(value))
+    return codes
+
+
+def _score_chunk(codes):
+    av, pr, ui, ac, at, vc, vi, va, cr, ir, ar, sc, si, sa, e = codes.T
+    vc_h, vi_h, va_h = vc == 0, vi == 0, va == 0
+
+    any_n = (av == 0) | (pr == 0) | (ui == 0)
+    all_n = (av == 0) & (pr == 0) & (ui == 0)
+    eq1 = np.where(all_n, 0, np.where(any_n & (av != 3), 1, 2))
+    eq2 = np.where((ac == 0) & (at == 0), 0, 1)
+    eq3 = np.where(vc_h & vi_h, 0, np.where(vc_h | vi_h | va_h, 1, 2))
+    eq4 = np.where((si == 0) | (sa == 0), 0, np.where((sc == 1) | (si == 1) | (sa == 1), 1, 2))
+    eq6 = np.where(((cr == 0) & vc_h) | ((ir == 0) & vi_h) | ((ar == 0) & va_h), 0, 1)
+    macro = np.ravel_multi_index((eq1, eq2, eq3, eq4, e, eq6), MACRO_SHAPE)
+
+    # Distance from the first max vector of the class the vector does not exceed
+    distances = codes[:, None, :N_LEVEL_METRICS] - MACRO_MAX_VECTORS[macro]
+    fits = (distances >= 0).all(axis=2)
+    chosen = np.where(fits.any(axis=1), fits.argmax(axis=1), MACRO_MAX_VECTOR_COUNT[macro] - 1)
+    distance = distances[np.arange(len(codes)), chosen].astype(np.float64)
+
+    current = np.stack([distance[:, cols].sum(axis=1) for cols in EQ_COLUMNS.values()], axis=1)
+    percent = np.zeros((len(codes), 5))
+    percent[:, :4] = current / MACRO_MAX_SEVERITY[macro]
+
+    available = MACRO_AVAILABLE[macro]
+    has_lower = available >= 0
+    normalized = np.where(has_lower, available * percent, 0.0)
+    n_lower = has_lower.sum(axis=1)
+    mean_distance = np.divide(normalized.sum(axis=1), n_lower, out=np.zeros(len(codes)), where=n_lower > 0)
+
+    value = np.clip(MACRO_VALUE[macro] - mean_distance, 0.0, 10.0)
+    no_impact = (vc == 2) & (vi == 2) & (va == 2) & (sc == 3) & (si == 3) & (sa == 3)
+    value[no_impact] = 0.0
+    # Round half up to one decimal, EPSILON absorbs float error (e.g. 1.4499999 -> 1.5)
+    return np.floor((value + EPSILON) * 10 + 0.5) / 10
+
+
+def score_codes(codes):
+    """Base scores of an (n, len(SCORE_METRICS)) array of vector_codes rows"""
+    codes = np.asarray(codes, dtype=np.int8).reshape(-1, len(SCORE_METRICS))
+    return np.concatenate([
+        _score_chunk(codes[start:start + SCORE_CHUNK])
+        for start in range(0, len(codes), SCORE_CHUNK)
+    ] or [np.zeros(0)])
+
+
+def score_vectors(vectors, errors="raise"):
+    """Base scores of a sequence of vector strings.
+
+    Each distinct vector is parsed once, then all are scored in NumPy. With
+    errors="nan" malformed vectors score NaN instead of raising ValueError.
+    """
+    unique, inverse = np.unique(np.asarray(vectors, dtype=object).astype(str), return_inverse=True)
+    codes = np.zeros((len(unique), len(SCORE_METRICS)), dtype=np.int8)
+    valid = np.ones(len(unique), dtype=bool)
+    for i, vector in enumerate(unique):
+        try:
+            codes[i] = vector_codes(parse_vector(vector))
+        except ValueError:
+            if errors != "nan":
+                raise
+            valid[i] = False
+    scores = np.where(valid, score_codes(codes), np.nan)
+    return scores[inverse.reshape(-1)]
+
+
+def score_vector(vector):
+    """Base score of one vector string or metric -> value dict"""
+    metrics = parse_vector(vector) if isinstance(vector, str) else vector
+    return float(score_codes(vector_codes(metrics))[0])
+
+
+def severities(scores):
+    """Qualitative severity rating ("NONE" .. "CRITICAL") of an array of scores"""
+    scores = np.asarray(scores, dtype=np.float64)
+    conditions = [scores <= bound for bound, _ in SEVERITY_BOUNDS]
+    return np.select(conditions, [name for _, name in SEVERITY_BOUNDS], default="")
+
+
+def severity(score):
+    return str(severities([score])[0])
+
+
+def rescore_csv(csv_path):
+    """Recompute the score of every vectorString in an NVD csv, next to the stored baseScore"""
+    df = load_dataset(csv_path, columns=["cve_id", "vectorString", "baseScore", "baseSeverity"])
+    df["computedScore"] = score_vectors(df["vectorString"].to_numpy(), errors="nan")
+    df["computedSeverity"] = severities(df["computedScore"])
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score the CVSS v4.0 vectors of an NVD csv")
+    parser.add_argument("--csv", default=DATASET_CSV)
+    parser.add_argument("--show", type=int, default=10, help="mismatching rows to print")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df = rescore_csv(args.csv)
+    elapsed = time.perf_counter() - start
+
+    invalid = df["computedScore"].isna()
+    checked = df[~invalid & df["baseScore"].notna()]
+    mismatch = checked[(checked["computedScore"] - checked["baseScore"]).abs() > 1e-9]
+    severity_match = (checked["computedSeverity"] == checked["baseSeverity"].str.upper()).mean()
+
+    print(f"[INFO] Re-scored {len(df)} vectors in {elapsed:.2f}s ({len(df) / elapsed:,.0f} vectors/sec)")
+    print(f"[INFO] Invalid vectors: {int(invalid.sum())}")
+    print(f"[INFO] Score matches: {len(checked) - len(mismatch)}/{len(checked)}")
+    print(f"[INFO] Severity matches: {severity_match:.2%}")
+    if len(mismatch):
+        print(f"[ERROR] {len(mismatch)} scores differ from baseScore:")
+        print(mismatch.head(args.show).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
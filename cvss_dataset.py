@@ -0,0 +1,196 @@
+import argparse
+import gc
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import psutil
+import pyarrow.parquet as pq
+
+DATASET_CSVS = ["nvd_cvss4_data.csv", "nvd_cvss4_data2.csv"]
+# Training corpus as exported (CSV) and as harvested by get_data.py (default --format parquet)
+TRAINING_CSV = "nvd_cvss4_data.csv"
+TRAINING_PARQUET = "nvd_cvss4_data.parquet"
+
+_IMPACT = ["HIGH", "LOW", "NONE"]
+_REQUIREMENT = ["NOT_DEFINED", "HIGH", "MEDIUM", "LOW"]
+# Values of every enum column as defined by the NVD CVSS v4.0 schema, most severe first
+CATEGORIES = {
+    "baseSeverity": ["CRITICAL", "HIGH", "MEDIUM", "LOW", "NONE"],
+    "attackVector": ["NETWORK", "ADJACENT", "LOCAL", "PHYSICAL"],
+    "attackComplexity": ["LOW", "HIGH"],
+    "attackRequirements": ["NONE", "PRESENT"],
+    "privilegesRequired": ["NONE", "LOW", "HIGH"],
+    "userInteraction": ["NONE", "PASSIVE", "ACTIVE"],
+    "vulnConfidentialityImpact": _IMPACT,
+    "vulnIntegrityImpact": _IMPACT,
+    "vulnAvailabilityImpact": _IMPACT,
+    "subConfidentialityImpact": _IMPACT,
+    "subIntegrityImpact": _IMPACT,
+    "subAvailabilityImpact": _IMPACT,
+    "exploitMaturity": ["NOT_DEFINED", "ATTACKED", "PROOF_OF_CONCEPT", "UNREPORTED"],
+    "confidentialityRequirement": _REQUIREMENT,
+    "integrityRequirement": _REQUIREMENT,
+    "availabilityRequirement": _REQUIREMENT,
+    "modifiedAttackVector": ["NOT_DEFINED", "NETWORK", "ADJACENT", "LOCAL", "PHYSICAL"],
+    "modifiedAttackComplexity": ["NOT_DEFINED", "LOW", "HIGH"],
+    "modifiedAttackRequirements": ["NOT_DEFINED", "NONE", "PRESENT"],
+    "modifiedPrivilegesRequired": ["NOT_DEFINED", "NONE", "LOW", "HIGH"],
+    "modifiedUserInteraction": ["NOT_DEFINED", "NONE", "PASSIVE", "ACTIVE"],
+    "modifiedVulnConfidentialityImpact": ["NOT_DEFINED"] + _IMPACT,
+    "modifiedVulnIntegrityImpact": ["NOT_DEFINED"] + _IMPACT,
+    "modifiedVulnAvailabilityImpact": ["NOT_DEFINED"] + _IMPACT,
+    "modifiedSubConfidentialityImpact": ["NOT_DEFINED", "HIGH", "LOW", "NEGLIGIBLE"],
+    "modifiedSubIntegrityImpact": ["NOT_DEFINED", "SAFETY", "HIGH", "LOW", "NEGLIGIBLE"],
+    "modifiedSubAvailabilityImpact": ["NOT_DEFINED", "SAFETY", "HIGH", "LOW", "NEGLIGIBLE"],
+    "Safety": ["NOT_DEFINED", "NEGLIGIBLE", "PRESENT"],
+    "Automatable": ["NOT_DEFINED", "NO", "YES"],
+    "Recovery": ["NOT_DEFINED", "AUTOMATIC", "USER", "IRRECOVERABLE"],
+    "valueDensity": ["NOT_DEFINED", "DIFFUSE", "CONCENTRATED"],
+    "vulnerabilityResponseEffort": ["NOT_DEFINED", "LOW", "MODERATE", "HIGH"],
+    "providerUrgency": ["NOT_DEFINED", "CLEAR", "GREEN", "AMBER", "RED"],
+}
+# Columns the model scripts read: the description and the predicted base metrics
+BASE_METRIC_COLUMNS = [
+    "attackVector", "attackComplexity", "attackRequirements", "privilegesRequired", "userInteraction",
+    "vulnConfidentialityImpact", "vulnIntegrityImpact", "vulnAvailabilityImpact",
+    "subConfidentialityImpact", "subIntegrityImpact", "subAvailabilityImpact",
+]
+TRAINING_COLUMNS = ["description"] + BASE_METRIC_COLUMNS
+
+
+def dataset_path(path):
+    """Parquet cache of a CSV: data.csv -> data.csv.parquet.
+
+    The suffix keeps the cache apart from get_data.py's data.parquet output,
+    so a conversion can never overwrite a harvest or be read in its place.
+    """
+    return path + ".parquet"
+
+
+def training_corpus():
+    """Newest of the harvested Parquet and the CSV training corpus, so a fresh harvest reaches training"""
+    existing = [path for path in (TRAINING_PARQUET, TRAINING_CSV) if os.path.exists(path)]
+    if not existing:
+        return TRAINING_CSV
+    return max(existing, key=os.path.getmtime)
+
+
+def categorize(df):
+    """Convert enum columns to categoricals with the schema's categories.
+
+    Values outside the schema are kept as extra categories rather than
+    silently turned into NaN.
+    """
+    for column, categories in CATEGORIES.items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype) and list(values.cat.categories) == categories:
+            continue
+        unknown = sorted(set(values.dropna().astype(str)) - set(categories))
+        if unknown:
+            print(f"[INFO] Unexpected values in {column}: {unknown}")
+        df[column] = values.astype(pd.CategoricalDtype(categories + unknown))
+    return df
+
+
+def convert_csv(csv_path, parquet_path=None):
+    """Write a CSV as a Parquet dataset with categorical columns"""
+    parquet_path = parquet_path or dataset_path(csv_path)
+    df = categorize(pd.read_csv(csv_path))
+    df.to_parquet(parquet_path, engine="pyarrow", compression="zstd", index=False)
+    print(f"[INFO] Converted {csv_path} -> {parquet_path} "
+          f"({os.path.getsize(csv_path) / 1e6:.2f} MB -> {os.path.getsize(parquet_path) / 1e6:.2f} MB)")
+    return parquet_path
+
+
+def ensure_parquet(path):
+    """Parquet file of a dataset, converting the CSV once (again only when the CSV changes)"""
+    if path.endswith(".parquet"):
+        return path
+    parquet_path = dataset_path(path)
+    if not os.path.exists(parquet_path) or (
+        os.path.exists(path) and os.path.getmtime(path) > os.path.getmtime(parquet_path)
+    ):
+        convert_csv(path, parquet_path)
+    return parquet_path
+
+
+def load_dataset(path, columns=None, memory_map=True):
+    """Load a dataset (CSV path or Parquet) reading only the given columns (missing ones are skipped)"""
+    path = ensure_parquet(path)
+    if columns is not None:
+        available = pq.read_schema(path).names
+        columns = [column for column in columns if column in available]
+    table = pq.read_table(path, columns=columns, memory_map=memory_map)
+    return categorize(table.to_pandas())
+
+
+def _load(kind, path, columns):
+    if kind == "csv":
+        return pd.read_csv(path, usecols=columns)
+    return load_dataset(path, columns)
+
+
+def _measure_load(kind, path, columns):
+    # Runs in a fresh process; one warm-up load keeps library initialisation out of the numbers
+    _load(kind, path, columns)
+    gc.collect()
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    start = time.perf_counter()
+    df = _load(kind, path, columns)
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "rss_mb": (process.memory_info().rss - rss_before) / 1e6,
+        "frame_mb": df.memory_usage(deep=True).sum() / 1e6,
+        "rows": len(df),
+        "columns": df.shape[1],
+    }
+
+
+def load_report(csv_path, columns=TRAINING_COLUMNS):
+    """Load time and memory of the CSV and the Parquet dataset, all and projected columns"""
+    ensure_parquet(csv_path)
+    context = multiprocessing.get_context("spawn")
+    rows = {}
+    for kind in ("csv", "parquet"):
+        for label, selected in (("all columns", None), ("model columns", columns)):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                rows[(kind, label)] = pool.submit(_measure_load, kind, csv_path, selected).result()
+    return rows
+
+
+def print_load_report(csv_path, rows):
+    print("\n" + "=" * 72)
+    print(f"DATASET LOAD REPORT ({csv_path})")
+    print("=" * 72)
+    print(f"{'format':<8}  {'columns':<14}  {'rows':>6}  {'cols':>4}  {'load ms':>8}  {'RSS MB':>7}  {'frame MB':>8}")
+    for (kind, label), row in rows.items():
+        print(f"{kind:<8}  {label:<14}  {row['rows']:>6}  {row['columns']:>4}  {row['seconds'] * 1000:>8.1f}  "
+              f"{row['rss_mb']:>7.2f}  {row['frame_mb']:>8.2f}")
+    print("=" * 72)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parquet dataset store for the NVD CVSS v4.0 corpus")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="convert the CSVs to Parquet")
+    convert_parser.add_argument("csv", nargs="*", default=DATASET_CSVS)
+    report_parser = subparsers.add_parser("report", help="compare CSV and Parquet load time and memory")
+    report_parser.add_argument("csv", nargs="*", default=DATASET_CSVS)
+    args = parser.parse_args()
+
+    for csv_path in args.csv:
+        if args.command == "convert":
+            convert_csv(csv_path)
+        else:
+            print_load_report(csv_path, load_report(csv_path))
+
+
+if __name__ == "__main__":
+    main()
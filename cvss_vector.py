@@ -0,0 +1,311 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from cvss4 import (
+    BASE_METRICS, METRIC_VALUES, SCORE_DEFAULTS, SCORE_METRICS, SCORE_VALUES, VECTOR_PREFIX,
+    parse_vector, score_codes,
+)
+from cvss_dataset import load_dataset
+
+# Metric groups of the specification, each packed into its own bitfield
+METRIC_GROUPS = {
+    "base": BASE_METRICS,
+    "threat": ("E",),
+    "environmental": ("CR", "IR", "AR", "MAV", "MAC", "MAT", "MPR", "MUI",
+                      "MVC", "MVI", "MVA", "MSC", "MSI", "MSA"),
+    "supplemental": ("S", "AU", "R", "V", "RE", "U"),
+}
+# 11 bytes per vector; a scalar vector is the same bytes read as one little-endian int
+VECTOR_DTYPE = np.dtype([("base", "<u4"), ("threat", "u1"), ("environmental", "<u4"), ("supplemental", "<u2")])
+
+
+def _build_layout():
+    """(group, shift in group, shift in the scalar int, mask) of every metric"""
+    layout = {}
+    for group, metrics in METRIC_GROUPS.items():
+        group_offset = VECTOR_DTYPE.fields[group][1] * 8
+        shift = 0
+        for metric in metrics:
+            width = (len(METRIC_VALUES[metric]) - 1).bit_length()
+            layout[metric] = (group, shift, group_offset + shift, (1 << width) - 1)
+            shift += width
+        assert shift <= VECTOR_DTYPE[group].itemsize * 8, group
+    return layout
+
+
+METRIC_LAYOUT = _build_layout()
+# Every "metric:value" field -> (bit marking the metric as seen, packed value)
+FIELD_BITS = {
+    f"{metric}:{value}": (1 << i, index << METRIC_LAYOUT[metric][2])
+    for i, metric in enumerate(METRIC_VALUES)
+    for index, value in enumerate(METRIC_VALUES[metric])
+}
+BASE_SEEN = sum(1 << i for i, metric in enumerate(METRIC_VALUES) if metric in BASE_METRICS)
+
+
+def metric_mask(metric):
+    """Bits of a metric in the scalar packed int"""
+    _, _, shift, mask = METRIC_LAYOUT[metric]
+    return mask << shift
+
+
+def pack_string(vector):
+    """Parse and validate a "CVSS:4.0/..." string into a packed int in one pass"""
+    if not vector.startswith(VECTOR_PREFIX):
+        raise ValueError(f"Not a CVSS v4.0 vector: {vector!r}")
+    packed = seen = 0
+    for field in vector[len(VECTOR_PREFIX):].split("/"):
+        try:
+            bit, value = FIELD_BITS[field]
+        except KeyError:
+            raise ValueError(f"Invalid field {field!r} in {vector!r}") from None
+        if seen & bit:
+            raise ValueError(f"Duplicate metric in {vector!r}")
+        seen |= bit
+        packed |= value
+    if seen & BASE_SEEN != BASE_SEEN:
+        raise ValueError(f"Missing base metrics in {vector!r}")
+    return packed
+
+
+def pack_flags(flags):
+    """Packed int of a metric -> value dict such as the API's cvss_flags, absent metrics are X"""
+    packed = 0
+    for metric, value in flags.items():
+        field = f"{metric}:{value}"
+        if field not in FIELD_BITS:
+            raise ValueError(f"Invalid value {value!r} for {metric}")
+        packed |= FIELD_BITS[field][1]
+    missing = [metric for metric in BASE_METRICS if metric not in flags]
+    if missing:
+        raise ValueError(f"Missing base metrics {missing}")
+    return packed
+
+
+def unpack_value(packed, metric):
+    _, _, shift, mask = METRIC_LAYOUT[metric]
+    try:
+        return METRIC_VALUES[metric][(packed >> shift) & mask]
+    except IndexError:
+        raise ValueError(f"Invalid packed value for {metric}") from None
+
+
+def unpack_flags(packed, metrics=None):
+    """metric -> value dict of the given metrics, by default every metric that is not X"""
+    if metrics is not None:
+        return {metric: unpack_value(packed, metric) for metric in metrics}
+    flags = {metric: unpack_value(packed, metric) for metric in METRIC_VALUES}
+    return {metric: value for metric, value in flags.items() if value != "X"}
+
+
+def unpack_string(packed, full=False):
+    """Vector string of a packed int; full=True also writes X metrics, as NVD does"""
+    fields = [
+        f"{metric}:{value}" for metric in METRIC_VALUES
+        for value in (unpack_value(packed, metric),) if full or value != "X"
+    ]
+    return VECTOR_PREFIX + "/".join(fields)
+
+
+class CVSSVector:
+    """A CVSS v4.0 vector packed into one int (see METRIC_LAYOUT).
+
+    X and absent metrics pack the same, so vectors compare equal whether or
+    not they spell out X metrics; to_string(full=True) restores NVD's form.
+    """
+
+    __slots__ = ("packed",)
+
+    def __init__(self, packed):
+        self.packed = int(packed)
+
+    @classmethod
+    def from_string(cls, vector):
+        return cls(pack_string(vector))
+
+    @classmethod
+    def from_flags(cls, flags):
+        return cls(pack_flags(flags))
+
+    def to_string(self, full=False):
+        return unpack_string(self.packed, full)
+
+    def to_flags(self, metrics=None):
+        return unpack_flags(self.packed, metrics)
+
+    def __getitem__(self, metric):
+        return unpack_value(self.packed, metric)
+
+    def same_metrics(self, other, metrics):
+        """True when both vectors have the same values for the given metrics"""
+        mask = sum(metric_mask(metric) for metric in metrics)
+        return (self.packed ^ other.packed) & mask == 0
+
+    def score(self):
+        return float(score_packed(to_array([self]))[0])
+
+    def __eq__(self, other):
+        return isinstance(other, CVSSVector) and self.packed == other.packed
+
+    def __hash__(self):
+        return hash(self.packed)
+
+    def __repr__(self):
+        return f"CVSSVector({self.to_string()!r})"
+
+
+def to_array(vectors):
+    """Structured VECTOR_DTYPE array of CVSSVector objects or packed ints"""
+    packed = [v.packed if isinstance(v, CVSSVector) else int(v) for v in vectors]
+    data = b"".join(p.to_bytes(VECTOR_DTYPE.itemsize, "little") for p in packed)
+    return np.frombuffer(data, dtype=VECTOR_DTYPE).copy()
+
+
+def from_array(array):
+    return [CVSSVector(int.from_bytes(record.tobytes(), "little")) for record in array]
+
+
+def pack_vectors(vectors, errors="raise"):
+    """Structured array of vector strings, each distinct string parsed once.
+
+    With errors="mask" malformed vectors pack as zeros and are flagged in the
+    returned boolean array instead of raising ValueError.
+    """
+    packed = {}
+    valid = np.ones(len(vectors), dtype=bool)
+    ints = []
+    for i, vector in enumerate(vectors):
+        value = packed.get(vector)
+        if value is None:
+            try:
+                value = packed[vector] = pack_string(vector)
+            except (ValueError, AttributeError):
+                if errors != "mask":
+                    raise ValueError(f"Malformed vector {vector!r}") from None
+                value = -1
+                packed[vector] = value
+        if value < 0:
+            valid[i] = False
+            value = 0
+        ints.append(value)
+    array = to_array(ints)
+    return (array, valid) if errors == "mask" else array
+
+
+def unpack_vectors(array, full=False):
+    return [vector.to_string(full) for vector in from_array(array)]
+
+
+def metric_values(array, metric):
+    """Index of a metric's value (into METRIC_VALUES[metric]) for every vector"""
+    group, shift, _, mask = METRIC_LAYOUT[metric]
+    return ((array[group] >> shift) & mask).astype(np.uint8)
+
+
+def metric_equals(array, metric, value):
+    """Boolean mask of the vectors whose metric has the given value"""
+    return metric_values(array, metric) == METRIC_VALUES[metric].index(value)
+
+
+def vectors_equal(a, b, metrics=None):
+    """Elementwise equality, optionally restricted to some metrics"""
+    if metrics is None:
+        return np.logical_and.reduce([a[group] == b[group] for group in METRIC_GROUPS])
+    return np.logical_and.reduce([metric_values(a, m) == metric_values(b, m) for m in metrics])
+
+
+def unique_vectors(array):
+    """Distinct vectors in order of first appearance (hash based, no sorting)"""
+    duplicated = pd.DataFrame({group: array[group] for group in METRIC_GROUPS}).duplicated()
+    return array[~duplicated.to_numpy()]
+
+
+def _score_code_tables():
+    tables = {}
+    for metric in SCORE_METRICS:
+        values = METRIC_VALUES[metric]
+        base = [SCORE_VALUES[metric].index(SCORE_DEFAULTS[metric] if v == "X" else v) for v in values]
+        modified = None
+        if "M" + metric in METRIC_VALUES:
+            modified = [-1 if v == "X" else SCORE_VALUES[metric].index(v) for v in METRIC_VALUES["M" + metric]]
+        tables[metric] = (np.array(base, dtype=np.int8),
+                          None if modified is None else np.array(modified, dtype=np.int8))
+    return tables
+
+
+SCORE_CODE_TABLES = _score_code_tables()
+
+
+def score_packed(array):
+    """Base scores computed straight from a packed array"""
+    columns = []
+    for metric in SCORE_METRICS:
+        base, modified = SCORE_CODE_TABLES[metric]
+        codes = base[metric_values(array, metric)]
+        if modified is not None:
+            override = modified[metric_values(array, "M" + metric)]
+            codes = np.where(override >= 0, override, codes)
+        columns.append(codes)
+    return score_codes(np.stack(columns, axis=1))
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def benchmark(vectors):
+    """Compare string/dict handling of vectors with the packed representation"""
+    rows = []
+
+    dicts, t_dict = _timed(lambda: [parse_vector(v) for v in vectors])
+    ints, t_pack = _timed(lambda: [pack_string(v) for v in vectors])
+    rows.append(("parse + validate", t_dict, t_pack))
+
+    array, t_array = _timed(lambda: pack_vectors(vectors))
+    rows.append(("parse to array (dedup)", t_dict, t_array))
+
+    _, t_str_unique = _timed(lambda: len(set(vectors)))
+    _, t_arr_unique = _timed(lambda: len(unique_vectors(array)))
+    rows.append(("distinct vectors", t_str_unique, t_arr_unique))
+
+    _, t_str_filter = _timed(lambda: sum(d["AV"] == "N" and d["VC"] == "H" for d in dicts))
+    _, t_arr_filter = _timed(lambda: int((metric_equals(array, "AV", "N") & metric_equals(array, "VC", "H")).sum()))
+    rows.append(("filter AV:N & VC:H", t_str_filter, t_arr_filter))
+
+    string_bytes = sum(sys.getsizeof(v) for v in vectors)
+    dict_bytes = sum(sys.getsizeof(d) for d in dicts)
+
+    print("\n" + "=" * 62)
+    print(f"VECTOR HANDLING BENCHMARK ({len(vectors):,} vectors)")
+    print("=" * 62)
+    print(f"{'operation':<24}  {'strings s':>10}  {'packed s':>10}  {'speedup':>8}")
+    for name, t_string, t_packed in rows:
+        print(f"{name:<24}  {t_string:>10.4f}  {t_packed:>10.4f}  {t_string / max(t_packed, 1e-9):>7.1f}x")
+    print(f"{'memory (strings)':<24}  {string_bytes / 1e6:>9.1f}MB")
+    print(f"{'memory (dicts)':<24}  {dict_bytes / 1e6:>9.1f}MB")
+    print(f"{'memory (packed array)':<24}  {array.nbytes / 1e6:>9.1f}MB")
+    print("=" * 62)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark packed CVSS vectors against string handling")
+    parser.add_argument("--csv", default="nvd_cvss4_data.csv")
+    parser.add_argument("--size", type=int, default=200000, help="vectors to benchmark (dataset repeated)")
+    args = parser.parse_args()
+
+    vectors = load_dataset(args.csv, columns=["vectorString"])["vectorString"].dropna().tolist()
+    vectors = (vectors * (args.size // len(vectors) + 1))[:args.size]
+
+    array = pack_vectors(vectors)
+    assert unpack_vectors(array[:1000], full=True) == vectors[:1000], "round trip changed vectors"
+    benchmark(vectors)
+
+
+if __name__ == "__main__":
+    main()
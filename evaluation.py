@@ -0,0 +1,73 @@
+from batching import DEFAULT_MAX_BATCH_TOKENS
+from training_data import tokenizer_key
+
+
+def map_cvss_values_to_abbreviations(value):
+    """Map full CVSS values to their abbreviations"""
+    mapping = {
+        # Attack Vector
+        'NETWORK': 'N',
+        'ADJACENT': 'A', 
+        'LOCAL': 'L',
+        'PHYSICAL': 'P',
+        
+        # Attack Complexity
+        'LOW': 'L',
+        'HIGH': 'H',
+        
+        # Privileges Required
+        'NONE': 'N',
+        
+        # User Interaction
+        'REQUIRED': 'R',
+        
+        # Impact values
+        'MEDIUM': 'M',
+        
+        # Default for NOT_DEFINED and others
+        'NOT_DEFINED': 'X'
+    }
+    
+    return mapping.get(value, value)
+
+
+# Descriptions per forward pass during evaluation
+EVAL_BATCH_SIZE = 32
+
+METRIC_COLUMNS = {
+    "AV": "attackVector",
+    "AC": "attackComplexity",
+    "PR": "privilegesRequired",
+    "UI": "userInteraction",
+    "VC": "vulnConfidentialityImpact",
+    "VI": "vulnIntegrityImpact",
+    "VA": "vulnAvailabilityImpact",
+    "SC": "subConfidentialityImpact",
+    "SI": "subIntegrityImpact",
+    "SA": "subAvailabilityImpact"
+}
+
+
+class TokenizedCorpus:
+    """Description column tokenized once per distinct tokenizer and truncation, without padding"""
+
+    def __init__(self, descriptions):
+        self.descriptions = descriptions
+        self._encodings = {}
+
+    def encodings(self, tokenizer, truncation):
+        key = (tokenizer_key(tokenizer), truncation.tag)
+        if key not in self._encodings:
+            self._encodings[key] = truncation(tokenizer, self.descriptions)
+        return self._encodings[key]
+
+
+def predict_ids(loaded_model, corpus, indices, batch_size=EVAL_BATCH_SIZE, max_tokens=DEFAULT_MAX_BATCH_TOKENS):
+    """Run the model over corpus rows in length-bucketed batches, return predicted label ids.
+
+    Returns an array of shape (n,) for per-metric models and (n, n_metrics)
+    for the multi-head model, in the order of indices.
+    """
+    encodings = corpus.encodings(loaded_model.tokenizer, loaded_model.truncation)
+    features = [{key: values[i] for key, values in encodings.items()} for i in indices]
+    return loaded_model.predict_features(features, max_tokens, batch_size)
@@ -0,0 +1,171 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+
+from cvss_dataset import load_dataset
+from model_registry import ONNX_FILE, load_model, load_onnx_model
+from multihead import MULTIHEAD_NAME, is_multihead
+from train_models import CVSS_METRICS
+
+CHECK_CSV = "nvd_cvss4_data2.csv"
+OPSET_VERSION = 17
+
+
+class LogitsOnly(torch.nn.Module):
+    """Positional-input wrapper returning only the logits, as the ONNX exporter expects"""
+
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        outputs = self.model(**dict(zip(self.input_names, inputs)))
+        return outputs["logits"]
+
+
+def export_model(model_path):
+    """Export the checkpoint in model_path to model_path/model.onnx"""
+    loaded = load_model(model_path, "torch")
+    tokenizer = loaded.tokenizer
+    multihead = is_multihead(model_path)
+
+    sample = tokenizer(["export sample", "a slightly longer export sample"],
+                       return_tensors="pt", padding=True, truncation=True)
+    input_names = [name for name in tokenizer.model_input_names if name in sample]
+    if multihead:
+        output_names = [f"logits_{metric}" for metric in loaded.metrics]
+    else:
+        output_names = ["logits"]
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes.update({name: {0: "batch"} for name in output_names})
+
+    onnx_path = os.path.join(model_path, ONNX_FILE)
+    torch.onnx.export(
+        LogitsOnly(loaded.model, input_names),
+        tuple(sample[name] for name in input_names),
+        onnx_path,
+        input_names=input_names,
+        output_names=output_names,
+        dynamic_axes=dynamic_axes,
+        opset_version=OPSET_VERSION,
+        dynamo=False,
+    )
+    print(f"[INFO] Exported {model_path} -> {onnx_path} ({os.path.getsize(onnx_path) / 1e6:.1f} MB)")
+
+
+def load_check_descriptions(csv_path, limit):
+    df = load_dataset(csv_path, columns=["description"]).dropna()
+    return df["description"].tolist()[:limit]
+
+
+def batched(items, batch_size):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def collect_logits(loaded, descriptions, batch_size):
+    """Raw logits for every description, concatenated per output"""
+    outputs = []
+    for batch in batched(descriptions, batch_size):
+        inputs = loaded.tokenize(batch)
+        if loaded.tensor_type == "np":
+            logits = loaded.run(inputs)
+        else:
+            with torch.no_grad():
+                logits = loaded.model(**inputs)["logits"]
+            logits = [l.numpy() for l in (logits if isinstance(logits, tuple) else (logits,))]
+        outputs.append(logits)
+    return [np.concatenate([batch[i] for batch in outputs]) for i in range(len(outputs[0]))]
+
+
+def single_latency_ms(loaded, descriptions):
+    """Median latency of single-description predictions in milliseconds"""
+    timings = []
+    for description in descriptions:
+        inputs = loaded.tokenize([description])
+        start = time.perf_counter()
+        loaded.predict_ids(inputs)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def check_parity(model_path, descriptions, batch_size, latency_samples):
+    """Compare ONNX and torch outputs and latency of one model"""
+    torch_model = load_model(model_path, "torch")
+    onnx_model = load_onnx_model(model_path)
+
+    torch_logits = collect_logits(torch_model, descriptions, batch_size)
+    onnx_logits = collect_logits(onnx_model, descriptions, batch_size)
+
+    max_diff = max(float(np.max(np.abs(t - o))) for t, o in zip(torch_logits, onnx_logits))
+    agreement = float(np.mean([
+        np.mean(np.argmax(t, axis=1) == np.argmax(o, axis=1))
+        for t, o in zip(torch_logits, onnx_logits)
+    ]))
+
+    sample = descriptions[:latency_samples]
+    return {
+        "agreement": agreement,
+        "max_abs_diff": max_diff,
+        "torch_ms": single_latency_ms(torch_model, sample),
+        "onnx_ms": single_latency_ms(onnx_model, sample),
+    }
+
+
+def print_parity_report(report):
+    print("\n" + "=" * 66)
+    print("ONNX vs TORCH PARITY")
+    print("=" * 66)
+    print(f"{'model':>9}  {'agree':>7}  {'max|diff|':>10}  {'torch ms':>9}  {'onnx ms':>8}  {'speedup':>7}")
+    for name, row in report.items():
+        speedup = row["torch_ms"] / row["onnx_ms"] if row["onnx_ms"] > 0 else 0.0
+        print(f"{name:>9}  {row['agreement']:>7.4f}  {row['max_abs_diff']:>10.2e}  "
+              f"{row['torch_ms']:>9.2f}  {row['onnx_ms']:>8.2f}  {speedup:>6.2f}x")
+    print("=" * 66)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export CVSS models to ONNX and check parity with torch")
+    parser.add_argument("--models-dir", default="./cvss_models")
+    parser.add_argument("--metrics", nargs="+", default=CVSS_METRICS + [MULTIHEAD_NAME],
+                        help="model directories to export (default: every metric and the multi-head model)")
+    parser.add_argument("--check", action="store_true",
+                        help=f"compare ONNX and torch outputs and latency on {CHECK_CSV}")
+    parser.add_argument("--check-only", action="store_true", help="skip the export, only run the check")
+    parser.add_argument("--csv", default=CHECK_CSV)
+    parser.add_argument("--samples", type=int, default=500, help="descriptions used for the parity check")
+    parser.add_argument("--latency-samples", type=int, default=50,
+                        help="descriptions timed one at a time for the latency comparison")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    model_paths = [
+        f"{args.models_dir}/{name}" for name in args.metrics
+        if os.path.isdir(f"{args.models_dir}/{name}")
+    ]
+    if not model_paths:
+        print(f"[ERROR] No models found in {args.models_dir}")
+        return
+
+    if not args.check_only:
+        for model_path in model_paths:
+            export_model(model_path)
+
+    if args.check or args.check_only:
+        descriptions = load_check_descriptions(args.csv, args.samples)
+        report = {}
+        for model_path in model_paths:
+            print(f"[INFO] Checking {model_path}...")
+            report[os.path.basename(model_path)] = check_parity(
+                model_path, descriptions, args.batch_size, args.latency_samples
+            )
+        print_parity_report(report)
+
+
+if __name__ == "__main__":
+    main()
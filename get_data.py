@@ -1,100 +1,426 @@
-import requests
-import pandas as pd
+import argparse
+import asyncio
+import glob
+import json
+import os
+import shutil
 import time
+from datetime import datetime, timedelta, timezone
 
-API_KEY = "" 
-BASE_URL = "https://services.nvd.nist.gov/rest/json/cves/2.0"
-
-def fetch_nvd_data(start_index=1, results_per_page=2000, max_pages=1):
-    all_cves = []
-    for page in range(max_pages):
-        params = {
-            "startIndex": start_index + page * results_per_page,
-            "resultsPerPage": results_per_page,
-            "pubStartDate": "2024-08-04T00:00:00.000",
-            "pubEndDate": "2024-10-22T00:00:00.000",
-        }
-        headers = {"apiKey": API_KEY} if API_KEY else {}
+import aiohttp
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-        print(f"[INFO] Fetching page {page + 1}...")
-        response = requests.get(BASE_URL, headers=headers, params=params)
-        if response.status_code != 200:
-            print(f"[ERROR] Status {response.status_code}: {response.text}")
-            break
+API_KEY = os.environ.get("NVD_API_KEY", "")
+BASE_URL = os.environ.get("NVD_BASE_URL", "https://services.nvd.nist.gov/rest/json/cves/2.0")
 
-        data = response.json()
-        cves = data.get("vulnerabilities", [])
-        all_cves.extend(cves)
+# Output is <base>.parquet or <base>.csv depending on --format
+OUTPUT_BASE = "nvd_cvss4_data"
+# Harvest progress and the lastModified watermark of the last completed run
+STATE_PATH = "nvd_harvest_state.json"
+RESULTS_PER_PAGE = 2000
+# Publication window of the first (full) harvest
+PUB_START = "2024-08-04T00:00:00.000"
+PUB_END = "2024-10-22T00:00:00.000"
+# NVD rejects date ranges longer than 120 days
+MAX_RANGE = timedelta(days=120)
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.000"
 
-        # throttle requests to avoid hitting the API rate limit
-        time.sleep(3)
-    return all_cves
+# NVD public rate limits: requests per 30 seconds without / with an API key
+RATE_LIMIT_WINDOW = 30.0
+RATE_LIMIT = {False: 5, True: 50}
+DEFAULT_CONCURRENCY = 4
+MAX_RETRIES = 6
+RETRY_STATUSES = (403, 429, 500, 502, 503, 504)
 
 
-def process_cves_to_dataframe(cves_raw):
-    """
-    DataFrame containing processed CVE data with CVSSv4 metrics
+class TokenBucket:
+    """Async token bucket: at most `rate` requests per `per` seconds, bursts of `capacity`"""
+
+    def __init__(self, rate, per, capacity=1):
+        self.interval = per / rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * self.interval)
+
+
+def parse_date(value):
+    return datetime.strptime(value, DATE_FORMAT)
+
+
+def format_date(value):
+    return value.strftime(DATE_FORMAT)
+
+
+def split_range(start, end):
+    """[start, end] as consecutive windows no longer than MAX_RANGE"""
+    start, end = parse_date(start), parse_date(end)
+    windows = []
+    while start < end:
+        window_end = min(start + MAX_RANGE, end)
+        windows.append([format_date(start), format_date(window_end)])
+        start = window_end
+    return windows
+
+
+def load_state(path):
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {"watermark": None, "run": None}
+
+
+def save_state(state, path):
+    """Atomic write, so an interrupted run never leaves a truncated checkpoint"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class NvdHarvester:
+    """Fetches the pages of NVD CVE API windows concurrently.
+
+    Pages are handed to on_page(page_json) as they arrive, and every completed
+    startIndex is checkpointed in the state file so an interrupted run resumes
+    where it stopped.
     """
-    processed = []
 
+    def __init__(self, base_url=BASE_URL, api_key=API_KEY, concurrency=DEFAULT_CONCURRENCY,
+                 rate=None, results_per_page=RESULTS_PER_PAGE, state_path=STATE_PATH):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.rate = rate or RATE_LIMIT[bool(api_key)]
+        self.results_per_page = results_per_page
+        self.state_path = state_path
+        self.requests = 0
+        self.retries = 0
+
+    async def fetch_page(self, session, bucket, params):
+        headers = {"apiKey": self.api_key} if self.api_key else {}
+        for attempt in range(MAX_RETRIES):
+            await bucket.acquire()
+            self.requests += 1
+            try:
+                async with session.get(self.base_url, params=params, headers=headers) as response:
+                    if response.status == 200:
+                        return await response.json()
+                    if response.status not in RETRY_STATUSES:
+                        text = await response.text()
+                        raise RuntimeError(f"Status {response.status}: {text[:200]}")
+                    retry_after = response.headers.get("Retry-After")
+                    delay = float(retry_after) if retry_after else min(2 ** attempt, 60)
+                    print(f"[INFO] Status {response.status} at startIndex {params['startIndex']}, retrying in {delay:.0f}s")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                delay = min(2 ** attempt, 60)
+                print(f"[INFO] {type(e).__name__} at startIndex {params['startIndex']}, retrying in {delay:.0f}s")
+            self.retries += 1
+            await asyncio.sleep(delay)
+        raise RuntimeError(f"Giving up on startIndex {params['startIndex']} after {MAX_RETRIES} attempts")
+
+    async def harvest_window(self, session, bucket, state, on_page, max_pages=None):
+        run = state["run"]
+        start, end = run["windows"][run["window_index"]]
+        prefix = "lastMod" if run["mode"] == "incremental" else "pub"
+        base_params = {
+            f"{prefix}StartDate": start,
+            f"{prefix}EndDate": end,
+            "resultsPerPage": self.results_per_page,
+        }
+
+        def completed(page_json):
+            on_page(page_json)
+            run["completed"].append(page_json.get("startIndex", 0))
+            save_state(state, self.state_path)
+
+        # The first page tells how many pages the window has
+        if run["total"] is None:
+            first = await self.fetch_page(session, bucket, {**base_params, "startIndex": 0})
+            run["total"] = first.get("totalResults", 0)
+            completed({**first, "startIndex": 0})
+        print(f"[INFO] Window {start} -> {end}: {run['total']} CVEs")
+
+        starts = range(0, run["total"], self.results_per_page)
+        if max_pages is not None:
+            starts = starts[:max_pages]
+        done = set(run["completed"])
+        pending = [s for s in starts if s not in done]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(start_index):
+            async with semaphore:
+                page = await self.fetch_page(session, bucket, {**base_params, "startIndex": start_index})
+            completed({**page, "startIndex": start_index})
+
+        await asyncio.gather(*(fetch(s) for s in pending))
+
+    async def run(self, state, on_page, max_pages=None):
+        """Finish every window of state["run"]; the watermark moves in finish_run once the output is written"""
+        bucket = TokenBucket(self.rate, RATE_LIMIT_WINDOW)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=120)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            run = state["run"]
+            while run["window_index"] < len(run["windows"]):
+                await self.harvest_window(session, bucket, state, on_page, max_pages)
+                run["window_index"] += 1
+                run["total"] = None
+                run["completed"] = []
+                save_state(state, self.state_path)
+
+
+def finish_run(state, path):
+    """Advance the watermark to the start of the completed run and forget the run"""
+    state["watermark"] = state["run"]["started"]
+    state["run"] = None
+    save_state(state, path)
+
+
+def plan_run(state, full=False, pub_start=PUB_START, pub_end=PUB_END):
+    """Start a new run: incremental from the watermark, or a full harvest of the publication window"""
+    started = format_date(datetime.now(timezone.utc))
+    if state.get("watermark") and not full:
+        mode, windows = "incremental", split_range(state["watermark"], started)
+    else:
+        mode, windows = "full", split_range(pub_start, pub_end)
+    state["run"] = {"mode": mode, "started": started, "windows": windows,
+                    "window_index": 0, "total": None, "completed": []}
+    return state
+
+
+# cvssData fields copied into the dataset, in column order
+CVSS_FIELDS = [
+    "baseScore", "baseSeverity", "vectorString",
+    "attackVector", "attackComplexity", "attackRequirements", "privilegesRequired", "userInteraction",
+    "vulnConfidentialityImpact", "vulnIntegrityImpact", "vulnAvailabilityImpact",
+    "subConfidentialityImpact", "subIntegrityImpact", "subAvailabilityImpact",
+    "exploitMaturity", "confidentialityRequirement", "integrityRequirement", "availabilityRequirement",
+    "modifiedAttackVector", "modifiedAttackComplexity", "modifiedAttackRequirements",
+    "modifiedPrivilegesRequired", "modifiedUserInteraction",
+    "modifiedVulnConfidentialityImpact", "modifiedVulnIntegrityImpact", "modifiedVulnAvailabilityImpact",
+    "modifiedSubConfidentialityImpact", "modifiedSubIntegrityImpact", "modifiedSubAvailabilityImpact",
+    "Safety", "Automatable", "Recovery", "valueDensity", "vulnerabilityResponseEffort", "providerUrgency",
+]
+SCHEMA = pa.schema(
+    [("cve_id", pa.string()), ("description", pa.string())]
+    + [(field, pa.float64() if field == "baseScore" else pa.string()) for field in CVSS_FIELDS]
+)
+ROW_GROUP_SIZE = 10000
+
+
+def flatten_page(cves_raw):
+    """Arrow table of the CVEs with CVSS v4.0 data in one API page"""
+    columns = {name: [] for name in SCHEMA.names}
     for item in cves_raw:
         cve = item.get("cve", {})
-        id = cve.get("id")
-        description = cve.get("descriptions", [{}])[0].get("value", "")
-        metrics = cve.get("metrics", {})
-        cvss_v4 = metrics.get("cvssMetricV40", [{}])[0] if "cvssMetricV40" in metrics else None
-
+        cvss_v4 = cve.get("metrics", {}).get("cvssMetricV40")
         # Skip items without CVSSv4 data
         if not cvss_v4:
             continue
+        data = cvss_v4[0].get("cvssData", {})
+        columns["cve_id"].append(cve.get("id"))
+        columns["description"].append((cve.get("descriptions") or [{}])[0].get("value", ""))
+        for field in CVSS_FIELDS:
+            columns[field].append(data.get(field))
+    return pa.table(columns, schema=SCHEMA)
 
-        processed.append({
-            "cve_id": id,
-            "description": description,
-            "baseScore": cvss_v4.get("cvssData", {}).get("baseScore"),
-            "baseSeverity": cvss_v4.get("cvssData", {}).get("baseSeverity"),
-            "vectorString": cvss_v4.get("cvssData", {}).get("vectorString"),
-            "attackVector": cvss_v4.get("cvssData", {}).get("attackVector"),
-            "attackComplexity": cvss_v4.get("cvssData", {}).get("attackComplexity"),
-            "attackRequirements": cvss_v4.get("cvssData", {}).get("attackRequirements"),
-            "privilegesRequired": cvss_v4.get("cvssData", {}).get("privilegesRequired"),
-            "userInteraction": cvss_v4.get("cvssData", {}).get("userInteraction"),
-            "vulnConfidentialityImpact": cvss_v4.get("cvssData", {}).get("vulnConfidentialityImpact"),
-            "vulnIntegrityImpact": cvss_v4.get("cvssData", {}).get("vulnIntegrityImpact"),
-            "vulnAvailabilityImpact": cvss_v4.get("cvssData", {}).get("vulnAvailabilityImpact"),
-            "subConfidentialityImpact": cvss_v4.get("cvssData", {}).get("subConfidentialityImpact"),
-            "subIntegrityImpact": cvss_v4.get("cvssData", {}).get("subIntegrityImpact"),
-            "subAvailabilityImpact": cvss_v4.get("cvssData", {}).get("subAvailabilityImpact"),
-            "exploitMaturity": cvss_v4.get("cvssData", {}).get("exploitMaturity"),
-            "confidentialityRequirement": cvss_v4.get("cvssData", {}).get("confidentialityRequirement"),
-            "integrityRequirement": cvss_v4.get("cvssData", {}).get("integrityRequirement"),
-            "availabilityRequirement": cvss_v4.get("cvssData", {}).get("availabilityRequirement"),
-            "modifiedAttackVector": cvss_v4.get("cvssData", {}).get("modifiedAttackVector"),
-            "modifiedAttackComplexity": cvss_v4.get("cvssData", {}).get("modifiedAttackComplexity"),
-            "modifiedAttackRequirements": cvss_v4.get("cvssData", {}).get("modifiedAttackRequirements"),
-            "modifiedPrivilegesRequired": cvss_v4.get("cvssData", {}).get("modifiedPrivilegesRequired"),
-            "modifiedUserInteraction": cvss_v4.get("cvssData", {}).get("modifiedUserInteraction"),
-            "modifiedVulnConfidentialityImpact": cvss_v4.get("cvssData", {}).get("modifiedVulnConfidentialityImpact"),
-            "modifiedVulnIntegrityImpact": cvss_v4.get("cvssData", {}).get("modifiedVulnIntegrityImpact"),
-            "modifiedVulnAvailabilityImpact": cvss_v4.get("cvssData", {}).get("modifiedVulnAvailabilityImpact"),
-            "modifiedSubConfidentialityImpact": cvss_v4.get("cvssData", {}).get("modifiedSubConfidentialityImpact"),
-            "modifiedSubIntegrityImpact": cvss_v4.get("cvssData", {}).get("modifiedSubIntegrityImpact"),
-            "modifiedSubAvailabilityImpact": cvss_v4.get("cvssData", {}).get("modifiedSubAvailabilityImpact"),
-            "Safety": cvss_v4.get("cvssData", {}).get("Safety"),
-            "Automatable": cvss_v4.get("cvssData", {}).get("Automatable"),
-            "Recovery": cvss_v4.get("cvssData", {}).get("Recovery"),
-            "valueDensity": cvss_v4.get("cvssData", {}).get("valueDensity"),
-            "vulnerabilityResponseEffort": cvss_v4.get("cvssData", {}).get("vulnerabilityResponseEffort"),
-            "providerUrgency": cvss_v4.get("cvssData", {}).get("providerUrgency"),
-        })
-
-    df = pd.DataFrame(processed)
-    return df
 
-if __name__ == "__main__":
-    raw_cves = fetch_nvd_data(max_pages=5) 
-    df_cves = process_cves_to_dataframe(raw_cves)
+def process_cves_to_dataframe(cves_raw):
+    """
+    DataFrame containing processed CVE data with CVSSv4 metrics
+    """
+    return flatten_page(cves_raw).to_pandas()
+
+
+class ParquetSink:
+    """Writes tables as Parquet row groups of about row_group_size rows"""
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        self.row_group_size = row_group_size
+        self._writer = pq.ParquetWriter(path, SCHEMA, compression="zstd")
+        self._buffer = []
+        self._rows = 0
+
+    def write(self, table):
+        self._buffer.append(table)
+        self._rows += table.num_rows
+        if self._rows >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(pa.concat_tables(self._buffer), row_group_size=self.row_group_size)
+        self._buffer, self._rows = [], 0
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+class CsvSink:
+    """Appends tables to a CSV file, in the format of the original export"""
+
+    def __init__(self, path):
+        self.path = path
+        self._header = True
+
+    def write(self, table):
+        table.to_pandas().to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        if self._header:
+            self.write(SCHEMA.empty_table())
+
+
+SINKS = {"parquet": ParquetSink, "csv": lambda path, row_group_size=ROW_GROUP_SIZE: CsvSink(path)}
+
+
+def iter_existing(path, fmt, batch_size=ROW_GROUP_SIZE):
+    """Previous output in batches of at most batch_size rows"""
+    if not os.path.exists(path):
+        return
+    if fmt == "parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield pa.Table.from_batches([batch]).cast(SCHEMA)
+    else:
+        string_columns = {name: str for name in SCHEMA.names if name != "baseScore"}
+        for chunk in pd.read_csv(path, chunksize=batch_size, dtype=string_columns):
+            yield pa.Table.from_pandas(chunk[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+
+
+class PageStager:
+    """Stores each flattened page as a small Parquet file until the run completes.
 
-    print(df_cves.head())
-    df_cves.to_csv("nvd_cvss4_data.csv", index=False)
-    print("[INFO] Dane zapisane do pliku 'nvd_cvss4_data.csv'")
+    A page file is written before its startIndex is checkpointed, so a resumed
+    run finds every page it already counted as done.
+    """
+
+    def __init__(self, parts_dir):
+        self.parts_dir = parts_dir
+        self.rows = 0
+
+    def write(self, window_index, start_index, table):
+        os.makedirs(self.parts_dir, exist_ok=True)
+        path = os.path.join(self.parts_dir, f"{window_index:04d}-{start_index:09d}.parquet")
+        pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self.rows += table.num_rows
+
+    def parts(self):
+        return sorted(glob.glob(os.path.join(self.parts_dir, "*.parquet")))
+
+    def clear(self):
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+
+def write_output(stager, path, fmt, keep_existing, row_group_size=ROW_GROUP_SIZE):
+    """Merge the previous output and the staged pages into path, one batch at a time.
+
+    The newest row of every CVE wins, so CVEs modified since the last run
+    replace their old rows. Only the CVE ids are held in memory.
+    """
+    parts = stager.parts()
+    latest = {}
+    for part_index, part in enumerate(parts):
+        for row_index, cve_id in enumerate(pq.read_table(part, columns=["cve_id"])["cve_id"].to_pylist()):
+            latest[cve_id] = (part_index, row_index)
+
+    tmp_path = path + ".tmp"
+    sink = SINKS[fmt](tmp_path, row_group_size)
+    rows = 0
+    if keep_existing:
+        for table in iter_existing(path, fmt, row_group_size):
+            keep = [cve_id not in latest for cve_id in table["cve_id"].to_pylist()]
+            table = table.filter(pa.array(keep, type=pa.bool_()))
+            sink.write(table)
+            rows += table.num_rows
+    for part_index, part in enumerate(parts):
+        table = pq.read_table(part).cast(SCHEMA)
+        keep = [latest[cve_id] == (part_index, row_index)
+                for row_index, cve_id in enumerate(table["cve_id"].to_pylist())]
+        table = table.filter(pa.array(keep, type=pa.bool_()))
+        sink.write(table)
+        rows += table.num_rows
+    sink.close()
+    os.replace(tmp_path, path)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Harvest CVSS v4.0 CVEs from the NVD API")
+    parser.add_argument("--format", choices=list(SINKS), default="parquet")
+    parser.add_argument("--output", default=None, help=f"default: {OUTPUT_BASE}.<format>")
+    parser.add_argument("--state", default=STATE_PATH, help="checkpoint / watermark file")
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and harvest the publication window")
+    parser.add_argument("--pub-start", default=PUB_START)
+    parser.add_argument("--pub-end", default=PUB_END)
+    parser.add_argument("--max-pages", type=int, default=None, help="pages per window (default: all)")
+    parser.add_argument("--results-per-page", type=int, default=RESULTS_PER_PAGE)
+    parser.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=None,
+                        help=f"requests per {RATE_LIMIT_WINDOW:.0f}s (default: NVD limit for the API key)")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--save-pages", default=None, help="also store raw pages here (for nvd_stub_server.py)")
+    args = parser.parse_args()
+    output = args.output or f"{OUTPUT_BASE}.{args.format}"
+
+    state = load_state(args.state)
+    stager = PageStager(output + ".parts")
+    if state.get("run"):
+        run = state["run"]
+        if run["window_index"] < len(run["windows"]):
+            print(f"[INFO] Resuming {run['mode']} harvest at window {run['window_index'] + 1}/{len(run['windows'])}")
+        else:
+            print(f"[INFO] Every window of the {run['mode']} harvest is done, merging its staged pages")
+    else:
+        state = plan_run(state, args.full, args.pub_start, args.pub_end)
+        stager.clear()
+        print(f"[INFO] Starting {state['run']['mode']} harvest, {len(state['run']['windows'])} window(s)")
+    save_state(state, args.state)
+    mode = state["run"]["mode"]
+
+    if args.save_pages:
+        os.makedirs(args.save_pages, exist_ok=True)
+
+    def on_page(page):
+        window_index = state["run"]["window_index"]
+        if args.save_pages:
+            name = f"{state['run']['started'].replace(':', '')}_{window_index}_{page['startIndex']}.json"
+            with open(os.path.join(args.save_pages, name), "w") as f:
+                json.dump(page, f)
+        stager.write(window_index, page["startIndex"], flatten_page(page.get("vulnerabilities", [])))
+
+    harvester = NvdHarvester(args.base_url, API_KEY, args.concurrency, args.rate,
+                             args.results_per_page, args.state)
+    start = time.perf_counter()
+    asyncio.run(harvester.run(state, on_page, args.max_pages))
+
+    # Until the merge succeeds the run stays in the state file, so a failed
+    # merge is retried from the staged pages on the next start
+    total = write_output(stager, output, args.format, keep_existing=mode == "incremental",
+                         row_group_size=args.row_group_size)
+    finish_run(state, args.state)
+    stager.clear()
+    print(f"[INFO] {harvester.requests} requests ({harvester.retries} retries) in {time.perf_counter() - start:.1f}s, "
+          f"{stager.rows} CVSS v4.0 rows harvested")
+    print(f"[INFO] Dane zapisane do pliku '{output}' ({total} CVE), watermark {state['watermark']}")
+
+
+if __name__ == "__main__":
+    main()
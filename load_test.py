@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+import aiohttp
+import numpy as np
+
+from cvss_dataset import load_dataset
+
+DEFAULT_URL = "http://127.0.0.1:3000"
+
+
+async def client(session, url, descriptions, deadline, latencies, statuses, timeout):
+    headers = {"X-Request-Timeout": str(timeout)} if timeout else {}
+    while time.monotonic() < deadline:
+        payload = {"description": random.choice(descriptions)}
+        start = time.perf_counter()
+        try:
+            async with session.post(url, json=payload, headers=headers) as response:
+                await response.read()
+                status = response.status
+                if status in (429, 503) and "Retry-After" not in response.headers:
+                    status = f"{status} (no Retry-After)"
+        except aiohttp.ClientError as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - start
+        statuses[status] += 1
+        if status == 200:
+            latencies.append(elapsed)
+        elif status in (429, 503):
+            # Rejected clients back off briefly instead of hammering the server
+            await asyncio.sleep(0.05)
+
+
+async def run_level(url, descriptions, concurrency, duration, timeout):
+    latencies = []
+    statuses = Counter()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*(
+            client(session, url, descriptions, deadline, latencies, statuses, timeout)
+            for _ in range(concurrency)
+        ))
+    return latencies, statuses
+
+
+def print_row(concurrency, duration, latencies, statuses):
+    ok = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    p50, p95, p99 = np.percentile(ok, [50, 95, 99])
+    rejected = sum(count for status, count in statuses.items() if status != 200)
+    print(f"{concurrency:>6}  {len(latencies) / duration:>7.1f}  {p50:>8.1f}  {p95:>8.1f}  {p99:>8.1f}  "
+          f"{rejected:>8}  {dict(statuses)}")
+
+
+async def main_async(args):
+    df = load_dataset(args.csv, columns=["description"])
+    descriptions = df["description"].dropna().tolist()
+    url = args.url.rstrip("/") + args.endpoint
+
+    print("\n" + "=" * 88)
+    print(f"LOAD TEST {url} ({args.duration:g}s per level)")
+    print("=" * 88)
+    print(f"{'conc':>6}  {'ok/s':>7}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'rejected':>8}  statuses")
+    for concurrency in args.concurrency:
+        latencies, statuses = await run_level(url, descriptions, concurrency, args.duration, args.timeout)
+        print_row(concurrency, args.duration, latencies, statuses)
+    print("=" * 88)
+    async with aiohttp.ClientSession() as session:
+        async with session.get(args.url.rstrip("/") + "/api/serving/stats") as response:
+            if response.status == 200:
+                print("[INFO] Server:", (await response.json())["serving"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API latency and rejections under increasing load")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--endpoint", default="/api/predict")
+    parser.add_argument("--csv", default="nvd_cvss4_data2.csv", help="descriptions sent at random")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64, 256],
+                        help="concurrent clients of each level")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per level")
+    parser.add_argument("--timeout", type=float, default=None, help="sent as X-Request-Timeout")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
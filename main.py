@@ -1,51 +1,440 @@
-from flask import Flask, request, jsonify
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 import os
+import json
+import threading
+import time
+from contextlib import ExitStack
 from flask_cors import CORS
+import model_registry
+from model_registry import MULTIHEAD_NAME, SERVED_METRICS, registry
+from batching import MicroBatcher
+from prediction_cache import PredictionCache
+from retrieval import DEFAULT_THRESHOLD as RETRIEVAL_THRESHOLD, IndexCache
+from cascade import LinearTierCache
+from concurrent.futures import Future, as_completed
+import cvss4
+import telemetry
+from cvss_vector import CVSSVector, score_packed, to_array
 app = Flask(__name__)
 CORS(app)
 
-def load_label_map(path):
-    label_map = {}
-    with open(path, "r") as f:
-        for line in f:
-            k, v = line.strip().split(":")
-            label_map[int(v)] = k
-    return label_map
+# Default models directory, e.g. ./cvss_models_int8 for the quantized variant
+MODELS_DIR = os.environ.get("CVSS_MODELS_DIR", "./cvss_models")
 
-def predict_metric(description, metric_name, models_dir="./cvss_models"):
-    model_path = f"{models_dir}/{metric_name}"
-    
-    # Load model and tokenizer
-    model = AutoModelForSequenceClassification.from_pretrained(model_path)
-    tokenizer = AutoTokenizer.from_pretrained(model_path)
-    model.eval()
+# Serve every metric from the shared-encoder model (train_models.py --multitask)
+USE_MULTIHEAD = os.environ.get("CVSS_MULTIHEAD", "0") == "1"
 
-    # Load label mapping
-    label_map = load_label_map(f"{model_path}/label_map.txt")
-    
-    # Tokenization
-    inputs = tokenizer(description, return_tensors="pt", truncation=True, padding=True)
-    
-    # Prediction
-    with torch.no_grad():
-        outputs = model(**inputs)
-        predicted_id = torch.argmax(outputs.logits, dim=1).item()
+CVSS_METRICS = SERVED_METRICS
+
+# Largest number of descriptions accepted by /api/predict/batch
+MAX_BATCH_DESCRIPTIONS = 1000
+
+# Base metrics served only when the models dir has a model for them, assumed
+# (and listed in the response's assumed_metrics) when scoring vectors without them
+SCORE_DEFAULTS = {"AT": "N"}
+
+# Answer confident metrics with the linear models in <models_dir>/cascade (0 = always the transformer)
+USE_CASCADE = os.environ.get("CVSS_CASCADE", "1") == "1"
+
+# Load and warm up every served model at startup (0 = load on first request)
+PRELOAD = os.environ.get("CVSS_PRELOAD", "1") == "1"
+
+# Content types of /api/predict/stream (Server-Sent Events or newline-delimited JSON)
+STREAM_FORMATS = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+# Latency histograms and counters served at /api/metrics/prometheus
+prometheus = telemetry.MetricsRegistry()
+REQUEST_SECONDS = prometheus.histogram(
+    "cvss_request_duration_seconds", "Time spent in API request handlers", ("endpoint", "method", "status"))
+PREDICTION_SECONDS = prometheus.histogram(
+    "cvss_prediction_seconds", "Time from queueing a description for a model to its result", ("model", "cache"))
+STAGE_SECONDS = prometheus.histogram(
+    "cvss_stage_seconds", "Time per stage: load, tokenize, forward and decode per batch, score per request",
+    ("stage", "model"))
+QUEUE_WAIT_SECONDS = prometheus.histogram(
+    "cvss_queue_wait_seconds", "Time a description waited in the micro-batcher", ("model",))
+BATCH_SIZE = prometheus.histogram(
+    "cvss_batch_size", "Descriptions per model batch", ("model",), telemetry.BATCH_SIZE_BUCKETS)
+CACHE_LOOKUPS = prometheus.counter("cvss_cache_lookups", "Prediction cache lookups", ("model", "result"))
+CASCADE_DECISIONS = prometheus.counter(
+    "cvss_cascade_decisions", "Metric predictions answered by the linear model or escalated to the transformer",
+    ("metric", "tier"))
+RETRIEVAL_LOOKUPS = prometheus.counter(
+    "cvss_retrieval_lookups", "Descriptions matched (hit) or not (miss) to a known CVE", ("result",))
+
+def run_batch(key, descriptions):
+    """Run one padded batch through the model for key = (models_dir, metric)"""
+    models_dir, metric = key
+    # Model, tokenizer and label map are loaded once and kept in the registry
+    model = registry.get(models_dir, metric)
+    if metric == MULTIHEAD_NAME:
+        return model.predict_all(descriptions)
+    return model.predict(descriptions)
+
+def record_batch(key, queue_waits, stages):
+    """Record queue waits, batch size and stage times of one micro-batch"""
+    model_name = key[1]
+    BATCH_SIZE.observe(len(queue_waits), model=model_name)
+    for wait in queue_waits:
+        QUEUE_WAIT_SECONDS.observe(wait, model=model_name)
+    for name, ms in stages.items():
+        STAGE_SECONDS.observe(ms / 1000, stage=name, model=model_name)
+
+# Concurrent requests for the same model are merged into one forward pass
+scheduler = MicroBatcher(run_batch, on_batch=record_batch)
+
+# Predictions keyed by description hash and model fingerprint (checkpoint files and backend)
+cache = PredictionCache()
+
+# Hashed n-gram index of known CVEs per models directory (retrieval.py build)
+retrieval_indexes = IndexCache()
+
+# Linear first tier of the cascade per models directory (cascade.py)
+linear_tiers = LinearTierCache()
+
+def submit_cached(key, descriptions):
+    """Queue descriptions for a model, answering from the prediction cache where possible"""
+    models_dir, model_name = key
+    try:
+        fingerprint = cache.fingerprint(f"{models_dir}/{model_name}", registry.backend) if cache.enabled else None
+    except OSError:
+        # Missing model, let the scheduler report the error
+        fingerprint = None
+
+    start = time.perf_counter()
+    futures = []
+    misses = []
+    for description in descriptions:
+        value = cache.get(fingerprint, description) if fingerprint else None
+        if value is None:
+            misses.append(description)
+            futures.append(None)
+        else:
+            future = Future()
+            future.timings = {"cache": "hit"}
+            future.set_result(value)
+            futures.append(future)
+
+    if fingerprint:
+        hits = len(descriptions) - len(misses)
+        CACHE_LOOKUPS.inc(hits, model=model_name, result="hit")
+        CACHE_LOOKUPS.inc(len(misses), model=model_name, result="miss")
+    for future in futures:
+        if future is not None:
+            PREDICTION_SECONDS.observe(time.perf_counter() - start, model=model_name, cache="hit")
+
+    if misses:
+        queued = iter(scheduler.submit_many(key, misses))
+        for idx, future in enumerate(futures):
+            if future is None:
+                future = next(queued)
+                future.add_done_callback(_latency_callback(model_name, start))
+                if fingerprint:
+                    future.add_done_callback(_cache_callback(fingerprint, descriptions[idx]))
+                futures[idx] = future
+    return futures
+
+def _latency_callback(model_name, start):
+    def record(future):
+        PREDICTION_SECONDS.observe(time.perf_counter() - start, model=model_name, cache="miss")
+    return record
+
+def future_timings(future):
+    """Queue wait, batch size and stage times of a completed prediction future"""
+    return {"cache": "miss", **getattr(future, "timings", {})}
+
+def _cache_callback(fingerprint, description):
+    def store(future):
+        if future.exception() is None:
+            cache.put(fingerprint, description, future.result())
+    return store
+
+def submit_metric(metric_name, descriptions, models_dir=MODELS_DIR):
+    """Futures of one metric: the linear model where it is confident, the transformer for the rest.
+
+    With the multi-head model every description goes to the transformer
+    and each future holds the dict of all metrics.
+    """
+    key = _model_key(metric_name, models_dir)
+    tier = linear_tiers.get(models_dir) if USE_CASCADE and not USE_MULTIHEAD else None
+    if tier is None or metric_name not in tier:
+        return submit_cached(key, descriptions)
+
+    with telemetry.stage("linear"):
+        answers = tier.gate(metric_name, descriptions)
+    futures = []
+    escalated = []
+    for idx, (label, confidence) in enumerate(answers):
+        if label is None:
+            escalated.append(idx)
+            futures.append(None)
+            continue
+        future = Future()
+        future.timings = {"cache": "skipped", "cascade": "linear", "confidence": round(confidence, 4)}
+        future.set_result(label)
+        futures.append(future)
+    CASCADE_DECISIONS.inc(len(descriptions) - len(escalated), metric=metric_name, tier="linear")
+    CASCADE_DECISIONS.inc(len(escalated), metric=metric_name, tier="transformer")
+
+    if escalated:
+        for idx, future in zip(escalated, submit_cached(key, [descriptions[idx] for idx in escalated])):
+            futures[idx] = future
+    return futures
+
+def _model_key(metric_name, models_dir):
+    return (models_dir, MULTIHEAD_NAME if USE_MULTIHEAD else metric_name)
+
+def _metric_value(result, metric_name):
+    return result[metric_name] if USE_MULTIHEAD else result
+
+def served_metrics(models_dir=MODELS_DIR):
+    """CVSS_METRICS plus AT when models_dir has a model or head for it, in vector order"""
+    return model_registry.served_metrics(models_dir, USE_MULTIHEAD)
+
+def served_models():
+    """Model names loaded from MODELS_DIR, one per metric or the shared encoder"""
+    return [MULTIHEAD_NAME] if USE_MULTIHEAD else served_metrics(MODELS_DIR)
 
-    return label_map[predicted_id]
+# Background preload of this process, started once by start_preload()
+_preload_thread = None
+_preload_lock = threading.Lock()
 
-CVSS_METRICS = ["AV", "AC", "PR", "UI", "VC", "VI", "VA", "SC", "SI", "SA"]
+def start_preload():
+    """Load and warm up the served models in the background, progress is at /api/ready.
 
-def predict_all_metrics(description, models_dir="./cvss_models"):
-    results = {}
-    for metric in CVSS_METRICS:
+    Runs once per process; later calls return the running thread.
+    """
+    global _preload_thread
+    with _preload_lock:
+        if _preload_thread is None:
+            _preload_thread = threading.Thread(target=registry.preload, args=(MODELS_DIR, served_models()),
+                                               name="model-preload", daemon=True)
+            _preload_thread.start()
+        return _preload_thread
+
+def predict_metric(description, metric_name, models_dir=MODELS_DIR, timings=None):
+    """Predict one metric; timings, if a dict, receives the model's timings"""
+    key = _model_key(metric_name, models_dir)
+    future = submit_metric(metric_name, [description], models_dir)[0]
+    result = future.result()
+    if timings is not None:
+        timings[key[1]] = future_timings(future)
+    return _metric_value(result, metric_name)
+
+def find_known_cves(descriptions, models_dir=MODELS_DIR):
+    """Nearest known CVE within RETRIEVAL_THRESHOLD of each description, or None"""
+    index = retrieval_indexes.get(models_dir) if RETRIEVAL_THRESHOLD > 0 else None
+    if index is None:
+        return [None] * len(descriptions)
+    with telemetry.stage("retrieve"):
+        matches = index.lookup(descriptions, RETRIEVAL_THRESHOLD)
+    hits = sum(match is not None for match in matches)
+    RETRIEVAL_LOOKUPS.inc(hits, result="hit")
+    RETRIEVAL_LOOKUPS.inc(len(matches) - hits, result="miss")
+    return matches
+
+def known_flags(match, metrics):
+    """Served metrics of a retrieved CVE (indexes built before AT was stored lack it)"""
+    return {metric: match['cvss_flags'][metric] for metric in metrics if metric in match['cvss_flags']}
+
+def predict_all_metrics_batch(descriptions, models_dir=MODELS_DIR, timings=None, paths=None):
+    """Predict all metrics for a list of descriptions, one dict per description.
+
+    A description within RETRIEVAL_THRESHOLD of a known CVE gets that CVE's
+    metrics without running the classifiers. timings, if a list, receives
+    one {model: timings} dict per description, and paths one dict saying
+    which path answered it.
+    """
+    matches = find_known_cves(descriptions, models_dir)
+    misses = [description for description, match in zip(descriptions, matches) if match is None]
+    miss_timings = [] if timings is not None else None
+    classified = iter(classify_all_metrics(misses, models_dir, miss_timings) if misses else ())
+    classified_timings = iter(miss_timings or ())
+
+    results = []
+    metrics = served_metrics(models_dir)
+    for match in matches:
+        if match is None:
+            results.append(next(classified))
+            path = {'prediction_path': 'model'}
+            model_timings = next(classified_timings, {})
+        else:
+            results.append(known_flags(match, metrics))
+            path = {
+                'prediction_path': 'retrieval',
+                'nearest_cve': {'cve_id': match['cve_id'], 'similarity': match['similarity']},
+            }
+            model_timings = {}
+        if timings is not None:
+            timings.append(model_timings)
+        if paths is not None:
+            paths.append(path)
+    return results
+
+def classify_all_metrics(descriptions, models_dir=MODELS_DIR, timings=None):
+    """Run every metric classifier over a list of descriptions, one dict per description.
+
+    timings, if a list, receives one {model: timings} dict per description.
+    """
+    metrics = served_metrics(models_dir)
+    if USE_MULTIHEAD:
+        # One forward pass for all metrics
+        futures = submit_cached(_model_key(None, models_dir), descriptions)
+        results = [
+            {metric: future.result()[metric] for metric in metrics}
+            for future in futures
+        ]
+        if timings is not None:
+            timings.extend({MULTIHEAD_NAME: future_timings(future)} for future in futures)
+        return results
+
+    # Queue every metric first so they are batched together with other requests
+    futures = {
+        metric: submit_metric(metric, descriptions, models_dir)
+        for metric in metrics
+    }
+    results = [{} for _ in descriptions]
+    for metric, metric_futures in futures.items():
+        for result, future in zip(results, metric_futures):
+            try:
+                result[metric] = future.result()
+            except Exception as e:
+                result[metric] = f"Error: {e}"
+    if timings is not None:
+        timings.extend(
+            {metric: future_timings(futures[metric][idx]) for metric in metrics}
+            for idx in range(len(descriptions))
+        )
+    return results
+
+def predict_all_metrics(description, models_dir=MODELS_DIR, timings=None, path=None):
+    per_description = [] if timings is not None else None
+    paths = [] if path is not None else None
+    result = predict_all_metrics_batch([description], models_dir, per_description, paths)[0]
+    if timings is not None:
+        timings.update(per_description[0])
+    if path is not None:
+        path.update(paths[0])
+    return result
+
+def iter_metric_predictions(description, models_dir=MODELS_DIR, path=None):
+    """Yield (metric, value, error) for every metric as soon as its prediction completes.
+
+    Like predict_all_metrics, a description within RETRIEVAL_THRESHOLD of a
+    known CVE gets that CVE's metrics; path, if a dict, receives which path
+    answered it.
+    """
+    match = find_known_cves([description], models_dir)[0]
+    if match is not None:
+        if path is not None:
+            path.update({
+                'prediction_path': 'retrieval',
+                'nearest_cve': {'cve_id': match['cve_id'], 'similarity': match['similarity']},
+            })
+        for metric, value in known_flags(match, served_metrics(models_dir)).items():
+            yield metric, value, None
+        return
+    if path is not None:
+        path['prediction_path'] = 'model'
+
+    metrics = served_metrics(models_dir)
+    if USE_MULTIHEAD:
+        # One forward pass predicts every metric, they all complete together
+        future = submit_cached(_model_key(None, models_dir), [description])[0]
         try:
-            value = predict_metric(description, metric, models_dir)
-            results[metric] = value
+            result = future.result()
         except Exception as e:
-            results[metric] = f"Error: {e}"
-    return results
+            for metric in metrics:
+                yield metric, None, str(e)
+            return
+        for metric in metrics:
+            yield metric, result[metric], None
+        return
+
+    futures = {
+        submit_metric(metric, [description], models_dir)[0]: metric
+        for metric in metrics
+    }
+    for future in as_completed(futures):
+        try:
+            yield futures[future], future.result(), None
+        except Exception as e:
+            yield futures[future], None, str(e)
+
+def format_event(stream_format, event, payload):
+    if stream_format == "ndjson":
+        return json.dumps({"event": event, **payload}) + "\n"
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def score_predictions(results):
+    """CVSS v4.0 vector, base score, severity and assumed metrics of every prediction dict"""
+    with telemetry.stage("score"):
+        scored = [
+            {'cvss_vector': None, 'base_score': None, 'severity': None,
+             'assumed_metrics': {metric: value for metric, value in SCORE_DEFAULTS.items() if metric not in flags}}
+            for flags in results
+        ]
+        valid, vectors = [], []
+        for i, flags in enumerate(results):
+            try:
+                vector = CVSSVector.from_flags({**SCORE_DEFAULTS, **flags})
+            except ValueError:
+                # A metric failed to predict or is outside CVSS v4.0
+                continue
+            scored[i]['cvss_vector'] = vector.to_string()
+            valid.append(i)
+            vectors.append(vector)
+
+        if valid:
+            scores = score_packed(to_array(vectors))
+            for i, score, severity in zip(valid, scores, cvss4.severities(scores)):
+                scored[i]['base_score'] = float(score)
+                scored[i]['severity'] = str(severity)
+    return scored
+
+def wants_timings(data):
+    """Whether the request asked for a timings block ({"timings": true} or ?timings=1)"""
+    return bool(data.get('timings')) or request.args.get('timings') in ('1', 'true')
+
+def request_timings(models=None):
+    """Timings block of a response: handler time so far, request stages and per-model timings"""
+    timings = {
+        'total_ms': round((time.perf_counter() - g.request_start) * 1000, 2),
+        **{f"{name}_ms": round(ms, 2) for name, ms in g.stages.items()},
+    }
+    if models is not None:
+        timings['models'] = models
+    return timings
+
+@app.before_request
+def ensure_preload():
+    # Servers that never run __main__ or serve.py's startup hook (gunicorn,
+    # flask run, waitress, the test client) start preloading on their first request
+    if PRELOAD and _preload_thread is None:
+        start_preload()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # Stages run on the request thread (scoring) are collected per request
+    g.telemetry = ExitStack()
+    g.stages = g.telemetry.enter_context(telemetry.collect_stages())
+
+@app.after_request
+def record_request(response):
+    # Streaming responses are timed until their first byte
+    if 'request_start' in g:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start,
+                                endpoint=endpoint, method=request.method, status=str(response.status_code))
+        for name, ms in g.stages.items():
+            STAGE_SECONDS.observe(ms / 1000, stage=name, model='api')
+    return response
+
+@app.teardown_request
+def stop_request_timer(exc):
+    if 'telemetry' in g:
+        g.telemetry.close()
 
 @app.route('/api/predict', methods=['POST'])
 def predict_cvss():
@@ -58,28 +447,150 @@ def predict_cvss():
         
         description = data['description']
         
+        if not isinstance(description, str):
+            return jsonify({'error': 'Description must be a string'}), 400
+        
         if not description.strip():
             return jsonify({'error': 'Description cannot be empty'}), 400
         
         # Get models directory from request or use default
-        models_dir = data.get('models_dir', './cvss_models')
+        models_dir = data.get('models_dir', MODELS_DIR)
         
         # Check if models directory exists
         if not os.path.exists(models_dir):
             return jsonify({'error': f'Models directory not found: {models_dir}'}), 404
         
         # Predict all metrics
-        results = predict_all_metrics(description, models_dir)
-        
-        return jsonify({
+        timings = {} if wants_timings(data) else None
+        path = {}
+        results = predict_all_metrics(description, models_dir, timings, path)
+
+        response = {
             'description': description,
             'cvss_flags': results,
+            **score_predictions([results])[0],
+            **path,
             'status': 'success'
-        })
+        }
+        if timings is not None:
+            response['timings'] = request_timings(timings)
+        return jsonify(response)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/predict/stream', methods=['POST'])
+def predict_cvss_stream():
+    """Stream each metric as it is predicted, then a summary like /api/predict returns"""
+    try:
+        data = request.get_json()
+
+        if not data or 'description' not in data:
+            return jsonify({'error': 'Description is required'}), 400
+
+        description = data['description']
+
+        if not isinstance(description, str):
+            return jsonify({'error': 'Description must be a string'}), 400
+
+        if not description.strip():
+            return jsonify({'error': 'Description cannot be empty'}), 400
+
+        models_dir = data.get('models_dir', MODELS_DIR)
+
+        if not os.path.exists(models_dir):
+            return jsonify({'error': f'Models directory not found: {models_dir}'}), 404
+
+        # ?format=ndjson or an NDJSON Accept header, Server-Sent Events otherwise
+        stream_format = request.args.get('format')
+        if stream_format is None:
+            stream_format = "ndjson" if STREAM_FORMATS["ndjson"] in request.headers.get('Accept', '') else "sse"
+        if stream_format not in STREAM_FORMATS:
+            return jsonify({'error': f'Invalid format. Valid formats: {list(STREAM_FORMATS)}'}), 400
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    def generate():
+        results = {}
+        path = {}
+        try:
+            for metric, value, error in iter_metric_predictions(description, models_dir, path):
+                if error is None:
+                    results[metric] = value
+                    yield format_event(stream_format, 'metric', {'metric': metric, 'value': value})
+                else:
+                    results[metric] = f"Error: {error}"
+                    yield format_event(stream_format, 'metric', {'metric': metric, 'error': error})
+
+            flags = {metric: results[metric] for metric in cvss4.BASE_METRICS if metric in results}
+            yield format_event(stream_format, 'summary', {
+                'description': description,
+                'cvss_flags': flags,
+                **score_predictions([flags])[0],
+                **path,
+                'status': 'success'
+            })
+        except Exception as e:
+            yield format_event(stream_format, 'error', {'error': str(e)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=STREAM_FORMATS[stream_format],
+        # Keep proxies from buffering the events
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_cvss_batch():
+    try:
+        data = request.get_json()
+
+        if not data or 'descriptions' not in data:
+            return jsonify({'error': 'Descriptions are required'}), 400
+
+        descriptions = data['descriptions']
+
+        if not isinstance(descriptions, list) or not descriptions:
+            return jsonify({'error': 'Descriptions must be a non-empty list'}), 400
+
+        if len(descriptions) > MAX_BATCH_DESCRIPTIONS:
+            return jsonify({'error': f'At most {MAX_BATCH_DESCRIPTIONS} descriptions per request'}), 400
+
+        if any(not isinstance(d, str) or not d.strip() for d in descriptions):
+            return jsonify({'error': 'Descriptions cannot be empty'}), 400
+
+        # Get models directory from request or use default
+        models_dir = data.get('models_dir', MODELS_DIR)
+
+        # Check if models directory exists
+        if not os.path.exists(models_dir):
+            return jsonify({'error': f'Models directory not found: {models_dir}'}), 404
+
+        timings = [] if wants_timings(data) else None
+        paths = []
+        results = predict_all_metrics_batch(descriptions, models_dir, timings, paths)
+        scores = score_predictions(results)
+
+        items = [
+            {'description': description, 'cvss_flags': flags, **score, **path}
+            for description, flags, score, path in zip(descriptions, results, scores, paths)
+        ]
+        if timings is not None:
+            for item, models in zip(items, timings):
+                item['timings'] = {'models': models}
+        response = {
+            'results': items,
+            'count': len(results),
+            'status': 'success'
+        }
+        if timings is not None:
+            response['timings'] = request_timings()
+        return jsonify(response)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/predict/metric', methods=['POST'])
 def predict_single_metric():
     try:
@@ -92,28 +603,36 @@ def predict_single_metric():
         description = data['description']
         metric = data['metric']
         
+        if not isinstance(description, str):
+            return jsonify({'error': 'Description must be a string'}), 400
+        
         if not description.strip():
             return jsonify({'error': 'Description cannot be empty'}), 400
         
-        if metric not in CVSS_METRICS:
-            return jsonify({'error': f'Invalid metric. Valid metrics: {CVSS_METRICS}'}), 400
-        
         # Get models directory from request or use default
-        models_dir = data.get('models_dir', './cvss_models')
+        models_dir = data.get('models_dir', MODELS_DIR)
         
         # Check if models directory exists
         if not os.path.exists(models_dir):
             return jsonify({'error': f'Models directory not found: {models_dir}'}), 404
         
-        # Predict single metric
-        result = predict_metric(description, metric, models_dir)
+        metrics = served_metrics(models_dir)
+        if metric not in metrics:
+            return jsonify({'error': f'Invalid metric. Valid metrics: {metrics}'}), 400
         
-        return jsonify({
+        # Predict single metric
+        timings = {} if wants_timings(data) else None
+        result = predict_metric(description, metric, models_dir, timings)
+
+        response = {
             'description': description,
             'metric': metric,
             'value': result,
             'status': 'success'
-        })
+        }
+        if timings is not None:
+            response['timings'] = request_timings(timings)
+        return jsonify(response)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -132,6 +651,11 @@ def get_all_metrics_info():
             "description": "Describes the conditions beyond the attacker's control",
             "values": ["L", "H"]
         },
+        "AT": {
+            "name": "Attack Requirements",
+            "description": "Captures the deployment and execution conditions that enable the attack",
+            "values": ["N", "P"]
+        },
         "PR": {
             "name": "Privileges Required",
             "description": "Describes the level of privileges an attacker must possess",
@@ -173,9 +697,10 @@ def get_all_metrics_info():
             "values": ["N", "L", "H"]
         }
     }
+    metrics_info = {metric: metrics_info[metric] for metric in served_metrics(MODELS_DIR)}
     
     return jsonify({
-        "total_metrics": len(CVSS_METRICS),
+        "total_metrics": len(metrics_info),
         "metrics": metrics_info,
         "status": "success"
     })
@@ -189,9 +714,33 @@ def predict_all_cvss_metrics():
 def health_check():
     return jsonify({'status': 'healthy', 'message': 'CVSS Prediction API is running'})
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Per-model load state and timings, 503 until every served model is warmed up"""
+    ready, models = registry.readiness(MODELS_DIR, served_models())
+    # Without preloading models load on first use, nothing to wait for
+    ready = ready or not PRELOAD
+    return jsonify({
+        'ready': ready,
+        'models_dir': MODELS_DIR,
+        'models': models,
+        'status': 'ready' if ready else 'loading'
+    }), 200 if ready else 503
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({'cache': cache.stats(), 'status': 'success'})
+
+@app.route('/api/metrics/prometheus', methods=['GET'])
+def get_prometheus_metrics():
+    return Response(prometheus.render(), content_type=telemetry.PROMETHEUS_CONTENT_TYPE)
+
 @app.route('/api/metrics', methods=['GET'])
 def get_available_metrics():
-    return jsonify({'available_metrics': CVSS_METRICS})
+    return jsonify({'available_metrics': served_metrics(MODELS_DIR)})
 
 if __name__ == '__main__':
+    # The debug reloader re-runs this script; only its serving child loads models
+    if PRELOAD and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_preload()
     app.run(debug=True, host='0.0.0.0', port=3000)
\ No newline at end of file
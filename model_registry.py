@@ -0,0 +1,475 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from batching import DEFAULT_MAX_BATCH_TOKENS, length_batches
+from telemetry import stage
+from truncation import Truncation
+
+# torch and transformers are imported where models are loaded and run, so
+# importing this module (main.py routes, predict_flags.py --help) stays fast
+
+DEFAULT_MODELS_DIR = "./cvss_models"
+
+# Subdirectory of the models dir holding the shared-encoder model (multihead.py)
+MULTIHEAD_NAME = "multihead"
+# Head labels of a shared-encoder checkpoint, its presence marks one
+HEADS_FILE = "heads.json"
+
+# Metrics served from every models directory, and those served only when the
+# directory has a model (or the multi-head model a head) for them
+SERVED_METRICS = ["AV", "AC", "PR", "UI", "VC", "VI", "VA", "SC", "SI", "SA"]
+OPTIONAL_METRICS = ("AT",)
+VECTOR_ORDER = ("AV", "AC", "AT", "PR", "UI", "VC", "VI", "VA", "SC", "SI", "SA")
+
+# Id of the training run that produced a checkpoint, written by train_models.py
+TRAINING_RUN_FILE = "training_run.json"
+# Checkpoints saved before training run ids existed are identified by their weights
+WEIGHT_FILES = ("model.safetensors", "pytorch_model.bin")
+
+# Short description run once through every preloaded model
+WARMUP_TEXT = "A remote attacker could exploit this vulnerability to execute arbitrary code."
+
+# Inference backend: "torch" (eager PyTorch) or "onnx" (ONNX Runtime)
+BACKENDS = ("torch", "onnx")
+DEFAULT_BACKEND = os.environ.get("CVSS_BACKEND", "torch")
+# Exported graph file inside a model directory
+ONNX_FILE = "model.onnx"
+
+# Memory cap for resident models in MB (0 = no limit)
+DEFAULT_MAX_MEMORY_MB = int(os.environ.get("CVSS_MODEL_CACHE_MB", "0"))
+# How often (in seconds) an entry re-checks its checkpoint files on disk
+DEFAULT_CHECK_INTERVAL = float(os.environ.get("CVSS_MODEL_CHECK_INTERVAL", "2"))
+
+
+def load_label_map(path):
+    """Load label mapping from file"""
+    label_map = {}
+    with open(path, "r") as f:
+        for line in f:
+            k, v = line.strip().split(":")
+            label_map[int(v)] = k
+    return label_map
+
+
+def is_multihead(model_path):
+    return os.path.exists(os.path.join(model_path, HEADS_FILE))
+
+
+def served_metrics(models_dir, multihead=False):
+    """SERVED_METRICS plus every OPTIONAL_METRICS metric models_dir has a model or head for, in vector order"""
+    if multihead:
+        heads_path = os.path.join(models_dir, MULTIHEAD_NAME, HEADS_FILE)
+        if not os.path.exists(heads_path):
+            return list(SERVED_METRICS)
+        with open(heads_path, "r") as f:
+            modelled = json.load(f)["metric_labels"]
+    else:
+        modelled = [metric for metric in OPTIONAL_METRICS if os.path.isdir(os.path.join(models_dir, metric))]
+    return [metric for metric in VECTOR_ORDER if metric in SERVED_METRICS or metric in modelled]
+
+
+def write_training_run(model_path):
+    """Give the checkpoint in model_path a new training run id"""
+    run_id = uuid.uuid4().hex
+    with open(os.path.join(model_path, TRAINING_RUN_FILE), "w") as f:
+        json.dump({"run_id": run_id, "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S")}, f, indent=2)
+    return run_id
+
+
+def training_run_id(model_path):
+    """Training run id of a checkpoint, its weight files' size and mtime without one, None if absent"""
+    try:
+        with open(os.path.join(model_path, TRAINING_RUN_FILE), "r") as f:
+            return json.load(f)["run_id"]
+    except (OSError, ValueError, KeyError):
+        pass
+    weights = []
+    for name in WEIGHT_FILES:
+        path = os.path.join(model_path, name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            weights.append(f"{name}:{st.st_size}:{st.st_mtime_ns}")
+    return ",".join(weights) or None
+
+
+def checkpoint_fingerprint(model_path):
+    """Return (name, size, mtime) of every file in a checkpoint directory.
+
+    Trainer checkpoint-* subdirectories are ignored, only the files that
+    from_pretrained actually reads are taken into account.
+    """
+    entries = []
+    for name in sorted(os.listdir(model_path)):
+        full_path = os.path.join(model_path, name)
+        if os.path.isfile(full_path):
+            st = os.stat(full_path)
+            entries.append((name, st.st_size, st.st_mtime_ns))
+    return tuple(entries)
+
+
+def model_nbytes(model):
+    """Approximate resident size of a model (parameters + buffers)"""
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class LoadedModel:
+    """Model, tokenizer and label map of one metric kept in memory"""
+
+    # Tensor type the tokenizer should return for this backend
+    tensor_type = "pt"
+
+    def __init__(self, model, tokenizer, label_map, fingerprint, load_time, truncation=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.truncation = truncation or Truncation.for_tokenizer(tokenizer)
+        self.label_map = label_map
+        self.fingerprint = fingerprint
+        self.load_time = load_time
+        self.nbytes = model_nbytes(model)
+        self.last_checked = time.monotonic()
+
+    def tokenize(self, descriptions):
+        return self.tokenizer.pad(self.truncation(self.tokenizer, descriptions), return_tensors=self.tensor_type)
+
+    def encode(self, descriptions):
+        """Features of every description (one dict each), truncated as in training and unpadded"""
+        with stage("tokenize"):
+            encodings = self.truncation(self.tokenizer, descriptions)
+        return [dict(zip(encodings.keys(), values)) for values in zip(*encodings.values())]
+
+    def predict_features(self, features, max_tokens=DEFAULT_MAX_BATCH_TOKENS, max_batch_size=None):
+        """Predicted label ids of unpadded features, in input order.
+
+        Features are run in length-bucketed batches under a padded token
+        budget (see batching.length_batches), padded to each batch's longest.
+        """
+        predicted = None
+        lengths = [len(feature["input_ids"]) for feature in features]
+        for batch in length_batches(lengths, max_tokens, max_batch_size):
+            with stage("tokenize"):
+                inputs = self.tokenizer.pad([features[i] for i in batch], return_tensors=self.tensor_type)
+            with stage("forward"):
+                ids = self.predict_ids(inputs)
+            if predicted is None:
+                predicted = np.empty((len(features),) + ids.shape[1:], dtype=ids.dtype)
+            predicted[batch] = ids
+        if predicted is None:
+            return np.empty((0,), dtype=np.int64)
+        return predicted
+
+    def predict_ids(self, inputs):
+        """Predicted label ids for a tokenized batch"""
+        import torch
+
+        with torch.no_grad():
+            outputs = self.model(**inputs)
+            return torch.argmax(outputs.logits, dim=1).numpy()
+
+    def predict(self, descriptions):
+        """Predict labels for a list of descriptions"""
+        predicted_ids = self.predict_features(self.encode(descriptions))
+        with stage("decode"):
+            return [self.label_map[int(i)] for i in predicted_ids]
+
+    def warm_up(self, text=WARMUP_TEXT):
+        """Run one inference so the first request does not pay for allocation"""
+        self.predict_features(self.encode([text]))
+
+
+class MultiHeadLoadedModel(LoadedModel):
+    """Shared-encoder model predicting every metric in one forward pass.
+
+    label_map maps each metric to its own {id: label} mapping and
+    predict_ids returns an (n, n_metrics) array.
+    """
+
+    @property
+    def metrics(self):
+        return self.model.metrics
+
+    def predict_ids(self, inputs):
+        import torch
+
+        with torch.no_grad():
+            outputs = self.model(**inputs)
+            return torch.stack([torch.argmax(logits, dim=1) for logits in outputs["logits"]], dim=1).numpy()
+
+    def predict_all(self, descriptions):
+        """Predict every metric for a list of descriptions, one dict per description"""
+        predicted_ids = self.predict_features(self.encode(descriptions))
+        with stage("decode"):
+            return [
+                {metric: self.label_map[metric][int(ids[col])] for col, metric in enumerate(self.metrics)}
+                for ids in predicted_ids
+            ]
+
+    def predict(self, descriptions, metric):
+        return [result[metric] for result in self.predict_all(descriptions)]
+
+
+class OnnxLoadedModel(LoadedModel):
+    """Exported ONNX graph (export_onnx.py) served with ONNX Runtime"""
+
+    tensor_type = "np"
+
+    def __init__(self, session, tokenizer, label_map, fingerprint, load_time, nbytes, truncation=None):
+        self.model = session
+        self.tokenizer = tokenizer
+        self.truncation = truncation or Truncation.for_tokenizer(tokenizer)
+        self.label_map = label_map
+        self.fingerprint = fingerprint
+        self.load_time = load_time
+        self.nbytes = nbytes
+        self.last_checked = time.monotonic()
+        self.input_names = [i.name for i in session.get_inputs()]
+
+    def run(self, inputs):
+        feed = {name: np.asarray(inputs[name], dtype=np.int64) for name in self.input_names}
+        return self.model.run(None, feed)
+
+    def predict_ids(self, inputs):
+        return np.argmax(self.run(inputs)[0], axis=1)
+
+
+class OnnxMultiHeadLoadedModel(OnnxLoadedModel, MultiHeadLoadedModel):
+    """Exported multi-head graph, one logits output per metric"""
+
+    def __init__(self, session, tokenizer, label_map, fingerprint, load_time, nbytes, truncation=None):
+        super().__init__(session, tokenizer, label_map, fingerprint, load_time, nbytes, truncation)
+        self.output_metrics = list(label_map)
+
+    @property
+    def metrics(self):
+        return self.output_metrics
+
+    def predict_ids(self, inputs):
+        return np.stack([np.argmax(logits, axis=1) for logits in self.run(inputs)], axis=1)
+
+
+def load_onnx_model(model_path):
+    """Load an exported model.onnx with the tokenizer and label map next to it"""
+    import onnxruntime
+    from transformers import AutoTokenizer
+
+    start = time.perf_counter()
+    fingerprint = checkpoint_fingerprint(model_path)
+    onnx_path = os.path.join(model_path, ONNX_FILE)
+    if not os.path.exists(onnx_path):
+        raise FileNotFoundError(f"{onnx_path} not found, export it with export_onnx.py")
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    truncation = Truncation.load(model_path, tokenizer)
+    nbytes = os.path.getsize(onnx_path)
+
+    if is_multihead(model_path):
+        with open(os.path.join(model_path, HEADS_FILE), "r") as f:
+            metric_labels = json.load(f)["metric_labels"]
+        label_map = {metric: dict(enumerate(labels)) for metric, labels in metric_labels.items()}
+        return OnnxMultiHeadLoadedModel(session, tokenizer, label_map, fingerprint,
+                                        time.perf_counter() - start, nbytes, truncation)
+
+    label_map = load_label_map(f"{model_path}/label_map.txt")
+    return OnnxLoadedModel(session, tokenizer, label_map, fingerprint, time.perf_counter() - start, nbytes,
+                           truncation)
+
+
+def load_model(model_path, backend="torch"):
+    """Load model, tokenizer and label map from a checkpoint directory"""
+    if backend == "onnx":
+        return load_onnx_model(model_path)
+
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    from multihead import MultiHeadCVSSModel
+    from quantization import QUANTIZED_WEIGHTS, is_quantized, load_quantized
+
+    start = time.perf_counter()
+    fingerprint = checkpoint_fingerprint(model_path)
+    quantized = is_quantized(model_path)
+    if quantized:
+        # INT8 variant written by compress_models.py
+        model = load_quantized(model_path)
+    elif is_multihead(model_path):
+        model = MultiHeadCVSSModel.from_pretrained(model_path)
+    else:
+        # model.safetensors is memory-mapped and copied straight into the
+        # weights, without a randomly initialized model first
+        model = AutoModelForSequenceClassification.from_pretrained(model_path, low_cpu_mem_usage=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    truncation = Truncation.load(model_path, tokenizer)
+    model.eval()
+
+    if is_multihead(model_path):
+        label_map = {
+            metric: dict(enumerate(labels))
+            for metric, labels in model.metric_labels.items()
+        }
+        entry = MultiHeadLoadedModel(model, tokenizer, label_map, fingerprint, time.perf_counter() - start,
+                                     truncation)
+    else:
+        label_map = load_label_map(f"{model_path}/label_map.txt")
+        entry = LoadedModel(model, tokenizer, label_map, fingerprint, time.perf_counter() - start, truncation)
+
+    if quantized:
+        # Packed INT8 weights are not parameters, count the saved weights instead
+        entry.nbytes = max(entry.nbytes, os.path.getsize(os.path.join(model_path, QUANTIZED_WEIGHTS)))
+    return entry
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models keyed by (models_dir, metric).
+
+    Models are loaded on first use and stay resident. When max_memory_mb is
+    set, the least recently used models are evicted to stay under the cap.
+    Entries are reloaded when the checkpoint files on disk change. The
+    backend decides whether the PyTorch checkpoint or its exported ONNX
+    graph is served.
+    """
+
+    def __init__(self, max_memory_mb=DEFAULT_MAX_MEMORY_MB, check_interval=DEFAULT_CHECK_INTERVAL,
+                 backend=DEFAULT_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+        self.backend = backend
+        self.max_bytes = int(max_memory_mb * 1024 * 1024)
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        # Preload state of every warmed-up model, see warm_up()
+        self._status = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def _key(self, models_dir, metric):
+        return (os.path.abspath(models_dir), metric, self.backend)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _is_stale(self, entry, model_path):
+        now = time.monotonic()
+        if now - entry.last_checked < self.check_interval:
+            return False
+        entry.last_checked = now
+        try:
+            return checkpoint_fingerprint(model_path) != entry.fingerprint
+        except OSError:
+            return False
+
+    def get(self, models_dir, metric):
+        """Return the LoadedModel for a metric, loading it if needed"""
+        key = self._key(models_dir, metric)
+        model_path = f"{models_dir}/{metric}"
+
+        entry = self._lookup(key)
+        if entry is not None and not self._is_stale(entry, model_path):
+            return entry
+
+        with self._key_lock(key):
+            # Another thread may have loaded it while we were waiting
+            current = self._lookup(key)
+            if current is not None and current is not entry:
+                return current
+
+            with stage("load"):
+                entry = load_model(model_path, self.backend)
+            with self._lock:
+                self.loads += 1
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                self._evict_over_cap()
+            return entry
+
+    def warm_up(self, models_dir, metric):
+        """Load a model and run one inference on it, recording its preload state.
+
+        The state ("loading", "ready" or "failed") is reported by readiness(),
+        together with the load and warm-up times.
+        """
+        key = self._key(models_dir, metric)
+        status = {"state": "loading", "load_ms": None, "warmup_ms": None, "error": None}
+        with self._lock:
+            self._status[key] = status
+        try:
+            entry = self.get(models_dir, metric)
+            status["load_ms"] = round(entry.load_time * 1000, 1)
+            start = time.perf_counter()
+            entry.warm_up()
+            status["warmup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            status["state"] = "ready"
+        except Exception as e:
+            status["error"] = str(e)
+            status["state"] = "failed"
+        return status
+
+    def preload(self, models_dir, metrics):
+        """Warm up every metric in turn, the ones not reached yet are reported as pending"""
+        with self._lock:
+            for metric in metrics:
+                self._status.setdefault(self._key(models_dir, metric), {"state": "pending"})
+        for metric in metrics:
+            self.warm_up(models_dir, metric)
+
+    def readiness(self, models_dir, metrics):
+        """Preload state of each metric and whether all of them are ready"""
+        with self._lock:
+            states = {
+                metric: dict(self._status.get(self._key(models_dir, metric), {"state": "pending"}))
+                for metric in metrics
+            }
+        return all(s["state"] == "ready" for s in states.values()), states
+
+    def _evict_over_cap(self):
+        if self.max_bytes <= 0:
+            return
+        # Always keep the most recently used entry, even if it alone exceeds the cap
+        while len(self._entries) > 1 and self.memory_bytes() > self.max_bytes:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def memory_bytes(self):
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def evict(self, models_dir, metric):
+        with self._lock:
+            self._entries.pop(self._key(models_dir, metric), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "loaded": [f"{d}/{m}" for d, m, _ in self._entries],
+                "memory_mb": round(self.memory_bytes() / (1024 * 1024), 1),
+                "max_memory_mb": round(self.max_bytes / (1024 * 1024), 1),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+# Shared by main.py, predict_flags.py and test_accuracy.py
+registry = ModelRegistry()
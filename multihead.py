@@ -0,0 +1,161 @@
+import json
+import os
+
+import numpy as np
+import torch
+from torch import nn
+from transformers import AutoModel, TrainingArguments, Trainer
+
+# Checkpoint layout constants live in model_registry, which loads without torch
+from model_registry import HEADS_FILE, MULTIHEAD_NAME, is_multihead
+
+HEADS_WEIGHTS = "heads.pt"
+# Label id for metrics missing in a row, skipped by the loss
+IGNORE_INDEX = -100
+
+
+class MultiHeadCVSSModel(nn.Module):
+    """Shared encoder with one classification head per CVSS metric.
+
+    One forward pass returns logits for every metric, instead of running a
+    separate fine-tuned encoder for each of them.
+    """
+
+    def __init__(self, encoder, metric_labels):
+        super().__init__()
+        self.encoder = encoder
+        self.metric_labels = dict(metric_labels)
+        self.metrics = list(self.metric_labels)
+        hidden_size = encoder.config.hidden_size
+        dropout = getattr(encoder.config, "hidden_dropout_prob", 0.1)
+        self.dropout = nn.Dropout(dropout)
+        self.heads = nn.ModuleDict({
+            metric: nn.Linear(hidden_size, len(labels))
+            for metric, labels in self.metric_labels.items()
+        })
+
+    def forward(self, input_ids, attention_mask=None, token_type_ids=None, labels=None):
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if token_type_ids is not None:
+            inputs["token_type_ids"] = token_type_ids
+        outputs = self.encoder(**inputs)
+        # Same pooling as *ForSequenceClassification: pooler if present, [CLS] otherwise
+        pooled = getattr(outputs, "pooler_output", None)
+        if pooled is None:
+            pooled = outputs.last_hidden_state[:, 0]
+        pooled = self.dropout(pooled)
+
+        logits = tuple(self.heads[metric](pooled) for metric in self.metrics)
+
+        result = {"logits": logits}
+        if labels is not None:
+            loss_fn = nn.CrossEntropyLoss(ignore_index=IGNORE_INDEX)
+            losses = []
+            for idx, metric_logits in enumerate(logits):
+                metric_labels = labels[:, idx]
+                if (metric_labels != IGNORE_INDEX).any():
+                    losses.append(loss_fn(metric_logits, metric_labels))
+            if losses:
+                result["loss"] = torch.stack(losses).mean()
+            else:
+                # No labelled metric in the batch: a zero loss that still belongs to the graph
+                result["loss"] = sum(metric_logits.sum() for metric_logits in logits) * 0.0
+        return result
+
+    def save_pretrained(self, save_path):
+        os.makedirs(save_path, exist_ok=True)
+        self.encoder.save_pretrained(save_path)
+        torch.save(
+            {"dropout": self.dropout.p, "heads": self.heads.state_dict()},
+            os.path.join(save_path, HEADS_WEIGHTS),
+        )
+        with open(os.path.join(save_path, HEADS_FILE), "w") as f:
+            json.dump({"metric_labels": self.metric_labels}, f, indent=2)
+
+    @classmethod
+    def from_pretrained(cls, model_path):
+        with open(os.path.join(model_path, HEADS_FILE), "r") as f:
+            metric_labels = json.load(f)["metric_labels"]
+        encoder = AutoModel.from_pretrained(model_path, low_cpu_mem_usage=True)
+        model = cls(encoder, metric_labels)
+        state = torch.load(os.path.join(model_path, HEADS_WEIGHTS), map_location="cpu", mmap=True)
+        model.heads.load_state_dict(state["heads"])
+        model.dropout.p = state["dropout"]
+        return model
+
+
+def build_multitask_labels(df, metric_labels, metric_to_column):
+    """Return an (n_rows, n_metrics) array of label ids, IGNORE_INDEX where missing"""
+    columns = []
+    for metric, labels in metric_labels.items():
+        label_map = {label: idx for idx, label in enumerate(labels)}
+        values = df[metric_to_column[metric]].astype(object)
+        ids = values.map(lambda v: label_map.get(str(v)[0], IGNORE_INDEX) if isinstance(v, str) else IGNORE_INDEX)
+        columns.append(ids.to_numpy(dtype=np.int64))
+    return np.stack(columns, axis=1)
+
+
+def train_multihead(df, encoded, tokenizer, metric_labels, metric_to_column, output_dir,
+                    model_name, epochs=4, batch_size=16, data_collator=None, callbacks=None,
+                    group_by_length=False):
+    """Fine-tune one shared encoder with a head per metric and save it to output_dir.
+
+    encoded is the tokenized, unpadded text column row-aligned with df (see
+    training_data.tokenize_corpus); batches are padded by data_collator.
+    """
+    # Training-only dependencies (datasets), kept out of the serving import path
+    from training_data import LENGTH_COLUMN, SPLIT_SEED, make_collator
+
+    labels = build_multitask_labels(df, metric_labels, metric_to_column)
+    metrics = list(metric_labels)
+
+    dataset = encoded.add_column("labels", labels.tolist())
+    tokenized = dataset.train_test_split(test_size=0.2, seed=SPLIT_SEED)
+
+    def compute_metrics(eval_pred):
+        logits, label_ids = eval_pred
+        scores = {}
+        for idx, metric in enumerate(metrics):
+            mask = label_ids[:, idx] != IGNORE_INDEX
+            if mask.any():
+                predicted = np.argmax(logits[idx][mask], axis=1)
+                scores[f"accuracy_{metric}"] = float((predicted == label_ids[mask, idx]).mean())
+        return scores
+
+    encoder = AutoModel.from_pretrained(model_name)
+    model = MultiHeadCVSSModel(encoder, metric_labels)
+
+    args = TrainingArguments(
+        output_dir=output_dir,
+        eval_strategy="epoch",
+        save_strategy="epoch",
+        num_train_epochs=epochs,
+        per_device_train_batch_size=batch_size,
+        per_device_eval_batch_size=batch_size,
+        learning_rate=2e-5,
+        weight_decay=0.01,
+        logging_dir=f"{output_dir}/logs",
+        logging_steps=10,
+        save_total_limit=1,
+        load_best_model_at_end=True,
+        label_names=["labels"],
+        # heads.pt is written by save_pretrained, checkpoints hold the raw state dict
+        save_safetensors=False,
+        group_by_length=group_by_length,
+        length_column_name=LENGTH_COLUMN,
+    )
+
+    trainer = Trainer(
+        model=model,
+        args=args,
+        train_dataset=tokenized["train"],
+        eval_dataset=tokenized["test"],
+        compute_metrics=compute_metrics,
+        data_collator=data_collator or make_collator(tokenizer),
+        callbacks=callbacks,
+    )
+    trainer.train()
+
+    model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    return model
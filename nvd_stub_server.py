@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+API_PATH = "/rest/json/cves/2.0"
+MAX_RESULTS_PER_PAGE = 2000
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+MAX_RANGE_DAYS = 120
+
+
+def load_recorded_cves(pages_dir):
+    """Every CVE of the recorded NVD pages in pages_dir, later files overriding earlier ones"""
+    cves = {}
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            page = json.load(f)
+        for item in page.get("vulnerabilities", []):
+            cves[item["cve"]["id"]] = item
+    return list(cves.values())
+
+
+def parse_date(value):
+    # NVD dates may carry an offset or a "Z", the stub compares them as naive UTC
+    return datetime.strptime(value[:23], DATE_FORMAT)
+
+
+class StubNvd:
+    """Answers CVE API 2.0 queries from recorded pages.
+
+    Supports startIndex/resultsPerPage paging and pub/lastMod date windows,
+    and can enforce a rate limit or fail every n-th request to exercise the
+    harvester's limiter and retries.
+    """
+
+    def __init__(self, cves, rate=None, window=30.0, fail_every=0, delay_ms=0):
+        self.cves = cves
+        self.rate = rate
+        self.window = window
+        self.fail_every = fail_every
+        self.delay = delay_ms / 1000.0
+        self.recent = deque()
+        self.requests = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def select(self, query):
+        selected = self.cves
+        for prefix, field in (("pub", "published"), ("lastMod", "lastModified")):
+            start, end = query.get(f"{prefix}StartDate"), query.get(f"{prefix}EndDate")
+            if bool(start) != bool(end):
+                raise web.HTTPNotFound(headers={"message": f"{prefix}StartDate and {prefix}EndDate go together"})
+            if not start:
+                continue
+            start, end = parse_date(start), parse_date(end)
+            if (end - start).days > MAX_RANGE_DAYS:
+                raise web.HTTPNotFound(headers={"message": f"Date range exceeds {MAX_RANGE_DAYS} days"})
+            selected = [c for c in selected if start <= parse_date(c["cve"][field]) <= end]
+        return selected
+
+    async def handle(self, request):
+        self.requests += 1
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] > self.window:
+            self.recent.popleft()
+        if self.rate and len(self.recent) >= self.rate:
+            self.rejected += 1
+            raise web.HTTPForbidden(text="Rate limit exceeded")
+        self.recent.append(now)
+        if self.fail_every and self.requests % self.fail_every == 0:
+            self.failed += 1
+            raise web.HTTPServiceUnavailable(text="Injected failure")
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+        query = request.query
+        start_index = int(query.get("startIndex", 0))
+        per_page = min(int(query.get("resultsPerPage", MAX_RESULTS_PER_PAGE)), MAX_RESULTS_PER_PAGE)
+        selected = self.select(query)
+        page = selected[start_index:start_index + per_page]
+        return web.json_response({
+            "resultsPerPage": len(page),
+            "startIndex": start_index,
+            "totalResults": len(selected),
+            "format": "NVD_CVE",
+            "version": "2.0",
+            "timestamp": datetime.now(timezone.utc).strftime(DATE_FORMAT)[:23],
+            "vulnerabilities": page,
+        })
+
+    async def stats(self, request):
+        return web.json_response({
+            "cves": len(self.cves), "requests": self.requests,
+            "rejected": self.rejected, "failed": self.failed,
+        })
+
+
+def make_app(stub):
+    app = web.Application()
+    app.router.add_get(API_PATH, stub.handle)
+    app.router.add_get("/stats", stub.stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded NVD pages as a local CVE API")
+    parser.add_argument("pages_dir", help="directory of recorded page JSON files (get_data.py --save-pages)")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--rate", type=int, default=None, help="reject (403) above this many requests per 30s")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every n-th request with 503")
+    parser.add_argument("--delay-ms", type=float, default=0, help="latency added to every response")
+    args = parser.parse_args()
+
+    cves = load_recorded_cves(args.pages_dir)
+    print(f"[INFO] Serving {len(cves)} CVEs on http://127.0.0.1:{args.port}{API_PATH}")
+    stub = StubNvd(cves, args.rate, fail_every=args.fail_every, delay_ms=args.delay_ms)
+    web.run_app(make_app(stub), host="127.0.0.1", port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
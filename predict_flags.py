@@ -1,40 +1,30 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-
-def load_label_map(path):
-    label_map = {}
-    with open(path, "r") as f:
-        for line in f:
-            k, v = line.strip().split(":")
-            label_map[int(v)] = k
-    return label_map
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from batching import usable_cores
+from model_registry import BACKENDS, registry, served_metrics
 
 def predict_metric(description, metric_name, models_dir="./cvss_models"):
-    model_path = f"{models_dir}/{metric_name}"
-    
-    # Wczytanie modelu i tokenizera
-    model = AutoModelForSequenceClassification.from_pretrained(model_path)
-    tokenizer = AutoTokenizer.from_pretrained(model_path)
-    model.eval()
-
-    # Wczytaj mapowanie etykiet
-    label_map = load_label_map(f"{model_path}/label_map.txt")
-    
-    # Tokenizacja
-    inputs = tokenizer(description, return_tensors="pt", truncation=True, padding=True)
-    
-    # Predykcja
-    with torch.no_grad():
-        outputs = model(**inputs)
-        predicted_id = torch.argmax(outputs.logits, dim=1).item()
-
-    return label_map[predicted_id]
-
-CVSS_METRICS = ["AV", "AC", "PR", "UI", "VC", "VI", "VA", "SC", "SI", "SA"]
+    # Model, tokenizer i mapowanie etykiet wczytywane raz, trzymane w rejestrze
+    model = registry.get(models_dir, metric_name)
+    return model.predict([description])[0]
+
+# Input formats of --input, "auto" picks one from the file extension
+INPUT_FORMATS = ("auto", "csv", "jsonl", "lines")
+# Descriptions per chunk handed to a worker and per forward pass
+CHUNK_SIZE = 64
+# Seconds between progress lines
+PROGRESS_INTERVAL = 1.0
 
 def predict_all_metrics(description, models_dir="./cvss_models"):
     results = {}
-    for metric in CVSS_METRICS:
+    for metric in served_metrics(models_dir):
         try:
             value = predict_metric(description, metric, models_dir)
             results[metric] = value
@@ -42,10 +32,184 @@ def predict_all_metrics(description, models_dir="./cvss_models"):
             results[metric] = f"Error: {e}"
     return results
 
+def predict_all_metrics_batch(descriptions, models_dir="./cvss_models"):
+    """Predict all metrics for a list of descriptions, one batched pass per metric"""
+    results = [{} for _ in descriptions]
+    # The metrics main.py serves from the same directory (AT only when it has a model)
+    for metric in served_metrics(models_dir):
+        try:
+            values = registry.get(models_dir, metric).predict(descriptions)
+        except Exception as e:
+            values = [f"Error: {e}"] * len(descriptions)
+        for result, value in zip(results, values):
+            result[metric] = value
+    return results
+
+def read_rows(path, input_format, text_column, id_column):
+    """Yield (row, id, description) one at a time, row being the 0-based input position"""
+    if input_format == "auto":
+        extension = os.path.splitext(path)[1].lower()
+        input_format = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}.get(extension, "lines")
+
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8", newline="" if input_format == "csv" else None)
+    try:
+        if input_format == "csv":
+            records = csv.DictReader(f)
+        elif input_format == "jsonl":
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            records = ({text_column: line.rstrip("\n")} for line in f)
+        for row, record in enumerate(records):
+            if not isinstance(record, dict):
+                # A JSONL line that is not an object, predict_chunk rejects it unless it is a string
+                yield row, None, record
+                continue
+            # JSONL values may be numbers, objects or lists, predict_chunk rejects them per row
+            description = record.get(text_column)
+            yield row, record.get(id_column), "" if description is None else description
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def resume_output(path):
+    """Rows already in a partly written output file; a torn last line is cut off"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        valid_end = 0
+        for line in f:
+            # Interrupted mid-write, everything after the last complete record is rewritten
+            if not line.endswith(b"\n"):
+                break
+            try:
+                done.add(json.loads(line)["row"])
+            except (ValueError, KeyError):
+                break
+            valid_end += len(line)
+        f.truncate(valid_end)
+    return done
+
+def chunks(rows, done, size):
+    """Lists of up to size pending rows, read lazily so memory stays bounded"""
+    pending = (row for row in rows if row[0] not in done)
+    while True:
+        chunk = list(islice(pending, size))
+        if not chunk:
+            return
+        yield chunk
+
+def description_error(description):
+    """Why a description cannot be predicted, or None"""
+    if not isinstance(description, str):
+        return "Description must be a string"
+    if not description.strip():
+        return "Description cannot be empty"
+    return None
+
+def predict_chunk(chunk, models_dir):
+    """Output records of one chunk, empty and non-string descriptions are skipped with an error"""
+    errors = [description_error(description) for _, _, description in chunk]
+    texts = [description for (_, _, description), error in zip(chunk, errors) if error is None]
+    predictions = iter(predict_all_metrics_batch(texts, models_dir)) if texts else iter(())
+    records = []
+    for (row, row_id, description), error in zip(chunk, errors):
+        record = {"row": row, "id": row_id}
+        if error is None:
+            record["cvss_flags"] = next(predictions)
+        else:
+            record["error"] = error
+        records.append(record)
+    return records
+
+def _init_worker(backend, num_threads):
+    """Pool initializer: each worker loads the models once and uses its share of cores"""
+    import torch
+
+    registry.backend = backend
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+
+def run_chunks(chunk_iter, models_dir, workers):
+    """Yield the records of every chunk, on `workers` processes when above 1.
+
+    At most two chunks per worker are in flight, so input is read only as
+    fast as it is predicted. Records come back in completion order.
+    """
+    if workers <= 1:
+        for chunk in chunk_iter:
+            yield predict_chunk(chunk, models_dir)
+        return
+
+    num_threads = max(1, len(usable_cores()) // workers)
+    print(f"[INFO] Sharding over {workers} workers x {num_threads} threads", file=sys.stderr)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(registry.backend, num_threads),
+    ) as pool:
+        in_flight = set()
+        for chunk in chunk_iter:
+            in_flight.add(pool.submit(predict_chunk, chunk, models_dir))
+            if len(in_flight) >= 2 * workers:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield future.result()
+        for future in in_flight:
+            yield future.result()
+
+def run_batch_cli(args):
+    """Stream predictions of every input row as JSONL to --output or stdout"""
+    done = resume_output(args.output) if args.output else set()
+    if done:
+        print(f"[INFO] Resuming, {len(done)} rows already in {args.output}", file=sys.stderr)
+    out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+
+    rows = read_rows(args.input, args.format, args.text_column, args.id_column)
+    start = last_report = time.perf_counter()
+    count = 0
+    try:
+        for records in run_chunks(chunks(rows, done, args.chunk_size), args.models_dir, args.workers):
+            for record in records:
+                out.write(json.dumps(record) + "\n")
+            out.flush()
+            count += len(records)
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                print(f"\r{count} rows, {count / (now - start):.1f} rows/sec", end="", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"\r{count} rows in {elapsed:.1f}s, {count / elapsed if elapsed else 0:.1f} rows/sec", file=sys.stderr)
+
 desc = """A remote attacker can exploit this vulnerability without authentication, 
 resulting in code execution in the context of the root user."""
 
-results = predict_all_metrics(desc)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predict CVSS metrics for a vulnerability description")
+    parser.add_argument("description", nargs="?", default=desc)
+    parser.add_argument("--models-dir", default="./cvss_models")
+    parser.add_argument("--backend", choices=BACKENDS, default=registry.backend,
+                        help="onnx uses graphs exported with export_onnx.py")
+    batch = parser.add_argument_group("batch mode", "classify many descriptions, one JSON line per input row")
+    batch.add_argument("--input", help="CSV, JSONL or plain-text file of descriptions, - for stdin lines")
+    batch.add_argument("--format", choices=INPUT_FORMATS, default="auto",
+                       help="input format, auto goes by extension (.csv, .jsonl, otherwise one description per line)")
+    batch.add_argument("--output", help="JSONL output file; if it exists, rows already in it are skipped (default: stdout)")
+    batch.add_argument("--text-column", default="description", help="CSV column / JSON key with the description")
+    batch.add_argument("--id-column", default="cve_id", help="CSV column / JSON key copied to the output as id")
+    batch.add_argument("--workers", type=int, default=1, help="worker processes, each loading the models once")
+    batch.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="descriptions per worker task")
+    args = parser.parse_args()
+
+    registry.backend = args.backend
+    if args.input:
+        run_batch_cli(args)
+    else:
+        results = predict_all_metrics(args.description, args.models_dir)
 
-for metric, value in results.items():
-    print(f"{metric}: {value}")
\ No newline at end of file
+        for metric, value in results.items():
+            print(f"{metric}: {value}")
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from model_registry import checkpoint_fingerprint
+
+# Number of predictions kept in memory (0 disables the cache)
+DEFAULT_CACHE_SIZE = int(os.environ.get("CVSS_CACHE_SIZE", "10000"))
+# SQLite file for the on-disk tier, empty = memory only
+DEFAULT_CACHE_DB = os.environ.get("CVSS_CACHE_DB", "")
+# How often (in seconds) a model fingerprint is recomputed from disk
+DEFAULT_FINGERPRINT_INTERVAL = float(os.environ.get("CVSS_MODEL_CHECK_INTERVAL", "2"))
+
+# Files whose content (not only size/mtime) goes into the fingerprint
+LABEL_FILES = ("label_map.txt", "heads.json")
+
+
+def normalize_description(description):
+    """Collapse whitespace so resubmitted descriptions map to the same key"""
+    return " ".join(description.split())
+
+
+def description_hash(description):
+    return hashlib.sha256(normalize_description(description).encode("utf-8")).hexdigest()
+
+
+def model_fingerprint(model_path, backend="torch"):
+    """Hash of a model's checkpoint files, label map and inference backend.
+
+    Weights are identified by name, size and mtime, so retraining a model
+    (which rewrites them) changes the fingerprint without hashing gigabytes.
+    The backend is part of it because ONNX Runtime and PyTorch may disagree
+    on borderline predictions of the same checkpoint.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{backend};".encode("utf-8"))
+    # Models with identical files (e.g. copies) must not share entries
+    digest.update(os.path.basename(os.path.normpath(model_path)).encode("utf-8"))
+    for name, size, mtime in checkpoint_fingerprint(model_path):
+        digest.update(f"{name}:{size}:{mtime};".encode("utf-8"))
+    for name in LABEL_FILES:
+        path = os.path.join(model_path, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+class PredictionCache:
+    """Content-addressed cache of predictions.
+
+    Keys are (model fingerprint, description hash), so entries of a model
+    are invalidated automatically when it is retrained or served by another
+    backend. Predictions live in
+    an in-memory LRU tier and, when db_path is set, in a SQLite file that
+    survives restarts.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, db_path=DEFAULT_CACHE_DB,
+                 fingerprint_interval=DEFAULT_FINGERPRINT_INTERVAL):
+        self.max_entries = max_entries
+        self.fingerprint_interval = fingerprint_interval
+        self._memory = OrderedDict()
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        self._db = None
+        self.db_path = db_path
+        if db_path and max_entries > 0:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.commit()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def fingerprint(self, model_path, backend="torch"):
+        """Fingerprint of a model run by backend, recomputed at most every fingerprint_interval seconds"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._fingerprints.get((model_path, backend))
+            if cached is not None and now - cached[1] < self.fingerprint_interval:
+                return cached[0]
+        fingerprint = model_fingerprint(model_path, backend)
+        with self._lock:
+            self._fingerprints[(model_path, backend)] = (fingerprint, now)
+        return fingerprint
+
+    @staticmethod
+    def _key(fingerprint, description):
+        return f"{fingerprint}:{description_hash(description)}"
+
+    def get(self, fingerprint, description, default=None):
+        if not self.enabled:
+            return default
+        key = self._key(fingerprint, description)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM predictions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return default
+
+    def put(self, fingerprint, description, value):
+        if not self.enabled:
+            return
+        key = self._key(fingerprint, description)
+        with self._lock:
+            self._remember(key, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, value) VALUES (?, ?)",
+                    (key, json.dumps(value)),
+                )
+                self._db.commit()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._fingerprints.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_path": self.db_path or None,
+            }
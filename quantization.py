@@ -0,0 +1,57 @@
+import json
+import os
+import shutil
+
+import torch
+from torch import nn
+from transformers import AutoConfig, AutoModel, AutoModelForSequenceClassification
+
+from multihead import HEADS_FILE, MultiHeadCVSSModel, is_multihead
+from model_registry import TRAINING_RUN_FILE
+from truncation import TRUNCATION_FILE
+
+# Marker written next to quantized checkpoints
+QUANTIZATION_FILE = "quantization.json"
+QUANTIZED_WEIGHTS = "quantized_model.pt"
+# Files copied unchanged from the fp32 checkpoint
+COPIED_FILES = (
+    "config.json", "label_map.txt", HEADS_FILE, TRUNCATION_FILE, TRAINING_RUN_FILE,
+    "tokenizer.json", "tokenizer_config.json", "special_tokens_map.json", "vocab.txt",
+)
+
+
+def is_quantized(model_path):
+    return os.path.exists(os.path.join(model_path, QUANTIZATION_FILE))
+
+
+def quantize_int8(model):
+    """Dynamic INT8 quantization of every nn.Linear (weights int8, activations quantized on the fly)"""
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def save_quantized(model, src_path, dst_path):
+    """Save a quantized model with the config, tokenizer and labels of its fp32 checkpoint"""
+    os.makedirs(dst_path, exist_ok=True)
+    for name in COPIED_FILES:
+        if os.path.exists(os.path.join(src_path, name)):
+            shutil.copy2(os.path.join(src_path, name), os.path.join(dst_path, name))
+    torch.save(model.state_dict(), os.path.join(dst_path, QUANTIZED_WEIGHTS))
+    with open(os.path.join(dst_path, QUANTIZATION_FILE), "w") as f:
+        json.dump({"method": "dynamic", "dtype": "qint8", "modules": ["Linear"]}, f, indent=2)
+
+
+def load_quantized(model_path):
+    """Rebuild the fp32 architecture, quantize it and load the saved INT8 weights"""
+    config = AutoConfig.from_pretrained(model_path)
+    if is_multihead(model_path):
+        with open(os.path.join(model_path, HEADS_FILE), "r") as f:
+            metric_labels = json.load(f)["metric_labels"]
+        model = MultiHeadCVSSModel(AutoModel.from_config(config), metric_labels)
+    else:
+        model = AutoModelForSequenceClassification.from_config(config)
+    model.eval()
+    model = quantize_int8(model)
+    # Packed INT8 parameters are not plain tensors, so weights_only loading can't be used
+    state = torch.load(os.path.join(model_path, QUANTIZED_WEIGHTS), map_location="cpu", weights_only=False)
+    model.load_state_dict(state)
+    return model
@@ -0,0 +1,249 @@
+import argparse
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from cvss_dataset import load_dataset, training_corpus
+
+# Index file kept in a models directory next to the metric models
+INDEX_FILE = "retrieval_index.npz"
+# Labelled corpus the index is built from (the training data)
+DEFAULT_CORPUS = training_corpus()
+# Width of the hashed n-gram vectors
+DEFAULT_DIMS = 4096
+# Word n-gram lengths hashed into each vector
+NGRAM_SIZES = (1, 2, 3)
+# Cosine similarity above which a known CVE's vector is returned as is (0 disables retrieval)
+DEFAULT_THRESHOLD = float(os.environ.get("CVSS_RETRIEVAL_THRESHOLD", "0.95"))
+
+METRIC_COLUMNS = {
+    "AV": "attackVector",
+    "AC": "attackComplexity",
+    "AT": "attackRequirements",
+    "PR": "privilegesRequired",
+    "UI": "userInteraction",
+    "VC": "vulnConfidentialityImpact",
+    "VI": "vulnIntegrityImpact",
+    "VA": "vulnAvailabilityImpact",
+    "SC": "subConfidentialityImpact",
+    "SI": "subIntegrityImpact",
+    "SA": "subAvailabilityImpact",
+}
+
+_WORD = re.compile(r"\w+")
+
+
+def metric_letters(df):
+    """(n, n_metrics) array of one-letter metric values, "" where a metric is missing"""
+    columns = [
+        df[column].astype(object).map(lambda v: v[0] if isinstance(v, str) and v else "").to_numpy(dtype="<U1")
+        for column in METRIC_COLUMNS.values()
+    ]
+    return np.stack(columns, axis=1)
+
+
+def hashed_ngrams(texts, dims=DEFAULT_DIMS):
+    """L2-normalized signed hashed word n-gram counts, one float32 row per text.
+
+    crc32 keeps the hashing stable across processes, unlike hash().
+    """
+    vectors = np.zeros((len(texts), dims), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD.findall(text.lower())
+        for n in NGRAM_SIZES:
+            for i in range(len(words) - n + 1):
+                h = zlib.crc32(" ".join(words[i:i + n]).encode("utf-8"))
+                vectors[row, h % dims] += 1.0 if h & 0x80000000 else -1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class RetrievalIndex:
+    """Hashed n-gram vectors of labelled CVEs, searched by brute-force cosine similarity.
+
+    labels is an (n, n_metrics) array of one-letter metric values, the form
+    the classifiers return.
+    """
+
+    def __init__(self, vectors, cve_ids, labels, metrics):
+        self.vectors = vectors
+        self.cve_ids = cve_ids
+        self.labels = labels
+        self.metrics = list(metrics)
+
+    @property
+    def dims(self):
+        return self.vectors.shape[1]
+
+    def __len__(self):
+        return len(self.cve_ids)
+
+    @classmethod
+    def build(cls, df, dims=DEFAULT_DIMS):
+        """Index every row of df with a description and all metrics labelled"""
+        df = df.dropna(subset=["description"] + list(METRIC_COLUMNS.values()))
+        labels = metric_letters(df)
+        cve_ids = df["cve_id"].to_numpy(dtype=str) if "cve_id" in df.columns else np.arange(len(df)).astype(str)
+        return cls(hashed_ngrams(df["description"].tolist(), dims), cve_ids, labels, METRIC_COLUMNS)
+
+    def save(self, path):
+        np.savez_compressed(path, vectors=self.vectors, cve_ids=np.asarray(self.cve_ids, dtype=str), labels=self.labels,
+                            metrics=np.array(self.metrics))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["vectors"], data["cve_ids"], data["labels"], data["metrics"].tolist())
+
+    def search(self, descriptions, exclude=None):
+        """(row, similarity) of the nearest indexed CVE for every description.
+
+        exclude optionally gives a CVE id per description that may not match
+        itself, used when evaluating on CVEs that are also in the index.
+        """
+        similarities = hashed_ngrams(descriptions, self.dims) @ self.vectors.T
+        if exclude is not None:
+            similarities[np.asarray(exclude)[:, None] == self.cve_ids[None, :]] = -1.0
+        rows = similarities.argmax(axis=1)
+        return rows, similarities[np.arange(len(descriptions)), rows]
+
+    def lookup(self, descriptions, threshold=DEFAULT_THRESHOLD, exclude=None):
+        """The known CVE within threshold of each description, or None.
+
+        A match is {"cve_id", "similarity", "cvss_flags"}.
+        """
+        if not descriptions or len(self) == 0:
+            return [None] * len(descriptions)
+        rows, similarities = self.search(descriptions, exclude)
+        matches = []
+        for row, similarity in zip(rows, similarities):
+            if similarity < threshold:
+                matches.append(None)
+                continue
+            matches.append({
+                "cve_id": str(self.cve_ids[row]),
+                "similarity": round(float(similarity), 4),
+                "cvss_flags": dict(zip(self.metrics, self.labels[row].tolist())),
+            })
+        return matches
+
+
+class IndexCache:
+    """Loaded index per models directory, reloaded when its file changes"""
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, models_dir):
+        """The RetrievalIndex of a models directory, or None if it has none"""
+        path = os.path.join(models_dir, INDEX_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._indexes.get(path)
+            if cached is None or cached[0] != mtime:
+                cached = self._indexes[path] = (mtime, RetrievalIndex.load(path))
+            return cached[1]
+
+
+def build_index(csv_path, models_dir, dims):
+    df = load_dataset(csv_path, columns=["cve_id", "description"] + list(METRIC_COLUMNS.values()))
+    start = time.perf_counter()
+    index = RetrievalIndex.build(df, dims)
+    os.makedirs(models_dir, exist_ok=True)
+    path = os.path.join(models_dir, INDEX_FILE)
+    index.save(path)
+    print(f"[INFO] Indexed {len(index)} CVEs from {csv_path} in {time.perf_counter() - start:.2f}s "
+          f"({index.vectors.nbytes / (1024 * 1024):.1f} MB) -> {path}")
+
+
+def model_seconds(descriptions, models_dir):
+    """Seconds to run the served classifiers over descriptions, or None without models"""
+    metrics = [metric for metric in METRIC_COLUMNS if os.path.isdir(os.path.join(models_dir, metric))]
+    # AT is served only when it has a model, every other metric always is
+    if any(metric not in metrics for metric in METRIC_COLUMNS if metric != "AT"):
+        return None
+
+    from model_registry import registry
+
+    loaded = [registry.get(models_dir, metric) for metric in metrics]
+    start = time.perf_counter()
+    for loaded_model in loaded:
+        loaded_model.predict(descriptions)
+    return time.perf_counter() - start
+
+
+def evaluate(csv_path, models_dir, thresholds, include_same_cve=False):
+    """Hit rate, accuracy of hits and expected speedup of the retrieval path per threshold"""
+    index = RetrievalIndex.load(os.path.join(models_dir, INDEX_FILE))
+    df = load_dataset(csv_path, columns=["cve_id", "description"] + list(METRIC_COLUMNS.values()))
+    df = df.dropna(subset=["description"]).reset_index(drop=True)
+    descriptions = df["description"].tolist()
+    exclude = None if include_same_cve else df["cve_id"].to_numpy(dtype=str)
+
+    start = time.perf_counter()
+    rows, similarities = index.search(descriptions, exclude)
+    lookup_s = time.perf_counter() - start
+    classify_s = model_seconds(descriptions, models_dir)
+
+    truth = metric_letters(df)
+    retrieved = index.labels[rows]
+
+    print("\n" + "=" * 84)
+    print(f"RETRIEVAL FAST PATH on {csv_path} ({len(descriptions)} descriptions, {len(index)} indexed CVEs"
+          f"{', same-CVE matches allowed' if include_same_cve else ''})")
+    print(f"lookup {lookup_s * 1000 / len(descriptions):.3f} ms/description"
+          + (f", classifiers {classify_s * 1000 / len(descriptions):.1f} ms/description" if classify_s else
+             ", no models found for the speedup estimate"))
+    print("=" * 84)
+    print(f"{'threshold':>9}  {'hit rate':>8}  {'hits':>6}  {'metric acc':>10}  {'exact vector':>12}  {'speedup':>8}")
+    for threshold in thresholds:
+        hits = similarities >= threshold
+        if hits.any():
+            known = truth[hits] != ""
+            correct = retrieved[hits] == truth[hits]
+            metric_acc = f"{correct[known].mean():>10.1%}"
+            exact = f"{(correct | ~known).all(axis=1).mean():>12.1%}"
+        else:
+            metric_acc, exact = f"{'-':>10}", f"{'-':>12}"
+        speedup = "-"
+        if classify_s:
+            # Every description is looked up, only misses run the classifiers
+            speedup = f"{classify_s / (lookup_s + (1 - hits.mean()) * classify_s):.2f}x"
+        print(f"{threshold:>9.2f}  {hits.mean():>8.1%}  {int(hits.sum()):>6}  {metric_acc}  {exact}  {speedup:>8}")
+    print("=" * 84)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nearest-neighbour retrieval over labelled CVEs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help=f"index the labelled corpus into <models-dir>/{INDEX_FILE}")
+    build.add_argument("--csv", default=DEFAULT_CORPUS)
+    build.add_argument("--models-dir", default="./cvss_models")
+    build.add_argument("--dims", type=int, default=DEFAULT_DIMS, help="width of the hashed n-gram vectors")
+
+    report = subparsers.add_parser("evaluate", help="hit rate, accuracy and speedup per similarity threshold")
+    report.add_argument("--csv", default="nvd_cvss4_data2.csv")
+    report.add_argument("--models-dir", default="./cvss_models")
+    report.add_argument("--thresholds", type=float, nargs="+", default=[0.8, 0.85, 0.9, 0.95, 0.98])
+    report.add_argument("--include-same-cve", action="store_true",
+                        help="let a CVE match its own indexed copy (both datasets share some CVEs)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_index(args.csv, args.models_dir, args.dims)
+    else:
+        evaluate(args.csv, args.models_dir, args.thresholds, args.include_same_cve)
+
+
+if __name__ == "__main__":
+    main()
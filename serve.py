@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import uvicorn
+
+# Requests handled at once; each holds one thread of the WSGI pool
+DEFAULT_WORKERS = int(os.environ.get("CVSS_SERVE_WORKERS", str(min(8, os.cpu_count() or 1))))
+# Requests allowed to wait for a worker, above that new ones get 429
+DEFAULT_MAX_QUEUE = int(os.environ.get("CVSS_SERVE_MAX_QUEUE", "64"))
+# Seconds a request may take, waiting included; clients may ask for less with X-Request-Timeout
+DEFAULT_TIMEOUT = float(os.environ.get("CVSS_REQUEST_TIMEOUT", "30"))
+TIMEOUT_HEADER = b"x-request-timeout"
+# Answered outside the admission limits so probes work under load
+EXEMPT_PATHS = ("/api/health", "/api/ready", "/api/metrics/prometheus")
+STATS_PATH = "/api/serving/stats"
+# Threads on top of the workers for exempt routes and requests finishing after a timeout
+SPARE_THREADS = 4
+
+
+def build_environ(scope, body):
+    """WSGI environ of an ASGI http scope"""
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "SERVER_NAME": scope["server"][0] if scope.get("server") else "localhost",
+        "SERVER_PORT": str(scope["server"][1]) if scope.get("server") else "80",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        key = name if name in ("CONTENT_TYPE", "CONTENT_LENGTH") else f"HTTP_{name}"
+        value = value.decode("latin1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class WsgiBridge:
+    """Runs a WSGI app (the Flask app) as ASGI on a bounded thread pool.
+
+    Unlike asgiref's WsgiToAsgi, which runs every request on one thread,
+    requests run in parallel on executor threads. Response chunks are sent
+    as the app yields them, so streaming routes keep streaming.
+    """
+
+    def __init__(self, wsgi_app, executor):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._run, loop, build_environ(scope, body), send)
+
+    def _run(self, loop, environ, send):
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["message"] = {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers],
+            }
+
+        output = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in output:
+                if "message" in started:
+                    emit(started.pop("message"))
+                if chunk:
+                    emit({"type": "http.response.body", "body": chunk, "more_body": True})
+            if "message" in started:
+                emit(started.pop("message"))
+            emit({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if hasattr(output, "close"):
+                output.close()
+
+
+class AdmissionControl:
+    """ASGI front end with a bounded number of in-flight requests.
+
+    At most `workers` requests run at once and at most `max_queue` wait
+    for a slot; beyond that requests are rejected with 429. A request that
+    cannot start or finish within its timeout gets 503 or 504. Every
+    rejection carries Retry-After, estimated from the recent service time.
+    on_startup is called when the server starts, before requests arrive.
+    """
+
+    def __init__(self, wsgi_app, workers=DEFAULT_WORKERS, max_queue=DEFAULT_MAX_QUEUE, timeout=DEFAULT_TIMEOUT,
+                 on_startup=None):
+        self.on_startup = on_startup
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(self.workers + SPARE_THREADS, thread_name_prefix="wsgi")
+        self.app = WsgiBridge(wsgi_app, self.executor)
+        self._slots = asyncio.Semaphore(self.workers)
+        self.in_flight = 0
+        self.queued = 0
+        self.closing = False
+        # Moving average of request time, used for Retry-After
+        self.service_time = 0.0
+        self.statuses = Counter()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["path"] == STATS_PATH:
+            return await self._respond(send, 200, {"serving": self.stats(), "status": "success"})
+        if scope["path"] in EXEMPT_PATHS:
+            return await self.app(scope, receive, send)
+
+        if self.closing:
+            return await self._reject(send, 503, "Server is shutting down")
+        if self._slots.locked() and self.queued >= self.max_queue:
+            return await self._reject(send, 429, "Too many requests, try again later")
+
+        timeout = self._request_timeout(scope)
+        deadline = time.monotonic() + timeout
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            return await self._reject(send, 503, f"No worker became free within {timeout:g}s")
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        started = time.monotonic()
+        response = {"started": False, "closed": False}
+
+        async def guarded_send(message):
+            if response["closed"]:
+                return
+            if message["type"] == "http.response.start":
+                response["started"] = True
+                self.statuses[message["status"]] += 1
+            await send(message)
+
+        task = asyncio.ensure_future(self.app(scope, receive, guarded_send))
+        # The worker thread cannot be interrupted; its slot is freed only when it finishes
+        task.add_done_callback(lambda _: self._release(started))
+        try:
+            await asyncio.wait_for(asyncio.shield(task), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            response["closed"] = True
+            if response["started"]:
+                # Cut a streaming response short
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            else:
+                await self._reject(send, 504, f"Request timed out after {timeout:g}s")
+
+    def _release(self, started):
+        self._slots.release()
+        self.in_flight -= 1
+        elapsed = time.monotonic() - started
+        self.service_time = elapsed if not self.service_time else 0.9 * self.service_time + 0.1 * elapsed
+
+    def _request_timeout(self, scope):
+        for name, value in scope.get("headers", []):
+            if name == TIMEOUT_HEADER:
+                try:
+                    return min(self.timeout, max(float(value), 0.001))
+                except ValueError:
+                    break
+        return self.timeout
+
+    def retry_after(self):
+        """Seconds until the current queue should have drained"""
+        waiting = self.queued + self.in_flight
+        return max(1, math.ceil(waiting * (self.service_time or 1.0) / self.workers))
+
+    async def _respond(self, send, status, payload, headers=()):
+        body = json.dumps(payload).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                       + list(headers),
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _reject(self, send, status, message):
+        self.statuses[status] += 1
+        retry_after = str(self.retry_after()).encode()
+        await self._respond(send, status, {"error": message}, [(b"retry-after", retry_after)])
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.on_startup is not None:
+                    self.on_startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.closing = True
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "timeout": self.timeout,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "service_time_ms": round(self.service_time * 1000, 1),
+            "responses": {str(status): count for status, count in sorted(self.statuses.items())},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the CVSS prediction API with uvicorn")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="requests handled at once")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE,
+                        help="requests waiting for a worker before new ones get 429")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="per-request timeout in seconds")
+    args = parser.parse_args()
+
+    # Models, batcher and cache live in this process, so uvicorn runs a single process
+    from main import PRELOAD, app, start_preload
+    asgi_app = AdmissionControl(app, args.workers, args.max_queue, args.timeout,
+                                on_startup=start_preload if PRELOAD else None)
+    print(f"[INFO] Serving on http://{args.host}:{args.port} "
+          f"({args.workers} workers, queue {args.max_queue}, timeout {args.timeout:g}s)")
+    uvicorn.run(asgi_app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,106 +1,112 @@
 import pandas as pd
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 import numpy as np
 import os
 from collections import defaultdict
 import matplotlib.pyplot as plt
 import seaborn as sns
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+import torch
+from model_registry import registry
+from batching import DEFAULT_MAX_BATCH_TOKENS, usable_cores
+from multihead import MULTIHEAD_NAME
+from cascade import NEVER, LinearTier
+from cvss_dataset import load_dataset
+from evaluation import EVAL_BATCH_SIZE, METRIC_COLUMNS, TokenizedCorpus, map_cvss_values_to_abbreviations, predict_ids
 
-def load_label_map(path):
-    """Load label mapping from file"""
-    label_map = {}
-    with open(path, "r") as f:
-        for line in f:
-            k, v = line.strip().split(":")
-            label_map[int(v)] = k
-    return label_map
-
-def predict_metric(description, metric_name, models_dir="./cvss_models"):
-    """Predict a single CVSS metric"""
-    model_path = f"{models_dir}/{metric_name}"
-    
-    # Load model and tokenizer
-    model = AutoModelForSequenceClassification.from_pretrained(model_path)
-    tokenizer = AutoTokenizer.from_pretrained(model_path)
-    model.eval()
+# Corpus of the current worker process, set by _init_worker
+_worker_corpus = None
 
-    # Load label mapping
-    label_map = load_label_map(f"{model_path}/label_map.txt")
-    
-    # Tokenization
-    inputs = tokenizer(description, return_tensors="pt", truncation=True, padding=True)
-    
-    # Prediction
-    with torch.no_grad():
-        outputs = model(**inputs)
-        predicted_id = torch.argmax(outputs.logits, dim=1).item()
-
-    return label_map[predicted_id]
-
-def map_cvss_values_to_abbreviations(value):
-    """Map full CVSS values to their abbreviations"""
-    mapping = {
-        # Attack Vector
-        'NETWORK': 'N',
-        'ADJACENT': 'A', 
-        'LOCAL': 'L',
-        'PHYSICAL': 'P',
-        
-        # Attack Complexity
-        'LOW': 'L',
-        'HIGH': 'H',
-        
-        # Privileges Required
-        'NONE': 'N',
-        
-        # User Interaction
-        'REQUIRED': 'R',
-        
-        # Impact values
-        'MEDIUM': 'M',
-        
-        # Default for NOT_DEFINED and others
-        'NOT_DEFINED': 'X'
+def _init_worker(descriptions, num_threads):
+    """Pool initializer: give each worker its share of cores and the corpus"""
+    global _worker_corpus
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+    _worker_corpus = TokenizedCorpus(descriptions)
+
+def _predict_metric_worker(metric, models_dir, indices, batch_size, max_tokens):
+    loaded_model = registry.get(models_dir, metric)
+    ids = predict_ids(loaded_model, _worker_corpus, indices, batch_size, max_tokens)
+    return ids, loaded_model.label_map
+
+def start_parallel_predictions(jobs, descriptions, models_dir, batch_size, max_tokens, workers):
+    """Run per-metric inference in a process pool.
+
+    jobs maps metric -> row indices. Torch intra-op threads are split
+    evenly between workers so they don't oversubscribe the cores.
+    Returns the pool and a dict of metric -> Future of (ids, label_map).
+    """
+    num_threads = max(1, len(usable_cores()) // workers)
+    print(f"Evaluating {len(jobs)} metrics on {workers} workers x {num_threads} threads")
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(descriptions, num_threads),
+    )
+    futures = {
+        metric: pool.submit(_predict_metric_worker, metric, models_dir, indices, batch_size, max_tokens)
+        for metric, indices in jobs.items()
     }
-    
-    return mapping.get(value, value)
+    return pool, futures
 
-def test_model_accuracy(csv_file_path, models_dir="./cvss_models"):
+def test_model_accuracy(csv_file_path, models_dir="./cvss_models", multihead=False, batch_size=EVAL_BATCH_SIZE,
+                        workers=1, max_tokens=DEFAULT_MAX_BATCH_TOKENS):
     """Test model accuracy on CVSSv4 data"""
+    start_time = time.perf_counter()
     
     # Load data
     print(f"Loading data from {csv_file_path}...")
-    df = pd.read_csv(csv_file_path)
+    df = load_dataset(csv_file_path, columns=['cve_id', 'description'] + list(METRIC_COLUMNS.values()))
     
     # Filter out rows without description
     df = df.dropna(subset=['description'])
     
     print(f"Testing on {len(df)} samples")
-    
-    # Define metrics to test and their corresponding CSV columns
-    metric_columns = {
-        "AV": "attackVector",
-        "AC": "attackComplexity", 
-        "PR": "privilegesRequired",
-        "UI": "userInteraction",
-        "VC": "vulnConfidentialityImpact",
-        "VI": "vulnIntegrityImpact", 
-        "VA": "vulnAvailabilityImpact",
-        "SC": "subConfidentialityImpact",
-        "SI": "subIntegrityImpact",
-        "SA": "subAvailabilityImpact"
-    }
+
+    descriptions = df['description'].tolist()
+    corpus = TokenizedCorpus(descriptions)
+    if 'cve_id' in df.columns:
+        cve_ids = df['cve_id'].to_numpy()
+    else:
+        cve_ids = np.array([f'row_{idx}' for idx in df.index], dtype=object)
+    short_descriptions = np.array(
+        [d[:100] + '...' if len(d) > 100 else d for d in descriptions], dtype=object
+    )
     
     results = {}
     detailed_results = defaultdict(list)
-    
-    for metric, column_name in metric_columns.items():
+    predicted_rows = 0
+    multihead_ids = None
+
+    def valid_indices(column_name):
+        # Skip rows where actual value is missing or NOT_DEFINED
+        actual_full = df[column_name].to_numpy(dtype=object)
+        valid = ~(pd.isna(actual_full) | (actual_full == 'NOT_DEFINED'))
+        return actual_full, np.flatnonzero(valid)
+
+    pool = None
+    parallel = {}
+    if workers > 1 and not multihead:
+        jobs = {}
+        for metric, column_name in METRIC_COLUMNS.items():
+            if os.path.exists(f"{models_dir}/{metric}") and column_name in df.columns:
+                _, indices = valid_indices(column_name)
+                if len(indices):
+                    jobs[metric] = indices
+        if jobs:
+            pool, parallel = start_parallel_predictions(
+                jobs, descriptions, models_dir, batch_size, max_tokens, min(workers, len(jobs))
+            )
+    
+    for metric, column_name in METRIC_COLUMNS.items():
         print(f"\nTesting metric: {metric} (using column: {column_name})")
         
         # Check if model exists
-        model_path = f"{models_dir}/{metric}"
+        model_path = f"{models_dir}/{MULTIHEAD_NAME if multihead else metric}"
         if not os.path.exists(model_path):
             print(f"Model for {metric} not found at {model_path}")
             continue
@@ -109,59 +115,82 @@ def test_model_accuracy(csv_file_path, models_dir="./cvss_models"):
         if column_name not in df.columns:
             print(f"Column {column_name} not found in CSV")
             continue
+
+        actual_full, indices = valid_indices(column_name)
+        if len(indices) == 0:
+            print(f"No valid samples found for metric {metric}")
+            continue
+
+        # Per-metric inference time, only known when the metric runs on its own
+        seconds = None
+        try:
+            # Model and tokenizer are loaded once per metric
+            if metric in parallel:
+                ids, label_map = parallel[metric].result()
+                predicted_rows += len(indices)
+            elif multihead:
+                loaded_model = registry.get(models_dir, MULTIHEAD_NAME)
+                if multihead_ids is None:
+                    # One pass over the whole corpus serves every metric
+                    multihead_ids = predict_ids(loaded_model, corpus, np.arange(len(df)), batch_size, max_tokens)
+                    predicted_rows += len(df)
+                ids = multihead_ids[indices, loaded_model.metrics.index(metric)]
+                label_map = loaded_model.label_map[metric]
+            else:
+                loaded_model = registry.get(models_dir, metric)
+                predict_start = time.perf_counter()
+                ids = predict_ids(loaded_model, corpus, indices, batch_size, max_tokens)
+                seconds = time.perf_counter() - predict_start
+                predicted_rows += len(indices)
+                label_map = loaded_model.label_map
+        except Exception as e:
+            print(f"Error predicting {metric}: {e}")
+            continue
+
+        labels = np.array([label_map[i] for i in range(len(label_map))], dtype=object)
+        y_pred = labels[ids]
+        # Map full value to abbreviation
+        y_true = np.array([map_cvss_values_to_abbreviations(v) for v in actual_full[indices]], dtype=object)
+        correct = y_true == y_pred
+
+        detailed_results[metric] = [
+            {
+                'cve_id': cve_id,
+                'description': description,
+                'actual_full': actual,
+                'actual': true_value,
+                'predicted': predicted_value,
+                'correct': bool(is_correct)
+            }
+            for cve_id, description, actual, true_value, predicted_value, is_correct in zip(
+                cve_ids[indices], short_descriptions[indices], actual_full[indices], y_true, y_pred, correct
+            )
+        ]
+
+        # Calculate accuracy
+        accuracy = accuracy_score(y_true, y_pred)
+        results[metric] = {
+            'accuracy': accuracy,
+            'total_samples': len(y_true),
+            'y_true': y_true,
+            'y_pred': y_pred,
+            'indices': indices,
+            'seconds': seconds
+        }
         
-        y_true = []
-        y_pred = []
-        
-        # Process each row
-        for idx, row in df.iterrows():
-            description = row['description']
-            actual_value_full = row[column_name]
-            
-            # Skip if actual value is missing or NOT_DEFINED
-            if pd.isna(actual_value_full) or actual_value_full == 'NOT_DEFINED':
-                continue
-                
-            # Map full value to abbreviation
-            actual_value = map_cvss_values_to_abbreviations(actual_value_full)
-            
-            try:
-                # Get prediction
-                predicted_value = predict_metric(description, metric, models_dir)
-                
-                y_true.append(actual_value)
-                y_pred.append(predicted_value)
-                
-                detailed_results[metric].append({
-                    'cve_id': row.get('cve_id', f'row_{idx}'),
-                    'description': description[:100] + '...' if len(description) > 100 else description,
-                    'actual_full': actual_value_full,
-                    'actual': actual_value,
-                    'predicted': predicted_value,
-                    'correct': actual_value == predicted_value
-                })
-                
-            except Exception as e:
-                print(f"Error predicting {metric} for row {idx}: {e}")
-                continue
+        print(f"{metric} Accuracy: {accuracy:.4f} ({len(y_true)} samples)")
         
-        if y_true and y_pred:
-            # Calculate accuracy
-            accuracy = accuracy_score(y_true, y_pred)
-            results[metric] = {
-                'accuracy': accuracy,
-                'total_samples': len(y_true),
-                'y_true': y_true,
-                'y_pred': y_pred
-            }
-            
-            print(f"{metric} Accuracy: {accuracy:.4f} ({len(y_true)} samples)")
-            
-            # Print classification report
-            print(f"\nClassification Report for {metric}:")
-            print(classification_report(y_true, y_pred, zero_division=0))
-        else:
-            print(f"No valid samples found for metric {metric}")
+        # Print classification report
+        print(f"\nClassification Report for {metric}:")
+        print(classification_report(y_true, y_pred, zero_division=0))
+
+    if pool is not None:
+        pool.shutdown()
+
+    elapsed = time.perf_counter() - start_time
+    rows_per_sec = predicted_rows / elapsed if elapsed > 0 else 0.0
+    print(f"\nEvaluated {predicted_rows} rows in {elapsed:.1f}s ({rows_per_sec:.1f} rows/sec, batch size {batch_size}, "
+          f"token budget {max_tokens or 'off'})")
     
     return results, detailed_results
 
@@ -191,7 +220,7 @@ def plot_confusion_matrices(results, save_plots=True):
         y_pred = data['y_pred']
         
         # Get unique labels
-        labels = sorted(list(set(y_true + y_pred)))
+        labels = sorted(set(np.concatenate([y_true, y_pred]).tolist()))
         
         # Create confusion matrix
         cm = confusion_matrix(y_true, y_pred, labels=labels)
@@ -253,38 +282,98 @@ def print_summary(results):
     
     print("="*50)
 
+def print_comparison(results, multihead_results):
+    """Print per-metric accuracy of the per-metric models next to the multi-head model"""
+    print("\n" + "="*50)
+    print("PER-METRIC MODELS vs MULTI-HEAD MODEL")
+    print("="*50)
+    print(f"{'':>3}  {'separate':>8}  {'multihead':>9}  {'diff':>7}")
+
+    metrics = list(results) + [m for m in multihead_results if m not in results]
+    for metric in metrics:
+        separate = results.get(metric, {}).get('accuracy')
+        shared = multihead_results.get(metric, {}).get('accuracy')
+        separate_str = f"{separate:.4f}" if separate is not None else "-"
+        shared_str = f"{shared:.4f}" if shared is not None else "-"
+        diff_str = f"{shared - separate:+.4f}" if separate is not None and shared is not None else "-"
+        print(f"{metric:>3}  {separate_str:>8}  {shared_str:>9}  {diff_str:>7}")
+
+    print("="*50)
+
+def print_cascade_report(results, csv_file_path, models_dir="./cvss_models"):
+    """Print BERT, linear and cascade accuracy per metric with the share escalated to BERT"""
+    try:
+        tier = LinearTier.load(models_dir)
+    except OSError:
+        print(f"No linear models found in {models_dir}, train them with train_models.py or cascade.py train")
+        return
+    df = load_dataset(csv_file_path, columns=['description']).dropna(subset=['description'])
+    descriptions = df['description'].tolist()
+
+    print("\n" + "="*80)
+    print("CASCADE: LINEAR MODEL FIRST, BERT FOR LOW-CONFIDENCE DESCRIPTIONS")
+    print("="*80)
+    print(f"{'':>3}  {'bert':>7}  {'linear':>7}  {'cascade':>7}  {'escalated':>9}  {'bert ms':>8}  {'cascade ms':>10}")
+    for metric, data in results.items():
+        if metric not in tier:
+            continue
+        texts = [descriptions[i] for i in data['indices']]
+        start = time.perf_counter()
+        labels, confidences = tier.predict(metric, texts)
+        linear_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+        y_true = data['y_true']
+        linear_pred = labels.astype(object)
+        escalated = confidences < tier.thresholds.get(metric, NEVER)
+        cascade_pred = np.where(escalated, data['y_pred'], linear_pred)
+
+        bert_ms_str, cascade_ms_str = "-", "-"
+        if data['seconds'] is not None:
+            bert_ms = data['seconds'] * 1000 / len(texts)
+            # Every description runs the linear model, only escalated ones run BERT
+            bert_ms_str = f"{bert_ms:.2f}"
+            cascade_ms_str = f"{linear_ms + escalated.mean() * bert_ms:.2f}"
+        print(f"{metric:>3}  {data['accuracy']:>7.4f}  {accuracy_score(y_true, linear_pred):>7.4f}  "
+              f"{accuracy_score(y_true, cascade_pred):>7.4f}  {escalated.mean():>9.1%}  "
+              f"{bert_ms_str:>8}  {cascade_ms_str:>10}")
+
+    print("="*80)
+
 def analyze_value_distributions(csv_file_path):
     """Analyze the distribution of values in the CSV"""
-    df = pd.read_csv(csv_file_path)
-    
-    metric_columns = {
-        "AV": "attackVector",
-        "AC": "attackComplexity", 
-        "PR": "privilegesRequired",
-        "UI": "userInteraction",
-        "VC": "vulnConfidentialityImpact",
-        "VI": "vulnIntegrityImpact", 
-        "VA": "vulnAvailabilityImpact",
-        "SC": "subConfidentialityImpact",
-        "SI": "subIntegrityImpact",
-        "SA": "subAvailabilityImpact"
-    }
+    df = load_dataset(csv_file_path, columns=list(METRIC_COLUMNS.values()))
     
     print("\nValue distributions in CSV:")
     print("="*50)
     
-    for metric, column in metric_columns.items():
+    for metric, column in METRIC_COLUMNS.items():
         if column in df.columns:
             print(f"\n{metric} ({column}):")
             value_counts = df[column].value_counts()
+            value_counts = value_counts[value_counts > 0]
             for value, count in value_counts.items():
                 abbrev = map_cvss_values_to_abbreviations(value)
                 print(f"  {value} ({abbrev}): {count}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test CVSS model accuracy")
+    parser.add_argument("--models-dir", default="./cvss_models",
+                        help="e.g. ./cvss_models_int8 to test the quantized models")
+    parser.add_argument("--batch-size", type=int, default=EVAL_BATCH_SIZE,
+                        help="most descriptions per forward pass")
+    parser.add_argument("--max-batch-tokens", type=int, default=DEFAULT_MAX_BATCH_TOKENS,
+                        help="padded tokens per forward pass, batches grouped by length (0 = fixed-size batches)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="evaluate metrics in parallel on this many processes")
+    parser.add_argument("--multihead", action="store_true",
+                        help="also evaluate the multi-head model and compare it with the per-metric models")
+    parser.add_argument("--cascade", action="store_true",
+                        help="report accuracy, escalation rate and latency of the linear-then-BERT cascade")
+    args = parser.parse_args()
+
     # Test the model
     csv_file = "nvd_cvss4_data2.csv"
-    models_directory = "./cvss_models"
+    models_directory = args.models_dir
     
     print("Starting model accuracy testing...")
     
@@ -292,7 +381,8 @@ if __name__ == "__main__":
     analyze_value_distributions(csv_file)
     
     # Run accuracy test
-    results, detailed_results = test_model_accuracy(csv_file, models_directory)
+    results, detailed_results = test_model_accuracy(csv_file, models_directory, batch_size=args.batch_size,
+                                                    workers=args.workers, max_tokens=args.max_batch_tokens)
     
     # Print summary
     if results:
@@ -305,5 +395,14 @@ if __name__ == "__main__":
         plot_confusion_matrices(results)
     else:
         print("No results to summarize")
+
+    if args.multihead:
+        print("\nTesting multi-head model...")
+        multihead_results, _ = test_model_accuracy(csv_file, models_directory, multihead=True,
+                                                   batch_size=args.batch_size, max_tokens=args.max_batch_tokens)
+        print_comparison(results, multihead_results)
+
+    if args.cascade and results:
+        print_cascade_report(results, csv_file, models_directory)
     
     print("\nTesting completed!")
\ No newline at end of file
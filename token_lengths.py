@@ -0,0 +1,173 @@
+import argparse
+import time
+
+import numpy as np
+
+from batching import DEFAULT_MAX_BATCH_TOKENS
+from cascade import METRIC_COLUMNS, first_letters
+from cvss_dataset import load_dataset
+from truncation import STRATEGIES, Truncation
+
+DEFAULT_TOKENIZER = "bert-base-uncased"
+DEFAULT_CSVS = ["nvd_cvss4_data.csv", "nvd_cvss4_data2.csv"]
+# Candidate max_length values, special tokens included
+DEFAULT_LENGTHS = [64, 96, 128, 192, 256, 384, 512]
+PERCENTILES = (50, 90, 95, 99)
+# Width of the token length histogram buckets
+BUCKET_TOKENS = 32
+# Accuracy a shorter max_length may lose and still be recommended
+DEFAULT_TOLERANCE = 0.002
+
+
+def token_lengths(texts, tokenizer):
+    """Untruncated token count of every text, special tokens included"""
+    specials = tokenizer.num_special_tokens_to_add(pair=False)
+    encodings = tokenizer(texts, add_special_tokens=False, verbose=False)
+    return np.array([len(ids) + specials for ids in encodings["input_ids"]])
+
+
+def load_descriptions(csv_path):
+    df = load_dataset(csv_path, columns=["description"])
+    return df["description"].dropna().tolist()
+
+
+def report(csv_paths, tokenizer_name, lengths):
+    """Token length distribution per dataset and the share of descriptions each max_length cuts"""
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    per_dataset = {csv_path: token_lengths(load_descriptions(csv_path), tokenizer) for csv_path in csv_paths}
+
+    print("\n" + "=" * 84)
+    print(f"TOKEN LENGTHS ({tokenizer_name}, special tokens included)")
+    print("=" * 84)
+    print(f"{'dataset':<24}  {'texts':>6}  {'mean':>6}" + "".join(f"  {f'p{p}':>5}" for p in PERCENTILES)
+          + f"  {'max':>5}")
+    for csv_path, counts in per_dataset.items():
+        print(f"{csv_path:<24}  {len(counts):>6}  {counts.mean():>6.1f}"
+              + "".join(f"  {int(np.percentile(counts, p)):>5}" for p in PERCENTILES) + f"  {counts.max():>5}")
+
+    print(f"\n{'truncated at':<24}" + "".join(f"  {length:>6}" for length in lengths))
+    for csv_path, counts in per_dataset.items():
+        print(f"{csv_path:<24}" + "".join(f"  {(counts > length).mean():>6.1%}" for length in lengths))
+
+    counts = np.concatenate(list(per_dataset.values()))
+    edges = np.arange(0, max(lengths) + BUCKET_TOKENS, BUCKET_TOKENS)
+    histogram, _ = np.histogram(np.minimum(counts, edges[-1]), bins=np.append(edges, edges[-1] + 1))
+    print(f"\nAll datasets ({len(counts)} descriptions), tokens per description")
+    for start, count in zip(edges, histogram):
+        label = f"{start}-{start + BUCKET_TOKENS - 1}" if start < edges[-1] else f"{start}+"
+        print(f"{label:>9}  {count:>6}  {'#' * int(round(50 * count / max(histogram.max(), 1)))}")
+    print("=" * 84)
+
+
+def sweep(csv_path, models_dir, lengths, strategies, metrics, tolerance, limit, batch_size):
+    """Accuracy and latency of the per-metric models with descriptions cut to each max_length.
+
+    The models keep the length they were trained with, so a shorter cut is
+    measured on a model that never saw one; retraining at that length
+    (train_models.py --max-length) usually recovers part of the loss.
+    """
+    from model_registry import registry
+
+    df = load_dataset(csv_path, columns=["description"] + list(METRIC_COLUMNS.values()))
+    df = df.dropna(subset=["description"]).reset_index(drop=True)
+    if limit:
+        df = df.head(limit)
+    descriptions = df["description"].tolist()
+
+    models = {}
+    for metric in metrics:
+        column = METRIC_COLUMNS[metric]
+        if column not in df.columns:
+            continue
+        try:
+            loaded = registry.get(models_dir, metric)
+        except Exception as e:
+            print(f"[WARN] {metric}: no model ({e})")
+            continue
+        truth = first_letters(df[column].astype(object))
+        rows = np.flatnonzero([label is not None for label in truth])
+        loaded.warm_up()
+        models[metric] = (loaded, rows, truth[rows])
+    if not models:
+        print(f"[ERROR] No models found in {models_dir}")
+        return
+
+    tokenizer = next(iter(models.values()))[0].tokenizer
+    trained = next(iter(models.values()))[0].truncation
+    settings = {trained.tag: trained}
+    for strategy in strategies:
+        for length in sorted(lengths):
+            # Lengths above the tokenizer's limit are capped to it
+            truncation = Truncation.for_tokenizer(tokenizer, length, strategy)
+            settings.setdefault(truncation.tag, truncation)
+    full_lengths = token_lengths(descriptions, tokenizer)
+
+    print("\n" + "=" * 100)
+    print(f"MAX_LENGTH SWEEP on {csv_path} ({len(descriptions)} descriptions, {len(models)} models, "
+          f"trained with {trained})")
+    print("=" * 100)
+    print(f"{'truncation':<30}  {'cut':>6}  {'tokens':>6}  {'accuracy':>8}  {'diff':>7}  {'ms/desc':>8}  "
+          f"{'speedup':>7}")
+    results = []
+    for truncation in settings.values():
+        start = time.perf_counter()
+        encodings = truncation(tokenizer, descriptions)
+        features = [dict(zip(encodings.keys(), values)) for values in zip(*encodings.values())]
+        correct = samples = 0
+        for loaded, rows, truth in models.values():
+            ids = loaded.predict_features([features[i] for i in rows], DEFAULT_MAX_BATCH_TOKENS, batch_size)
+            predicted = np.array([loaded.label_map[int(i)] for i in ids], dtype=object)
+            correct += int((predicted == truth).sum())
+            samples += len(rows)
+        ms = (time.perf_counter() - start) * 1000 / len(descriptions)
+        accuracy = correct / samples
+        results.append((truncation, accuracy, ms))
+
+        reference_accuracy, reference_ms = results[0][1], results[0][2]
+        mean_tokens = np.mean([len(ids) for ids in encodings["input_ids"]])
+        print(f"{repr(truncation):<30}  {(full_lengths > truncation.max_length).mean():>6.1%}  {mean_tokens:>6.1f}  "
+              f"{accuracy:>8.4f}  {accuracy - reference_accuracy:>+7.4f}  {ms:>8.2f}  {reference_ms / ms:>6.2f}x")
+    print("=" * 100)
+
+    reference_accuracy = results[0][1]
+    candidates = [r for r in results if r[1] >= reference_accuracy - tolerance]
+    truncation, accuracy, ms = min(candidates, key=lambda r: (r[0].max_length, r[2]))
+    print(f"[INFO] Shortest within {tolerance:.4f} of {trained}: {truncation} "
+          f"({accuracy:.4f}, {results[0][2] / ms:.2f}x faster)")
+    if truncation is not trained:
+        print(f"[INFO] Retrain with: python train_models.py --max-length {truncation.max_length} "
+              f"--truncation {truncation.strategy} --overwrite")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token lengths of CVE descriptions and the max_length trade-off")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    lengths = subparsers.add_parser("report", help="token length distribution of the datasets")
+    lengths.add_argument("--csv", nargs="+", default=DEFAULT_CSVS)
+    lengths.add_argument("--tokenizer", default=DEFAULT_TOKENIZER, help="tokenizer name or a model directory")
+    lengths.add_argument("--lengths", type=int, nargs="+", default=DEFAULT_LENGTHS)
+
+    accuracy = subparsers.add_parser("sweep", help="accuracy and latency per max_length and truncation strategy")
+    accuracy.add_argument("--csv", default="nvd_cvss4_data2.csv")
+    accuracy.add_argument("--models-dir", default="./cvss_models")
+    accuracy.add_argument("--lengths", type=int, nargs="+", default=DEFAULT_LENGTHS)
+    accuracy.add_argument("--strategies", choices=STRATEGIES, nargs="+", default=list(STRATEGIES))
+    accuracy.add_argument("--metrics", choices=list(METRIC_COLUMNS), nargs="+", default=list(METRIC_COLUMNS))
+    accuracy.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                          help="accuracy a shorter max_length may lose and still be recommended")
+    accuracy.add_argument("--limit", type=int, help="only the first N descriptions")
+    accuracy.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    if args.command == "report":
+        report(args.csv, args.tokenizer, args.lengths)
+    else:
+        sweep(args.csv, args.models_dir, args.lengths, args.strategies, args.metrics, args.tolerance, args.limit,
+              args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,31 @@
-import pandas as pd
 import os
-from datasets import Dataset
+import shutil
+import time
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from transformers import (
     AutoTokenizer,
     AutoModelForSequenceClassification,
     TrainingArguments,
     Trainer
 )
+from transformers.trainer_utils import PREFIX_CHECKPOINT_DIR, get_last_checkpoint
 import torch
+import argparse
+from multihead import MULTIHEAD_NAME, train_multihead
+from batching import usable_cores
+from cascade import THRESHOLD_CSV, select_thresholds, train_cascade
+from cvss_dataset import load_dataset, training_corpus
+from model_registry import write_training_run
+from truncation import STRATEGIES, Truncation
+from training_data import (
+    LENGTH_COLUMN, PADDING_MODES, SPLIT_SEED, TOKEN_CACHE_DIR, PaddingStats,
+    load_training_report, make_collator, print_training_report, record_training_stats, tokenize_corpus,
+)
 
-# data path
-CSV_PATH = "nvd_cvss4_data.csv"
+# data path: get_data.py's nvd_cvss4_data.parquet or nvd_cvss4_data.csv, whichever is newer
+CSV_PATH = training_corpus()
 TEXT_COLUMN = "description"
 
 CVSS_METRICS = ["AV", "AC", "AT", "PR", "UI", "VC", "VI", "VA", "SC", "SI", "SA"]
@@ -48,8 +63,12 @@ MODEL_NAME = "bert-base-uncased"
 EPOCHS = 4
 BATCH_SIZE = 16
 OUTPUT_DIR = "./cvss_models"
-
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# Tokens and epoch times of every training run, per model and padding mode
+REPORT_PATH = f"{OUTPUT_DIR}/training_report.json"
+# Written last when a metric model is saved; a model directory without it is unfinished
+LABEL_MAP_FILE = "label_map.txt"
+# Width of the bars in the training timeline
+TIMELINE_WIDTH = 40
 
 # Mapping labels to ID
 def create_label_map(labels):
@@ -58,51 +77,50 @@ def create_label_map(labels):
 def first_letter(string: str):
     return string[0]
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+def is_trained(metric):
+    return os.path.exists(os.path.join(OUTPUT_DIR, metric, LABEL_MAP_FILE))
 
-df = pd.read_csv(CSV_PATH)
+def prepare_checkpoints(save_path, resume=True):
+    """Checkpoint to resume training from, or None after clearing stale ones.
 
-overwrite = "n"
+    An unfinished model resumes from its last epoch checkpoint. A finished
+    model being retrained starts over, so its label map is removed until
+    the new model is saved.
+    """
+    if not os.path.isdir(save_path):
+        return None
+    label_map_path = os.path.join(save_path, LABEL_MAP_FILE)
+    if resume and not os.path.exists(label_map_path):
+        return get_last_checkpoint(save_path)
+    for name in os.listdir(save_path):
+        if name.startswith(PREFIX_CHECKPOINT_DIR):
+            shutil.rmtree(os.path.join(save_path, name))
+    if os.path.exists(label_map_path):
+        os.remove(label_map_path)
+    return None
 
-for metric in CVSS_METRICS:
-    save_path = f"{OUTPUT_DIR}/{metric}"
-    if os.path.exists(save_path):
-        s = input("Some models exist. Do you want to overwrite ALL OF them? [y]es/[N]o/[c]hoose: ")
-        if len(s) < 1:
-            break
-        if s.lower()[0] == "y":
-            overwrite = "y"
-        if s.lower()[0] == "c":
-            overwrite = "c"
-        break
-
-# Training for each metric
-for metric in CVSS_METRICS:
-    save_path = f"{OUTPUT_DIR}/{metric}"
-    if os.path.exists(save_path):
-        if overwrite == "n":
-            continue
-        if overwrite == "c":
-            s = input(f"\nOverwrite {metric} model? [y/N]: ")
-            if len(s) < 1 or s.lower()[0] != "y":
-                continue
+def train_metric(metric, df, encoded, tokenizer, padding="dynamic", group_by_length=False, resume=True,
+                 truncation=None):
+    """Fine-tune and save a separate model for one metric, return its PaddingStats.
 
-    print(f"\nTraining model for {metric} metric")
+    encoded is the tokenized description column (tokenize_corpus), row-aligned
+    with df and shared by every metric. With resume, an interrupted run
+    continues from its last epoch checkpoint. truncation, the one encoded was
+    cut with, is saved with the model.
+    """
+    save_path = f"{OUTPUT_DIR}/{metric}"
+    checkpoint = prepare_checkpoints(save_path, resume)
+    print(f"\nTraining model for {metric} metric" + (f", resuming from {checkpoint}" if checkpoint else ""))
 
     metric_col = METRIC_TO_COLUMN[metric]
     label_set = METRIC_LABELS[metric]
     label_map = create_label_map(label_set)
-    df_metric = df[[TEXT_COLUMN, metric_col]].dropna()
-    df_metric["label"] = df_metric[metric_col].map(first_letter).map(label_map)
-
-    # Convert to Hugging Face Dataset
-    dataset = Dataset.from_pandas(df_metric[[TEXT_COLUMN, "label"]])
-    dataset = dataset.train_test_split(test_size=0.2)
+    labels = df[metric_col].astype(object)
+    labels = labels.map(lambda v: label_map.get(first_letter(v)) if isinstance(v, str) else None)
+    rows = np.flatnonzero(labels.notna().to_numpy())
 
-    def tokenize(batch):
-        return tokenizer(batch[TEXT_COLUMN], truncation=True, padding="max_length")
-    
-    tokenized = dataset.map(tokenize, batched=True)
+    dataset = encoded.select(rows).add_column("label", labels.iloc[rows].astype(int).tolist())
+    tokenized = dataset.train_test_split(test_size=0.2, seed=SPLIT_SEED)
 
     # Model klasyfikacji
     model = AutoModelForSequenceClassification.from_pretrained(
@@ -123,29 +141,249 @@ for metric in CVSS_METRICS:
         logging_dir=f"{OUTPUT_DIR}/{metric}/logs",
         logging_steps=10,
         save_total_limit=1,
-        load_best_model_at_end=True
+        load_best_model_at_end=True,
+        group_by_length=group_by_length,
+        length_column_name=LENGTH_COLUMN
     )
 
-    # Trainer
+    # Trainer, padding kazdego batcha przez collator
+    stats = PaddingStats()
     trainer = Trainer(
         model=model,
         args=args,
         train_dataset=tokenized["train"],
         eval_dataset=tokenized["test"],
-        tokenizer=tokenizer
+        tokenizer=tokenizer,
+        data_collator=make_collator(tokenizer, padding, stats),
+        callbacks=[stats]
     )
 
     # Trening
-    trainer.train()
+    trainer.train(resume_from_checkpoint=checkpoint)
 
     # Zapis modelu i tokenizera
-    save_path = f"{OUTPUT_DIR}/{metric}"
     model.save_pretrained(save_path)
     tokenizer.save_pretrained(save_path)
+    (truncation or Truncation.for_tokenizer(tokenizer)).save(save_path)
+    write_training_run(save_path)
 
     # Zapis label_map do pliku
-    with open(os.path.join(save_path, "label_map.txt"), "w") as f:
+    with open(os.path.join(save_path, LABEL_MAP_FILE), "w") as f:
         for k, v in label_map.items():
             f.write(f"{k}:{v}\n")
+    return stats
+
+def load_corpus():
+    df = load_dataset(CSV_PATH, columns=[TEXT_COLUMN] + list(METRIC_TO_COLUMN.values()))
+    return df.dropna(subset=[TEXT_COLUMN]).reset_index(drop=True)
+
+def core_slices(workers):
+    """Split the cores this process may use into one contiguous slice per worker"""
+    cores = usable_cores()
+    return [slice_.tolist() for slice_ in np.array_split(cores, min(workers, len(cores)))]
+
+def pin_to_cores(cores):
+    """Run this process on the given cores with one torch thread per core"""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    torch.set_num_interop_threads(1)
+
+def run_metric(metric, df, encoded, tokenizer, options, cores):
+    """Train one metric and describe the run for the timeline; failures are reported, not raised"""
+    run = {"metric": metric, "pid": os.getpid(), "cores": cores, "start": time.time(), "stats": None, "error": None}
+    try:
+        run["stats"] = train_metric(metric, df, encoded, tokenizer, **options)
+    except Exception as e:
+        run["error"] = f"{type(e).__name__}: {e}"
+    run["end"] = time.time()
+    return run
+
+# Training inputs and cores of the current worker process, set by _init_worker
+_worker_inputs = None
+_worker_cores = None
+
+def load_tokenizer(truncation):
+    """Base tokenizer whose model_max_length, saved with every model, is the truncation length"""
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    tokenizer.model_max_length = truncation.max_length
+    return tokenizer
+
+def _init_worker(slices, token_cache_dir, truncation):
+    """Pool initializer: claim a slice of cores and load the corpus (tokens come from the cache)"""
+    global _worker_inputs, _worker_cores
+    _worker_cores = slices.get()
+    pin_to_cores(_worker_cores)
+    tokenizer = load_tokenizer(truncation)
+    df = load_corpus()
+    encoded = tokenize_corpus(df[TEXT_COLUMN].tolist(), tokenizer, token_cache_dir, truncation)
+    _worker_inputs = (df, encoded, tokenizer)
+
+def _train_metric_worker(metric, options):
+    df, encoded, tokenizer = _worker_inputs
+    return run_metric(metric, df, encoded, tokenizer, options, _worker_cores)
+
+def train_parallel(metrics, options, workers, token_cache_dir):
+    """Train metrics on `workers` processes, each pinned to its own slice of cores.
+
+    Yields the run of every metric as it finishes.
+    """
+    slices = core_slices(workers)
+    print(f"[INFO] Training {len(metrics)} metrics on {len(slices)} workers: "
+          + ", ".join(f"cores {s[0]}-{s[-1]}" if len(s) > 1 else f"core {s[0]}" for s in slices))
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    for cores in slices:
+        queue.put(cores)
+    with ProcessPoolExecutor(
+        max_workers=len(slices),
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(queue, token_cache_dir, options["truncation"]),
+    ) as pool:
+        futures = [pool.submit(_train_metric_worker, metric, options) for metric in metrics]
+        for future in as_completed(futures):
+            yield future.result()
+
+def print_timeline(runs, start):
+    """Wall-clock start and end of every metric, with bars on a shared time axis"""
+    if not runs:
+        return
+    span = max(max(run["end"] for run in runs) - start, 1e-9)
+    print("\n" + "=" * 84)
+    print(f"TRAINING TIMELINE ({span / 60:.1f} min wall clock)")
+    print("=" * 84)
+    print(f"{'model':>5}  {'cores':>7}  {'start':>8}  {'end':>8}  {'duration':>8}  {'status':<6}  timeline")
+    for run in sorted(runs, key=lambda r: r["start"]):
+        first = int((run["start"] - start) / span * TIMELINE_WIDTH)
+        last = max(first + 1, int(round((run["end"] - start) / span * TIMELINE_WIDTH)))
+        bar = " " * first + "#" * (last - first)
+        cores = run["cores"]
+        cores_str = "-" if not cores else f"{cores[0]}-{cores[-1]}" if len(cores) > 1 else str(cores[0])
+        started, ended = (time.strftime("%H:%M:%S", time.localtime(run[key])) for key in ("start", "end"))
+        duration = time.strftime("%H:%M:%S", time.gmtime(run["end"] - run["start"]))
+        print(f"{run['metric']:>5}  {cores_str:>7}  {started:>8}  {ended:>8}  {duration:>8}  "
+              f"{'failed' if run['error'] else 'ok':<6}  |{bar:<{TIMELINE_WIDTH}}|")
+    print("=" * 84)
+
+def train_multitask(df, encoded, tokenizer, padding="dynamic", group_by_length=False, truncation=None):
+    """Fine-tune one shared encoder with a classification head per metric"""
+    save_path = f"{OUTPUT_DIR}/{MULTIHEAD_NAME}"
+    print(f"\nTraining multi-head model for {', '.join(CVSS_METRICS)}")
+    stats = PaddingStats()
+    train_multihead(
+        df,
+        encoded,
+        tokenizer,
+        {metric: METRIC_LABELS[metric] for metric in CVSS_METRICS},
+        METRIC_TO_COLUMN,
+        save_path,
+        MODEL_NAME,
+        epochs=EPOCHS,
+        batch_size=BATCH_SIZE,
+        data_collator=make_collator(tokenizer, padding, stats),
+        callbacks=[stats],
+        group_by_length=group_by_length,
+    )
+    (truncation or Truncation.for_tokenizer(tokenizer)).save(save_path)
+    write_training_run(save_path)
+    record_training_stats(REPORT_PATH, MULTIHEAD_NAME, padding, group_by_length, tokenizer.model_max_length, stats)
+
+def main():
+    parser = argparse.ArgumentParser(description="Train CVSS metric classifiers")
+    parser.add_argument("--multitask", action="store_true",
+                        help="train one shared encoder with a head per metric instead of one model per metric")
+    parser.add_argument("--metrics", nargs="+", choices=CVSS_METRICS, default=CVSS_METRICS,
+                        help="metrics to train (default: all)")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="retrain metrics that already have a finished model (default: skip them)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="start unfinished metrics over instead of resuming from their last epoch checkpoint")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="metrics trained at once, each process pinned to its own slice of cores")
+    parser.add_argument("--padding", choices=PADDING_MODES, default="dynamic",
+                        help="pad each batch to its longest text, or every text to max_length (previous behaviour)")
+    parser.add_argument("--group-by-length", action="store_true",
+                        help="batch texts of similar length together to cut padding further")
+    parser.add_argument("--max-length", type=int,
+                        help="tokens per description, special tokens included (default: the tokenizer's, 512); "
+                             "pick one with token_lengths.py")
+    parser.add_argument("--truncation", choices=STRATEGIES, default="head",
+                        help="keep the first tokens of long descriptions, or the first quarter and the end")
+    parser.add_argument("--token-cache-dir", default=TOKEN_CACHE_DIR, help="where tokenized corpora are cached")
+    parser.add_argument("--skip-linear", action="store_true",
+                        help="do not train the TF-IDF linear models of the cascade")
+    parser.add_argument("--linear-only", action="store_true",
+                        help="train only the linear models of the cascade and choose their thresholds")
+    args = parser.parse_args()
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    df = load_corpus()
+
+    def train_linear_tier():
+        # Cheap first tier of the cascade, answers confident cases without BERT. Trained
+        # after BERT, so the thresholds record the training runs they sit in front of
+        if not args.skip_linear:
+            train_cascade(df, OUTPUT_DIR, args.metrics, TEXT_COLUMN)
+            select_thresholds(OUTPUT_DIR, THRESHOLD_CSV)
+
+    if args.linear_only:
+        train_linear_tier()
+        return
+
+    truncation = Truncation.for_tokenizer(AutoTokenizer.from_pretrained(MODEL_NAME), args.max_length, args.truncation)
+    tokenizer = load_tokenizer(truncation)
+    print(f"[INFO] Truncation: {truncation}")
+    # Descriptions are tokenized once (or read from the cache) and shared by all metrics
+    encoded = tokenize_corpus(df[TEXT_COLUMN].tolist(), tokenizer, args.token_cache_dir, truncation)
+    options = {"padding": args.padding, "group_by_length": args.group_by_length, "truncation": truncation}
+
+    if args.multitask:
+        train_multitask(df, encoded, tokenizer, **options)
+        train_linear_tier()
+        print_training_report(load_training_report(REPORT_PATH))
+        print("\nTraining complete. Multi-head model saved in directory:", f"{OUTPUT_DIR}/{MULTIHEAD_NAME}")
+        return
+
+    metrics = []
+    for metric in CVSS_METRICS:
+        if metric not in args.metrics:
+            continue
+        if is_trained(metric) and not args.overwrite:
+            print(f"[INFO] {metric}: already trained, skipping (--overwrite retrains it)")
+            continue
+        metrics.append(metric)
+    if not metrics:
+        print("[INFO] No transformer model to train")
+        train_linear_tier()
+        return
+
+    options["resume"] = not args.no_resume
+    start = time.time()
+    if args.workers > 1 and len(metrics) > 1:
+        runs_iter = train_parallel(metrics, options, min(args.workers, len(metrics)), args.token_cache_dir)
+    else:
+        runs_iter = (run_metric(metric, df, encoded, tokenizer, options, None) for metric in metrics)
+
+    runs = []
+    for run in runs_iter:
+        runs.append(run)
+        if run["error"]:
+            print(f"[WARN] {run['metric']}: training failed, {run['error']}")
+            continue
+        # Only this process writes the report, workers hand their stats back
+        record_training_stats(REPORT_PATH, run["metric"], args.padding, args.group_by_length,
+                              tokenizer.model_max_length, run["stats"])
+        print(f"[INFO] {run['metric']}: trained in {(run['end'] - run['start']) / 60:.1f} min")
+
+    train_linear_tier()
+    print_training_report(load_training_report(REPORT_PATH))
+    print_timeline(runs, start)
+    failed = [run["metric"] for run in runs if run["error"]]
+    if failed:
+        print(f"\n[WARN] Failed: {', '.join(failed)}; run again to resume them")
+    print("\nTraining complete. Models saved in directory:", OUTPUT_DIR)
 
-print("\nTraining complete. Models saved in directory:", OUTPUT_DIR)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from datasets import Dataset, load_from_disk
+from transformers import DataCollatorWithPadding, TrainerCallback
+
+from truncation import Truncation
+
+# Tokenized corpora, one subdirectory per (tokenizer, corpus) pair
+TOKEN_CACHE_DIR = os.environ.get("CVSS_TOKEN_CACHE", "./.token_cache")
+PADDING_MODES = ("dynamic", "max_length")
+# Fixed train/eval split shared by the per-metric and multi-head models, so a
+# resumed run continues on the same data and the two are compared on it
+SPLIT_SEED = 42
+LENGTH_COLUMN = "length"
+
+
+def tokenizer_key(tokenizer):
+    """Identify tokenizers with the same vocabulary and settings"""
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        return (type(tokenizer).__name__, backend.to_str(), tokenizer.model_max_length)
+    return (type(tokenizer).__name__, tokenizer.name_or_path, tokenizer.model_max_length)
+
+
+def tokenizer_hash(tokenizer):
+    return hashlib.sha256(repr(tokenizer_key(tokenizer)).encode("utf-8")).hexdigest()[:16]
+
+
+def corpus_hash(texts):
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+def tokenize_corpus(texts, tokenizer, cache_dir=TOKEN_CACHE_DIR, truncation=None):
+    """Tokenize texts once (truncated, unpadded) and cache the result on disk.
+
+    The cache is keyed by tokenizer, corpus hash and truncation, so every
+    metric trained on the same descriptions reuses one tokenization. Rows
+    keep the order of texts and carry their token count in the "length" column.
+    """
+    truncation = truncation or Truncation.for_tokenizer(tokenizer)
+    path = os.path.join(cache_dir, f"{tokenizer_hash(tokenizer)}-{corpus_hash(texts)}-{truncation.tag}")
+    if os.path.isdir(path):
+        print(f"[INFO] Using tokenized corpus from {path}")
+        return load_from_disk(path)
+
+    def tokenize(batch):
+        encoded = truncation(tokenizer, batch["text"])
+        encoded[LENGTH_COLUMN] = [len(ids) for ids in encoded["input_ids"]]
+        return encoded
+
+    start = time.perf_counter()
+    dataset = Dataset.from_dict({"text": list(texts)})
+    dataset = dataset.map(tokenize, batched=True, remove_columns=["text"])
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    dataset.save_to_disk(tmp_path)
+    os.replace(tmp_path, path)
+    print(f"[INFO] Tokenized {len(dataset)} descriptions in {time.perf_counter() - start:.1f}s -> {path}")
+    return load_from_disk(path)
+
+
+class PaddingStats(TrainerCallback):
+    """Tokens fed to the model and wall time of the training part of every epoch.
+
+    Wrap the data collator with wrap() and pass the object as a Trainer
+    callback; evaluation batches are not counted.
+    """
+
+    def __init__(self):
+        self.epochs = []
+        self._current = None
+
+    def wrap(self, collator):
+        def collate(features):
+            batch = collator(features)
+            if self._current is not None:
+                self._current["samples"] += len(features)
+                self._current["padded_tokens"] += int(batch["input_ids"].numel())
+                self._current["real_tokens"] += int(batch["attention_mask"].sum())
+            return batch
+        return collate
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self._current = {"samples": 0, "padded_tokens": 0, "real_tokens": 0, "start": time.perf_counter()}
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        current, self._current = self._current, None
+        current["seconds"] = time.perf_counter() - current.pop("start")
+        self.epochs.append(current)
+
+    def summary(self):
+        n = max(len(self.epochs), 1)
+        padded = sum(e["padded_tokens"] for e in self.epochs) / n
+        real = sum(e["real_tokens"] for e in self.epochs) / n
+        return {
+            "train_samples": max((e["samples"] for e in self.epochs), default=0),
+            "epoch_seconds": sum(e["seconds"] for e in self.epochs) / n,
+            "padded_tokens_per_epoch": int(padded),
+            "real_tokens_per_epoch": int(real),
+            "padding_ratio": round(1 - real / padded, 4) if padded else 0.0,
+        }
+
+
+def make_collator(tokenizer, padding="dynamic", stats=None):
+    """Per-batch padding, or padding to model_max_length as the original pipeline did"""
+    if padding == "max_length":
+        collator = DataCollatorWithPadding(tokenizer, padding="max_length", max_length=tokenizer.model_max_length)
+    else:
+        collator = DataCollatorWithPadding(tokenizer)
+    return stats.wrap(collator) if stats is not None else collator
+
+
+def load_training_report(report_path):
+    if not os.path.exists(report_path):
+        return {}
+    with open(report_path, "r") as f:
+        return json.load(f)
+
+
+def record_training_stats(report_path, name, padding, group_by_length, max_length, stats):
+    """Add one model's epoch stats to the JSON report, keyed by model and padding mode"""
+    report = load_training_report(report_path)
+    mode = f"{padding}{'+grouped' if group_by_length else ''}"
+    summary = stats.summary()
+    # What padding every sample to max_length processes per epoch
+    summary["max_length_tokens_per_epoch"] = summary["train_samples"] * max_length
+    report.setdefault(name, {})[mode] = summary
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def print_training_report(report):
+    print("\n" + "=" * 84)
+    print("TRAINING TOKENS AND EPOCH TIME")
+    print("=" * 84)
+    print(f"{'model':>9}  {'mode':<20}  {'epoch s':>8}  {'tokens/epoch':>13}  {'real':>11}  "
+          f"{'vs max_length':>13}")
+    for name, modes in report.items():
+        for mode, row in modes.items():
+            saved = 1 - row["padded_tokens_per_epoch"] / max(row["max_length_tokens_per_epoch"], 1)
+            print(f"{name:>9}  {mode:<20}  {row['epoch_seconds']:>8.1f}  {row['padded_tokens_per_epoch']:>13,}  "
+                  f"{row['real_tokens_per_epoch']:>11,}  {-saved:>+12.1%}")
+    print("=" * 84)
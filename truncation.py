@@ -0,0 +1,83 @@
+import json
+import os
+
+# Saved in every model directory, so inference cuts descriptions the way training did
+TRUNCATION_FILE = "truncation.json"
+# head keeps the first max_length tokens, head_tail the first and the last ones
+STRATEGIES = ("head", "head_tail")
+# Share of the token budget head_tail keeps from the start of a description
+HEAD_FRACTION = 0.25
+
+
+class Truncation:
+    """How descriptions are cut to max_length tokens (special tokens included).
+
+    Models saved without a truncation.json were trained with the tokenizer
+    default: the first model_max_length tokens.
+    """
+
+    def __init__(self, max_length, strategy="head", head_tokens=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown truncation strategy {strategy!r}, expected one of {STRATEGIES}")
+        self.max_length = int(max_length)
+        self.strategy = strategy
+        self.head_tokens = head_tokens
+
+    def __repr__(self):
+        if self.strategy == "head":
+            return f"head {self.max_length}"
+        return f"head_tail {self.max_length} ({self.head_tokens} head tokens)"
+
+    @property
+    def tag(self):
+        """Short name used in cache paths and reports"""
+        if self.strategy == "head":
+            return f"head{self.max_length}"
+        return f"ht{self.max_length}h{self.head_tokens}"
+
+    @classmethod
+    def for_tokenizer(cls, tokenizer, max_length=None, strategy="head"):
+        """Truncation to max_length (default: the tokenizer's) with the head share of HEAD_FRACTION"""
+        max_length = min(max_length or tokenizer.model_max_length, tokenizer.model_max_length)
+        head_tokens = None
+        if strategy == "head_tail":
+            budget = max_length - tokenizer.num_special_tokens_to_add(pair=False)
+            head_tokens = int(round(budget * HEAD_FRACTION))
+        return cls(max_length, strategy, head_tokens)
+
+    @classmethod
+    def load(cls, model_path, tokenizer):
+        path = os.path.join(model_path, TRUNCATION_FILE)
+        if not os.path.exists(path):
+            return cls.for_tokenizer(tokenizer)
+        with open(path, "r") as f:
+            return cls(**json.load(f))
+
+    def save(self, model_path):
+        with open(os.path.join(model_path, TRUNCATION_FILE), "w") as f:
+            json.dump({"max_length": self.max_length, "strategy": self.strategy, "head_tokens": self.head_tokens},
+                      f, indent=2)
+
+    def __call__(self, tokenizer, texts):
+        """Unpadded encodings of texts (dict of lists, like tokenizer(texts)), cut to max_length"""
+        if self.strategy == "head":
+            # At the tokenizer's own limit (which may be a "no limit" sentinel) it truncates by itself
+            max_length = self.max_length if self.max_length < tokenizer.model_max_length else None
+            return tokenizer(texts, truncation=True, max_length=max_length)
+
+        budget = self.max_length - tokenizer.num_special_tokens_to_add(pair=False)
+        tail_tokens = budget - self.head_tokens
+        with_token_types = "token_type_ids" in tokenizer.model_input_names
+        encodings = {"input_ids": [], "token_type_ids": [], "attention_mask": []}
+        # Untruncated ids are cut here, the length warning would fire for every long text
+        for ids in tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]:
+            if len(ids) > budget:
+                ids = ids[:self.head_tokens] + (ids[-tail_tokens:] if tail_tokens > 0 else [])
+            input_ids = tokenizer.build_inputs_with_special_tokens(ids)
+            encodings["input_ids"].append(input_ids)
+            encodings["attention_mask"].append([1] * len(input_ids))
+            if with_token_types:
+                encodings["token_type_ids"].append(tokenizer.create_token_type_ids_from_sequences(ids))
+        if not with_token_types:
+            del encodings["token_type_ids"]
+        return encodings